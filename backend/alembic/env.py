@@ -6,6 +6,7 @@ from alembic import context
 
 from database import Base
 import models  # noqa: F401
+from search import SEARCH_SCHEMA_OBJECTS
 
 config = context.config
 
@@ -19,11 +20,19 @@ if config.config_file_name is not None:
 target_metadata = Base.metadata
 
 
+def include_object(object, name, type_, reflected, compare_to):
+    # Не пропонувати видалення пошукових колонок/індексів, яких немає в моделях
+    if reflected and compare_to is None and name in SEARCH_SCHEMA_OBJECTS:
+        return False
+    return True
+
+
 def run_migrations_offline() -> None:
     url = config.get_main_option("sqlalchemy.url")
     context.configure(
         url=url,
         target_metadata=target_metadata,
+        include_object=include_object,
         literal_binds=True,
         compare_type=True,
         dialect_opts={"paramstyle": "named"},
@@ -44,6 +53,7 @@ def run_migrations_online() -> None:
         context.configure(
             connection=connection,
             target_metadata=target_metadata,
+            include_object=include_object,
             compare_type=True,
         )
 
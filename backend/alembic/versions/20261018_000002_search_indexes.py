@@ -0,0 +1,78 @@
+"""full-text and trigram search indexes
+
+Revision ID: 20261018_000002
+Revises: 20260901_000001
+Create Date: 2026-10-18 00:00:02
+"""
+
+from alembic import op
+
+
+revision = "20261018_000002"
+down_revision = "20260901_000001"
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    # tsvector та pg_trgm є лише в Postgres; на SQLite пошук працює через LIKE
+    if op.get_bind().dialect.name != "postgresql":
+        return
+
+    op.execute("CREATE EXTENSION IF NOT EXISTS pg_trgm")
+
+    op.execute(
+        """
+        ALTER TABLE items ADD COLUMN search_vector tsvector GENERATED ALWAYS AS (
+            setweight(to_tsvector('simple', coalesce(name, '')), 'A') ||
+            setweight(to_tsvector('simple', coalesce(category, '')), 'B') ||
+            setweight(to_tsvector('simple', coalesce(description, '')), 'C')
+        ) STORED
+        """
+    )
+    op.execute(
+        """
+        ALTER TABLE boxes ADD COLUMN search_vector tsvector GENERATED ALWAYS AS (
+            setweight(to_tsvector('simple', coalesce(name, '')), 'A') ||
+            setweight(to_tsvector('simple', coalesce(location, '')), 'B') ||
+            setweight(to_tsvector('simple', coalesce(description, '')), 'C')
+        ) STORED
+        """
+    )
+
+    op.create_index("ix_items_search_vector", "items", ["search_vector"], postgresql_using="gin")
+    op.create_index("ix_boxes_search_vector", "boxes", ["search_vector"], postgresql_using="gin")
+
+    for table, column in (
+        ("items", "name"),
+        ("items", "description"),
+        ("items", "category"),
+        ("boxes", "name"),
+        ("boxes", "location"),
+    ):
+        op.create_index(
+            f"ix_{table}_{column}_trgm",
+            table,
+            [column],
+            postgresql_using="gin",
+            postgresql_ops={column: "gin_trgm_ops"},
+        )
+
+
+def downgrade() -> None:
+    if op.get_bind().dialect.name != "postgresql":
+        return
+
+    for table, column in (
+        ("boxes", "location"),
+        ("boxes", "name"),
+        ("items", "category"),
+        ("items", "description"),
+        ("items", "name"),
+    ):
+        op.drop_index(f"ix_{table}_{column}_trgm", table_name=table)
+
+    op.drop_index("ix_boxes_search_vector", table_name="boxes")
+    op.drop_index("ix_items_search_vector", table_name="items")
+    op.execute("ALTER TABLE boxes DROP COLUMN search_vector")
+    op.execute("ALTER TABLE items DROP COLUMN search_vector")
@@ -0,0 +1,22 @@
+"""box_shares (user_id, box_id) index
+
+Revision ID: 20261018_000003
+Revises: 20261018_000002
+Create Date: 2026-10-18 00:00:03
+"""
+
+from alembic import op
+
+
+revision = "20261018_000003"
+down_revision = "20261018_000002"
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.create_index("ix_box_shares_user_id_box_id", "box_shares", ["user_id", "box_id"])
+
+
+def downgrade() -> None:
+    op.drop_index("ix_box_shares_user_id_box_id", table_name="box_shares")
@@ -0,0 +1,23 @@
+"""boxes.content_version for collection ETags
+
+Revision ID: 20261018_000004
+Revises: 20261018_000003
+Create Date: 2026-10-18 00:00:04
+"""
+
+from alembic import op
+import sqlalchemy as sa
+
+
+revision = "20261018_000004"
+down_revision = "20261018_000003"
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.add_column("boxes", sa.Column("content_version", sa.Integer(), nullable=False, server_default="0"))
+
+
+def downgrade() -> None:
+    op.drop_column("boxes", "content_version")
@@ -0,0 +1,34 @@
+"""indexes for box ownership and item listings
+
+Revision ID: 20261018_000005
+Revises: 20261018_000004
+Create Date: 2026-10-18 00:00:05
+"""
+
+from alembic import op
+
+
+revision = "20261018_000005"
+down_revision = "20261018_000004"
+branch_labels = None
+depends_on = None
+
+INDEXES = [
+    ("ix_boxes_owner_id_id", "boxes", ["owner_id", "id"]),
+    ("ix_items_box_id_created_at_id", "items", ["box_id", "created_at", "id"]),
+    ("ix_items_box_id_updated_at_id", "items", ["box_id", "updated_at", "id"]),
+    ("ix_items_box_id_name_id", "items", ["box_id", "name", "id"]),
+]
+
+
+def upgrade() -> None:
+    # Postgres: CONCURRENTLY, щоб не блокувати запис у великі таблиці; поза транзакцією
+    with op.get_context().autocommit_block():
+        for name, table, columns in INDEXES:
+            op.create_index(name, table, columns, postgresql_concurrently=True, if_not_exists=True)
+
+
+def downgrade() -> None:
+    with op.get_context().autocommit_block():
+        for name, table, _ in reversed(INDEXES):
+            op.drop_index(name, table_name=table, postgresql_concurrently=True, if_exists=True)
@@ -0,0 +1,62 @@
+"""sync versions and tombstones for /api/sync
+
+Revision ID: 20261018_000006
+Revises: 20261018_000005
+Create Date: 2026-10-18 00:00:06
+"""
+
+from alembic import op
+import sqlalchemy as sa
+
+
+revision = "20261018_000006"
+down_revision = "20261018_000005"
+branch_labels = None
+depends_on = None
+
+VERSIONED_TABLES = ("boxes", "items", "box_shares")
+
+
+def upgrade() -> None:
+    # Існуючі рядки отримують версію 0: клієнти починають з повного завантаження
+    for table in VERSIONED_TABLES:
+        op.add_column(table, sa.Column("sync_version", sa.BigInteger(), nullable=False, server_default="0"))
+
+    op.create_table(
+        "sync_state",
+        sa.Column("id", sa.Integer(), primary_key=True),
+        sa.Column("version", sa.BigInteger(), nullable=False, server_default="0"),
+        sa.Column("pruned_version", sa.BigInteger(), nullable=False, server_default="0"),
+    )
+    op.execute("INSERT INTO sync_state (id, version, pruned_version) VALUES (1, 0, 0)")
+
+    op.create_table(
+        "sync_tombstones",
+        sa.Column("id", sa.Integer(), primary_key=True),
+        sa.Column("version", sa.BigInteger(), nullable=False),
+        sa.Column("kind", sa.String(length=10), nullable=False),
+        sa.Column("entity_id", sa.Integer(), nullable=False),
+        sa.Column("box_id", sa.Integer(), nullable=False),
+        sa.Column("user_id", sa.Integer(), nullable=True),
+        sa.Column("deleted_at", sa.DateTime(), nullable=True),
+    )
+    op.create_index("ix_sync_tombstones_box_id_version", "sync_tombstones", ["box_id", "version"])
+    op.create_index("ix_sync_tombstones_user_id_version", "sync_tombstones", ["user_id", "version"])
+    op.create_index("ix_sync_tombstones_deleted_at", "sync_tombstones", ["deleted_at"])
+    op.create_index("ix_box_shares_sync_version_box_id", "box_shares", ["sync_version", "box_id"])
+
+    with op.get_context().autocommit_block():
+        op.create_index(
+            "ix_items_box_id_sync_version_id", "items", ["box_id", "sync_version", "id"],
+            postgresql_concurrently=True, if_not_exists=True,
+        )
+
+
+def downgrade() -> None:
+    with op.get_context().autocommit_block():
+        op.drop_index("ix_items_box_id_sync_version_id", table_name="items", postgresql_concurrently=True, if_exists=True)
+    op.drop_index("ix_box_shares_sync_version_box_id", table_name="box_shares")
+    op.drop_table("sync_tombstones")
+    op.drop_table("sync_state")
+    for table in reversed(VERSIONED_TABLES):
+        op.drop_column(table, "sync_version")
@@ -0,0 +1,55 @@
+"""item_stats aggregates for /api/stats and category index
+
+Revision ID: 20261018_000007
+Revises: 20261018_000006
+Create Date: 2026-10-18 00:00:07
+"""
+
+from alembic import op
+import sqlalchemy as sa
+
+
+revision = "20261018_000007"
+down_revision = "20261018_000006"
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        "item_stats",
+        sa.Column("box_id", sa.Integer(), sa.ForeignKey("boxes.id", ondelete="CASCADE"), primary_key=True),
+        sa.Column("category", sa.String(length=50), primary_key=True),
+        sa.Column("month", sa.Date(), primary_key=True),
+        sa.Column("added", sa.Integer(), nullable=False, server_default="0"),
+        sa.Column("removed", sa.Integer(), nullable=False, server_default="0"),
+    )
+
+    # Початкові агрегати з наявних речей — за місяцем створення (як stats.rebuild)
+    if op.get_bind().dialect.name == "postgresql":
+        month = "date_trunc('month', created_at)::date"
+    else:
+        month = "date(created_at, 'start of month')"
+    op.execute(
+        f"""
+        INSERT INTO item_stats (box_id, category, month, added, removed)
+        SELECT box_id, category, {month}, count(*), 0
+        FROM items
+        WHERE box_id IS NOT NULL
+        GROUP BY box_id, category, {month}
+        """
+    )
+
+    with op.get_context().autocommit_block():
+        op.create_index(
+            "ix_items_box_id_category_created_at_id", "items", ["box_id", "category", "created_at", "id"],
+            postgresql_concurrently=True, if_not_exists=True,
+        )
+
+
+def downgrade() -> None:
+    with op.get_context().autocommit_block():
+        op.drop_index(
+            "ix_items_box_id_category_created_at_id", table_name="items", postgresql_concurrently=True, if_exists=True
+        )
+    op.drop_table("item_stats")
@@ -0,0 +1,46 @@
+"""blobs: content-addressed uploads and photo_url reference indexes
+
+Revision ID: 20261018_000008
+Revises: 20261018_000007
+Create Date: 2026-10-18 00:00:08
+"""
+
+from alembic import op
+import sqlalchemy as sa
+
+
+revision = "20261018_000008"
+down_revision = "20261018_000007"
+branch_labels = None
+depends_on = None
+
+UPLOADS_ONLY = sa.text("photo_url LIKE '/uploads/%'")
+
+
+def upgrade() -> None:
+    op.create_table(
+        "blobs",
+        sa.Column("name", sa.String(length=100), primary_key=True),
+        sa.Column("size", sa.BigInteger(), nullable=True),
+        sa.Column("uploaded_at", sa.DateTime(), nullable=False),
+    )
+    op.create_index("ix_blobs_uploaded_at", "blobs", ["uploaded_at"])
+    # Наявні файли (імена uuid) індексуються окремо: python blobs.py --register-existing
+
+    with op.get_context().autocommit_block():
+        for table in ("items", "boxes"):
+            op.create_index(
+                f"ix_{table}_photo_url_uploads", table, ["photo_url"],
+                postgresql_where=UPLOADS_ONLY, sqlite_where=UPLOADS_ONLY,
+                postgresql_concurrently=True, if_not_exists=True,
+            )
+
+
+def downgrade() -> None:
+    with op.get_context().autocommit_block():
+        for table in ("items", "boxes"):
+            op.drop_index(
+                f"ix_{table}_photo_url_uploads", table_name=table, postgresql_concurrently=True, if_exists=True
+            )
+    op.drop_index("ix_blobs_uploaded_at", table_name="blobs")
+    op.drop_table("blobs")
@@ -0,0 +1,167 @@
+from datetime import datetime
+from typing import Annotated, List, Optional
+
+from fastapi import APIRouter, Depends, Header, Query, Response
+from sqlalchemy.ext.asyncio import AsyncSession
+
+import auth
+import crud
+import etags
+import media
+import permissions
+import schemas
+import serialization
+from principals import Principal
+
+# Async-версії CRUD-ендпоінтів (ASYNC_DATABASE=1). Логіка спільна з main.py через crud.py:
+# AsyncSession.run_sync виконує її в greenlet, і I/O йде через asyncpg без потоків.
+router = APIRouter()
+
+
+@router.get("/api/auth/me", response_model=schemas.User)
+async def get_me(current_user: Principal = Depends(auth.get_current_user_async)):
+    return current_user
+
+# ============ BOXES ============
+
+@router.get("/api/boxes", response_model=List[schemas.Box])
+async def get_boxes(
+    response: Response,
+    view: crud.BoxView = "full",
+    if_none_match: Annotated[Optional[str], Header()] = None,
+    current_user: Principal = Depends(auth.get_current_user_async),
+    db: AsyncSession = Depends(auth.get_async_db)
+):
+    etag = await db.run_sync(etags.collection_etag, current_user, "boxes", view, media.signing_epoch())
+    if etags.matches(if_none_match, etag):
+        return etags.not_modified(etag)
+    etags.set_headers(response, etag)
+    return serialization.json_response(await db.run_sync(crud.list_boxes, current_user, view), response)
+
+
+@router.post("/api/boxes", response_model=schemas.Box)
+async def create_box(
+    box: schemas.BoxCreate,
+    current_user: Principal = Depends(auth.get_current_user_async),
+    db: AsyncSession = Depends(auth.get_async_db)
+):
+    # Серіалізація всередині run_sync: lazy-атрибути не можна чіпати поза greenlet
+    return await db.run_sync(lambda session: schemas.Box.model_validate(crud.create_box(session, current_user, box)))
+
+
+@router.get("/api/boxes/{box_id}", response_model=schemas.Box)
+async def get_box(
+    box_id: int,
+    current_user: Principal = Depends(auth.get_current_user_async),
+    db: AsyncSession = Depends(auth.get_async_db)
+):
+    return await db.run_sync(
+        lambda session: schemas.Box.model_validate(permissions.require_box(session, current_user, box_id))
+    )
+
+
+@router.put("/api/boxes/{box_id}", response_model=schemas.Box)
+async def update_box(
+    box_id: int,
+    box_update: schemas.BoxUpdate,
+    current_user: Principal = Depends(auth.get_current_user_async),
+    db: AsyncSession = Depends(auth.get_async_db)
+):
+    return await db.run_sync(
+        lambda session: schemas.Box.model_validate(crud.update_box(session, current_user, box_id, box_update))
+    )
+
+
+@router.delete("/api/boxes/{box_id}")
+async def delete_box(
+    box_id: int,
+    current_user: Principal = Depends(auth.get_current_user_async),
+    db: AsyncSession = Depends(auth.get_async_db)
+):
+    await db.run_sync(crud.delete_box, current_user, box_id)
+    return {"message": "Box deleted"}
+
+# ============ ITEMS ============
+
+@router.get("/api/items", response_model=List[schemas.Item])
+async def get_items(
+    response: Response,
+    box_id: Optional[int] = None,
+    category: Optional[str] = None,
+    name_prefix: Optional[str] = None,
+    created_after: Optional[datetime] = None,
+    created_before: Optional[datetime] = None,
+    updated_after: Optional[datetime] = None,
+    updated_before: Optional[datetime] = None,
+    sort: crud.ItemSort = "created_at",
+    limit: Annotated[int, Query(ge=1, le=500)] = 100,
+    cursor: Optional[str] = None,
+    if_none_match: Annotated[Optional[str], Header()] = None,
+    current_user: Principal = Depends(auth.get_current_user_async),
+    db: AsyncSession = Depends(auth.get_async_db)
+):
+    filters = dict(
+        box_id=box_id,
+        category=category,
+        name_prefix=name_prefix,
+        created_after=created_after,
+        created_before=created_before,
+        updated_after=updated_after,
+        updated_before=updated_before,
+        sort=sort,
+        limit=limit,
+        cursor=cursor,
+    )
+    etag = await db.run_sync(etags.collection_etag, current_user, "items", sorted(filters.items()), media.signing_epoch())
+    if etags.matches(if_none_match, etag):
+        return etags.not_modified(etag)
+
+    items, next_cursor = await db.run_sync(crud.list_items, current_user, as_rows=True, **filters)
+    etags.set_headers(response, etag)
+    if next_cursor:
+        response.headers["X-Next-Cursor"] = next_cursor
+    return serialization.json_response(items, response)
+
+
+@router.post("/api/items", response_model=schemas.Item)
+async def create_item(
+    item: schemas.ItemCreate,
+    current_user: Principal = Depends(auth.get_current_user_async),
+    db: AsyncSession = Depends(auth.get_async_db)
+):
+    return await db.run_sync(lambda session: schemas.Item.model_validate(crud.create_item(session, current_user, item)))
+
+
+@router.post("/api/items/batch", response_model=schemas.ItemBatchResponse)
+async def batch_items(
+    batch: schemas.ItemBatch,
+    response: Response,
+    current_user: Principal = Depends(auth.get_current_user_async),
+    db: AsyncSession = Depends(auth.get_async_db)
+):
+    result = await db.run_sync(crud.batch_items, current_user, batch)
+    if not result.applied:
+        response.status_code = 409
+    return result
+
+
+@router.put("/api/items/{item_id}", response_model=schemas.Item)
+async def update_item(
+    item_id: int,
+    item_update: schemas.ItemUpdate,
+    current_user: Principal = Depends(auth.get_current_user_async),
+    db: AsyncSession = Depends(auth.get_async_db)
+):
+    return await db.run_sync(
+        lambda session: schemas.Item.model_validate(crud.update_item(session, current_user, item_id, item_update))
+    )
+
+
+@router.delete("/api/items/{item_id}")
+async def delete_item(
+    item_id: int,
+    current_user: Principal = Depends(auth.get_current_user_async),
+    db: AsyncSession = Depends(auth.get_async_db)
+):
+    await db.run_sync(crud.delete_item, current_user, item_id)
+    return {"message": "Item deleted"}
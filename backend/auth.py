@@ -1,19 +1,25 @@
 from datetime import datetime, timedelta
 from typing import Optional
 from jose import JWTError, jwt
-import bcrypt
 from fastapi import Depends, HTTPException, status
 from fastapi.security import OAuth2PasswordBearer
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import Session
-import models
+import database
 from database import SessionLocal
+from principals import Principal, get_principal, load_principal, principal_cache
+from passwords import hasher
 import os
 
 SECRET_KEY = os.getenv("SECRET_KEY", "your-secret-key")
 ALGORITHM = "HS256"
 ACCESS_TOKEN_EXPIRE_MINUTES = 30
+# Квиток для EventSource: лише для /api/events і ненадовго, бо URL потрапляє в логи
+STREAM_TICKET_PURPOSE = "events"
+STREAM_TICKET_SECONDS = 60
 
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="/api/auth/login")
+optional_oauth2_scheme = OAuth2PasswordBearer(tokenUrl="/api/auth/login", auto_error=False)
 
 
 def get_db():
@@ -24,17 +30,25 @@ def get_db():
         db.close()
 
 
+async def get_async_db():
+    async with database.AsyncSessionLocal() as db:
+        yield db
+
+
 def get_password_hash(password: str) -> str:
-    password_bytes = password.encode("utf-8")
-    salt = bcrypt.gensalt()
-    hashed = bcrypt.hashpw(password_bytes, salt)
-    return hashed.decode("utf-8")
+    return hasher.hash(password)
 
 
 def verify_password(plain_password: str, hashed_password: str) -> bool:
-    password_bytes = plain_password.encode("utf-8")
-    hashed_bytes = hashed_password.encode("utf-8")
-    return bcrypt.checkpw(password_bytes, hashed_bytes)
+    return hasher.verify(plain_password, hashed_password)
+
+
+async def get_password_hash_async(password: str) -> str:
+    return await hasher.hash_async(password)
+
+
+async def verify_password_async(plain_password: str, hashed_password: str) -> bool:
+    return await hasher.verify_async(plain_password, hashed_password)
 
 
 def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
@@ -48,20 +62,70 @@ def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
     return encoded_jwt
 
 
-def get_current_user(token: str = Depends(oauth2_scheme), db: Session = Depends(get_db)):
-    credentials_exception = HTTPException(
+def credentials_exception() -> HTTPException:
+    return HTTPException(
         status_code=status.HTTP_401_UNAUTHORIZED,
         detail="Could not validate credentials",
         headers={"WWW-Authenticate": "Bearer"},
     )
+
+
+def create_stream_ticket(user_id: int) -> str:
+    return create_access_token(
+        {"sub": str(user_id), "purpose": STREAM_TICKET_PURPOSE}, timedelta(seconds=STREAM_TICKET_SECONDS)
+    )
+
+
+def decode_user_id(token: str, purpose: Optional[str] = None) -> int:
     try:
         payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
+        # Квиток не годиться як bearer-токен, а звичайний токен — як квиток
+        if payload.get("purpose") != purpose:
+            raise credentials_exception()
         user_id = payload.get("sub")
         if user_id is not None:
             user_id = int(user_id)
-    except JWTError:
-        raise credentials_exception
-    user = db.query(models.User).filter(models.User.id == user_id).first()
+    except (JWTError, ValueError):
+        raise credentials_exception()
+    if user_id is None:
+        raise credentials_exception()
+    return user_id
+
+
+def get_current_user(token: str = Depends(oauth2_scheme), db: Session = Depends(get_db)) -> Principal:
+    user_id = decode_user_id(token)
+    # Кешований principal замість SELECT users на кожен запит
+    user = get_principal(db, user_id)
+    if user is None:
+        raise credentials_exception()
+    return user
+
+
+def load_stream_user(token: Optional[str], ticket: Optional[str] = None) -> Principal:
+    # Для довгих з'єднань (/api/events): власна коротка сесія замість get_db,
+    # інакше з'єднання з пулу трималось би весь час потоку
+    if token:
+        user_id = decode_user_id(token)
+    elif ticket:
+        user_id = decode_user_id(ticket, purpose=STREAM_TICKET_PURPOSE)
+    else:
+        raise credentials_exception()
+    with SessionLocal() as db:
+        user = get_principal(db, user_id)
+    if user is None:
+        raise credentials_exception()
+    return user
+
+
+async def get_current_user_async(
+    token: str = Depends(oauth2_scheme), db: AsyncSession = Depends(get_async_db)
+) -> Principal:
+    user_id = decode_user_id(token)
+    user = principal_cache.get(user_id)
     if user is None:
-        raise credentials_exception
+        generation = principal_cache.generation(user_id)
+        user = await db.run_sync(load_principal, user_id)
+        if user is None:
+            raise credentials_exception()
+        principal_cache.put(user, generation)
     return user
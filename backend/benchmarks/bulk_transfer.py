@@ -0,0 +1,115 @@
+"""Measures bulk import and streaming export of a large inventory.
+
+Generates an export file with --items items spread over boxes of --per-box,
+imports it for a fresh user (COPY on Postgres/psycopg2, batched INSERT
+elsewhere), then streams the export back out and reports throughput and the
+peak Python memory of the export, which should stay flat as --items grows.
+
+    cd backend
+    python benchmarks/bulk_transfer.py --items 1000000 --format csv
+    DATABASE_URL=postgresql://... python benchmarks/bulk_transfer.py --items 1000000
+"""
+import argparse
+import json
+import os
+from pathlib import Path
+import sys
+import tempfile
+import time
+import tracemalloc
+
+WORK_DIR = Path(tempfile.mkdtemp(prefix="mystorage-bench-"))
+os.environ.setdefault("DATABASE_URL", f"sqlite:///{WORK_DIR / 'bench.db'}")
+os.environ.setdefault("UPLOAD_DIR", str(WORK_DIR / "uploads"))
+
+BACKEND_DIR = Path(__file__).resolve().parents[1]
+if str(BACKEND_DIR) not in sys.path:
+    sys.path.insert(0, str(BACKEND_DIR))
+
+import database  # noqa: E402
+import models  # noqa: E402
+import transfer  # noqa: E402
+from principals import load_principal  # noqa: E402
+
+
+def source_rows(items, per_box):
+    boxes = (items + per_box - 1) // per_box
+    for box in range(boxes):
+        yield {"type": "box", "ref": box, "name": f"Box {box}", "location": f"Shelf {box % 50}"}
+    for index in range(items):
+        yield {
+            "type": "item",
+            "box_ref": index // per_box,
+            "name": f"Item {index}",
+            "description": "generated",
+            "category": f"category-{index % 20}",
+        }
+
+
+def create_user(username):
+    with database.SessionLocal() as db:
+        user = models.User(username=username, email=f"{username}@example.com", password_hash="x")
+        db.add(user)
+        db.commit()
+        return user.id
+
+
+def export_once(owner_id, fmt):
+    size = 0
+    rows = 0
+    for chunk in transfer.stream_export(owner_id, fmt):
+        size += len(chunk)
+        rows += chunk.count(b"\n")
+    return size, rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--items", type=int, default=1_000_000)
+    parser.add_argument("--per-box", type=int, default=100)
+    parser.add_argument("--format", choices=["csv", "ndjson"], default="csv")
+    args = parser.parse_args()
+
+    models.Base.metadata.create_all(bind=database.engine)
+    suffix = str(int(time.time()))
+    owner_id = create_user(f"bulk{suffix}")
+
+    source = WORK_DIR / f"source.{args.format}"
+    with source.open("wb") as handle:
+        for chunk in transfer.encode_rows(source_rows(args.items, args.per_box), args.format):
+            handle.write(chunk)
+
+    started = time.perf_counter()
+    with database.SessionLocal() as db, source.open("rb") as handle:
+        writer = transfer.item_writer(db).__name__
+        counts = transfer.import_inventory(db, load_principal(db, owner_id), handle, args.format)
+    import_seconds = time.perf_counter() - started
+
+    started = time.perf_counter()
+    export_bytes, export_lines = export_once(owner_id, args.format)
+    export_seconds = time.perf_counter() - started
+
+    # Окремий прохід під tracemalloc: він сповільнює, тому не змішується з часом
+    tracemalloc.start()
+    export_once(owner_id, args.format)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    print(json.dumps({
+        "database": database.engine.dialect.name,
+        "writer": writer,
+        "format": args.format,
+        "source_mb": round(source.stat().st_size / 1e6, 1),
+        "imported": counts,
+        "import_s": round(import_seconds, 2),
+        "import_items_per_s": round(counts["items"] / import_seconds),
+        "export_mb": round(export_bytes / 1e6, 1),
+        "export_lines": export_lines,
+        "export_s": round(export_seconds, 2),
+        "export_items_per_s": round(counts["items"] / export_seconds),
+        "export_peak_python_mb": round(peak / 1e6, 2),
+    }, indent=2))
+
+
+if __name__ == "__main__":
+    main()
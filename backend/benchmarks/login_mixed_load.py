@@ -0,0 +1,102 @@
+"""Mixed login and read load, with bcrypt inline or in the bounded process pool.
+
+Concurrent clients hammer POST /api/auth/login while others read
+GET /api/items. Compare read latency between the two hashing modes:
+
+    cd backend
+    python benchmarks/login_mixed_load.py --inline     # bcrypt in request threads (old behaviour)
+    python benchmarks/login_mixed_load.py              # bcrypt in the process pool
+"""
+import argparse
+import asyncio
+import os
+from pathlib import Path
+import statistics
+import sys
+import tempfile
+import time
+
+ARGS = None
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--inline", action="store_true", help="hash in request threads")
+    parser.add_argument("--logins", type=int, default=60, help="concurrent login clients")
+    parser.add_argument("--readers", type=int, default=10, help="concurrent read clients")
+    parser.add_argument("--duration", type=float, default=10.0)
+    parser.add_argument("--rounds", type=int, default=12, help="bcrypt cost factor")
+    ARGS = parser.parse_args()
+    if ARGS.inline:
+        # Як до пулу: хешування в потоках запитів без обмеження черги
+        os.environ["PASSWORD_HASH_WORKERS"] = "0"
+        os.environ["PASSWORD_HASH_MAX_PENDING"] = str(ARGS.logins + 1)
+    os.environ["BCRYPT_ROUNDS"] = str(ARGS.rounds)
+
+WORK_DIR = Path(tempfile.mkdtemp(prefix="mystorage-bench-"))
+os.environ.setdefault("DATABASE_URL", f"sqlite:///{WORK_DIR / 'bench.db'}")
+os.environ.setdefault("UPLOAD_DIR", str(WORK_DIR / "uploads"))
+# Усе навантаження — від одного клієнта: ліміти запитів і скидання навантаження
+# відкидали б його замість вимірювання (увімкнути: RATE_LIMIT_ENABLED=1 LOAD_SHED_ENABLED=1)
+os.environ.setdefault("RATE_LIMIT_ENABLED", "0")
+os.environ.setdefault("LOAD_SHED_ENABLED", "0")
+
+BACKEND_DIR = Path(__file__).resolve().parents[1]
+if str(BACKEND_DIR) not in sys.path:
+    sys.path.insert(0, str(BACKEND_DIR))
+
+import httpx  # noqa: E402
+
+import database  # noqa: E402
+import main  # noqa: E402
+import models  # noqa: E402
+
+
+def percentile(ordered, fraction):
+    return round(ordered[min(len(ordered) - 1, int(len(ordered) * fraction))] * 1000, 2)
+
+
+async def login_loop(client, credentials, deadline, outcomes):
+    while time.perf_counter() < deadline:
+        response = await client.post("/api/auth/login", json=credentials)
+        outcomes[response.status_code] = outcomes.get(response.status_code, 0) + 1
+        if response.status_code == 503:
+            await asyncio.sleep(float(response.headers.get("Retry-After", "1")) / 10)
+
+
+async def read_loop(client, headers, deadline, samples):
+    while time.perf_counter() < deadline:
+        started = time.perf_counter()
+        response = await client.get("/api/items", headers=headers)
+        response.raise_for_status()
+        samples.append(time.perf_counter() - started)
+
+
+async def run(args):
+    models.Base.metadata.create_all(bind=database.engine)
+    transport = httpx.ASGITransport(app=main.app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=120) as client:
+        credentials = {"username": "bench", "email": "bench@example.com", "password": "bench-password"}
+        await client.post("/api/auth/register", json=credentials)
+        login = await client.post("/api/auth/login", json=credentials)
+        headers = {"Authorization": f"Bearer {login.json()['access_token']}"}
+
+        deadline = time.perf_counter() + args.duration
+        outcomes, samples = {}, []
+        await asyncio.gather(
+            *(login_loop(client, credentials, deadline, outcomes) for _ in range(args.logins)),
+            *(read_loop(client, headers, deadline, samples) for _ in range(args.readers)),
+        )
+    main.hasher.shutdown()
+
+    ordered = sorted(samples)
+    mode = "inline" if args.inline else f"pool ({main.hasher.workers} workers)"
+    print(f"mode: {mode}, bcrypt rounds: {args.rounds}")
+    print(f"logins: {outcomes}  ({sum(outcomes.values()) / args.duration:.1f} req/s)")
+    print(
+        f"reads: {len(ordered)} ({len(ordered) / args.duration:.1f} req/s)  "
+        f"p50={round(statistics.median(ordered) * 1000, 2)}ms "
+        f"p95={percentile(ordered, 0.95)}ms p99={percentile(ordered, 0.99)}ms"
+    )
+
+
+if __name__ == "__main__":
+    asyncio.run(run(ARGS))
@@ -0,0 +1,146 @@
+"""Compares photo serving through Python with the X-Accel-Redirect hand-off to nginx.
+
+Runs the real ASGI app in-process on one event loop, like a single uvicorn
+worker. In "python" mode the worker streams every image byte itself; in
+"accel" mode it only checks the signed URL and answers with X-Accel-Redirect,
+so the numbers show how much worker time one image costs either way and how
+API latency behaves while images are being fetched. The sendfile transfer by
+nginx itself happens outside the worker and is not measured here.
+
+    cd backend
+    python benchmarks/media_throughput.py --photos 20 --size-kb 800 --requests 400
+"""
+import argparse
+import asyncio
+import io
+import math
+import os
+from pathlib import Path
+import statistics
+import sys
+import tempfile
+import time
+
+WORK_DIR = Path(tempfile.mkdtemp(prefix="mystorage-bench-"))
+os.environ.setdefault("DATABASE_URL", f"sqlite:///{WORK_DIR / 'bench.db'}")
+os.environ.setdefault("UPLOAD_DIR", str(WORK_DIR / "uploads"))
+# Усе навантаження — від одного клієнта: ліміти запитів і скидання навантаження
+# відкидали б його замість вимірювання (увімкнути: RATE_LIMIT_ENABLED=1 LOAD_SHED_ENABLED=1)
+os.environ.setdefault("RATE_LIMIT_ENABLED", "0")
+os.environ.setdefault("LOAD_SHED_ENABLED", "0")
+
+BACKEND_DIR = Path(__file__).resolve().parents[1]
+if str(BACKEND_DIR) not in sys.path:
+    sys.path.insert(0, str(BACKEND_DIR))
+
+import httpx  # noqa: E402
+from PIL import Image  # noqa: E402
+
+import database  # noqa: E402
+import main  # noqa: E402
+import media  # noqa: E402
+import models  # noqa: E402
+
+MODES = {"python": "", "accel": "/_uploads/"}
+
+
+def summarize(samples):
+    ordered = sorted(samples)
+    return {
+        "p50_ms": round(statistics.median(ordered) * 1000, 2),
+        "p95_ms": round(ordered[max(0, int(len(ordered) * 0.95) - 1)] * 1000, 2),
+        "max_ms": round(ordered[-1] * 1000, 2),
+    }
+
+
+def noise_jpeg(size_kb):
+    # Шум погано стискається: JPEG приблизно заданого розміру, який Pillow може прочитати
+    side = max(16, int(math.sqrt(size_kb * 1024 / 2.5)))
+    buffer = io.BytesIO()
+    Image.frombytes("RGB", (side, side), os.urandom(side * side * 3)).save(buffer, "JPEG", quality=95)
+    return buffer.getvalue()
+
+
+async def seed(client, args):
+    credentials = {"username": "bench", "email": "bench@example.com", "password": "bench-password"}
+    await client.post("/api/auth/register", json=credentials)
+    login = await client.post("/api/auth/login", json=credentials)
+    headers = {"Authorization": f"Bearer {login.json()['access_token']}"}
+    box = (await client.post("/api/boxes", headers=headers, json={"name": "Photos"})).json()
+    for index in range(args.photos):
+        payload = noise_jpeg(args.size_kb)
+        uploaded = await client.post("/api/upload", headers=headers, files={"file": ("photo.jpg", payload, "image/jpeg")})
+        uploaded.raise_for_status()
+        created = await client.post("/api/items", headers=headers, json={
+            "name": f"Photo {index}", "category": "photos", "box_id": box["id"], "photo_url": uploaded.json()["url"],
+        })
+        created.raise_for_status()
+    items = await client.get("/api/items", headers={**headers, "Accept-Encoding": "identity"}, params={"limit": 100})
+    return headers, [item["photo_src"] for item in items.json()]
+
+
+async def fetch_images(client, sources, count, concurrency, byte_range):
+    samples = []
+    transferred = 0
+    queue = asyncio.Queue()
+    for index in range(count):
+        queue.put_nowait(sources[index % len(sources)])
+    headers = {"Range": byte_range} if byte_range else {}
+
+    async def worker():
+        nonlocal transferred
+        while not queue.empty():
+            source = queue.get_nowait()
+            started = time.perf_counter()
+            response = await client.get(source, headers=headers)
+            if response.status_code not in (200, 206):
+                raise RuntimeError(f"{source}: HTTP {response.status_code}")
+            samples.append(time.perf_counter() - started)
+            transferred += len(response.content)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    return samples, transferred, time.perf_counter() - started
+
+
+async def probe(client, headers, stop):
+    samples = []
+    while not stop.is_set():
+        started = time.perf_counter()
+        (await client.get("/api/items", headers=headers)).raise_for_status()
+        samples.append(time.perf_counter() - started)
+        await asyncio.sleep(0.005)
+    return samples
+
+
+async def run(args):
+    models.Base.metadata.create_all(bind=database.engine)
+    transport = httpx.ASGITransport(app=main.app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+        headers, sources = await seed(client, args)
+        for mode in args.modes:
+            media.ACCEL_PREFIX = MODES[mode]
+            stop = asyncio.Event()
+            prober = asyncio.create_task(probe(client, headers, stop))
+            samples, transferred, elapsed = await fetch_images(client, sources, args.requests, args.concurrency, args.range)
+            stop.set()
+            api_samples = await prober
+            print(
+                f"{mode:7s} {args.requests / elapsed:8.1f} req/s  {transferred / elapsed / 1024 / 1024:8.1f} MiB/s "
+                f"through the worker  image {summarize(samples)}  /api/items meanwhile {summarize(api_samples)}"
+            )
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--photos", type=int, default=20)
+    parser.add_argument("--size-kb", type=int, default=800)
+    parser.add_argument("--requests", type=int, default=400)
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--range", help="e.g. bytes=0-65535 to measure partial requests")
+    parser.add_argument("--modes", nargs="+", choices=sorted(MODES), default=["python", "accel"])
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    asyncio.run(run(parse_args()))
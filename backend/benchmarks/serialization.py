@@ -0,0 +1,132 @@
+"""Compares response serialization paths for large box/item listings.
+
+Builds a user with --boxes boxes holding --items items in total and times,
+per listing, the query plus the serialization to JSON bytes:
+
+  legacy       ORM objects -> response_model validation -> json.dumps
+               (what FastAPI did before the fast path)
+  typeadapter  ORM objects -> precompiled TypeAdapter validate + dump_json
+  rows         SQL rows -> dict -> orjson (serialization.json_response)
+
+    cd backend
+    python benchmarks/serialization.py --items 10000 --repeat 20
+"""
+import argparse
+import asyncio
+import json
+import os
+from pathlib import Path
+import statistics
+import sys
+import tempfile
+import time
+from typing import List
+
+WORK_DIR = Path(tempfile.mkdtemp(prefix="mystorage-bench-"))
+os.environ.setdefault("DATABASE_URL", f"sqlite:///{WORK_DIR / 'bench.db'}")
+os.environ.setdefault("UPLOAD_DIR", str(WORK_DIR / "uploads"))
+
+BACKEND_DIR = Path(__file__).resolve().parents[1]
+if str(BACKEND_DIR) not in sys.path:
+    sys.path.insert(0, str(BACKEND_DIR))
+
+from fastapi.responses import JSONResponse  # noqa: E402
+from fastapi.routing import serialize_response  # noqa: E402
+from fastapi.utils import create_response_field  # noqa: E402
+from pydantic import TypeAdapter  # noqa: E402
+from sqlalchemy import insert  # noqa: E402
+from sqlalchemy.orm import selectinload, undefer  # noqa: E402
+
+import crud  # noqa: E402
+import database  # noqa: E402
+import models  # noqa: E402
+import schemas  # noqa: E402
+import serialization  # noqa: E402
+from principals import load_principal  # noqa: E402
+
+ITEM_LIST = TypeAdapter(List[schemas.Item])
+BOX_LIST = TypeAdapter(List[schemas.Box])
+ITEM_FIELD = create_response_field(name="items", type_=List[schemas.Item])
+BOX_FIELD = create_response_field(name="boxes", type_=List[schemas.Box])
+
+
+def seed(boxes, items):
+    models.Base.metadata.create_all(bind=database.engine)
+    with database.engine.begin() as connection:
+        connection.execute(insert(models.User).values(id=1, username="bench", email="bench@example.com", password_hash="x"))
+        connection.execute(insert(models.Box), [
+            {"id": box, "owner_id": 1, "name": f"Box {box}", "location": "Garage", "photo_url": f"/uploads/box{box}.jpg"}
+            for box in range(1, boxes + 1)
+        ])
+        connection.execute(insert(models.Item), [
+            {
+                "box_id": index % boxes + 1,
+                "name": f"Item {index}",
+                "description": "Generated item with a short description",
+                "category": f"category-{index % 12}",
+                "photo_url": f"/uploads/item{index}.jpg",
+            }
+            for index in range(items)
+        ])
+
+
+def orm_items(db, principal, items):
+    return crud.list_items(db, principal, limit=items)[0]
+
+
+def orm_boxes(db, principal):
+    boxes = db.query(models.Box).options(undefer(models.Box.item_count), selectinload(models.Box.items)).all()
+    return [schemas.Box.model_validate(box) for box in boxes]
+
+
+def typeadapter(adapter, content):
+    return adapter.dump_json(adapter.validate_python(content, from_attributes=True))
+
+
+def rows(content):
+    return serialization.json_response(content).body
+
+
+def measure(repeat, build):
+    samples = []
+    for _ in range(repeat):
+        with database.SessionLocal() as db:
+            principal = load_principal(db, 1)
+            started = time.perf_counter()
+            body = build(db, principal)
+            samples.append(time.perf_counter() - started)
+    return {"median_ms": round(statistics.median(samples) * 1000, 1), "bytes": len(body)}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--items", type=int, default=10_000)
+    parser.add_argument("--boxes", type=int, default=100)
+    parser.add_argument("--repeat", type=int, default=20)
+    args = parser.parse_args()
+
+    seed(args.boxes, args.items)
+    loop = asyncio.new_event_loop()
+
+    def legacy(field, content):
+        # Як FastAPI з response_model: валідація, dump у python-об'єкти, потім json.dumps
+        return JSONResponse(loop.run_until_complete(serialize_response(field=field, response_content=content))).body
+
+    results = {
+        "items": {
+            "legacy": measure(args.repeat, lambda db, p: legacy(ITEM_FIELD, orm_items(db, p, args.items))),
+            "typeadapter": measure(args.repeat, lambda db, p: typeadapter(ITEM_LIST, orm_items(db, p, args.items))),
+            "rows": measure(args.repeat, lambda db, p: rows(crud.list_items(db, p, limit=args.items, as_rows=True)[0])),
+        },
+        "boxes_full": {
+            "legacy": measure(args.repeat, lambda db, p: legacy(BOX_FIELD, orm_boxes(db, p))),
+            "typeadapter": measure(args.repeat, lambda db, p: BOX_LIST.dump_json(orm_boxes(db, p))),
+            "rows": measure(args.repeat, lambda db, p: rows(crud.list_boxes(db, p, "full"))),
+        },
+    }
+    loop.close()
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
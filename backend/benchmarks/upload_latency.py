@@ -0,0 +1,95 @@
+"""Measures API latency with and without concurrent photo uploads in flight.
+
+Runs the real ASGI app in-process on one event loop, like a single uvicorn
+worker, so anything that blocks the loop during an upload shows up directly
+in the latency of the probe requests.
+
+    cd backend
+    python benchmarks/upload_latency.py --uploads 8 --size-mb 8
+"""
+import argparse
+import asyncio
+import os
+from pathlib import Path
+import statistics
+import sys
+import tempfile
+import time
+
+WORK_DIR = Path(tempfile.mkdtemp(prefix="mystorage-bench-"))
+os.environ.setdefault("DATABASE_URL", f"sqlite:///{WORK_DIR / 'bench.db'}")
+os.environ.setdefault("UPLOAD_DIR", str(WORK_DIR / "uploads"))
+# Усе навантаження — від одного клієнта: ліміти запитів і скидання навантаження
+# відкидали б його замість вимірювання (увімкнути: RATE_LIMIT_ENABLED=1 LOAD_SHED_ENABLED=1)
+os.environ.setdefault("RATE_LIMIT_ENABLED", "0")
+os.environ.setdefault("LOAD_SHED_ENABLED", "0")
+os.environ.setdefault("MAX_UPLOAD_BYTES", str(64 * 1024 * 1024))
+
+BACKEND_DIR = Path(__file__).resolve().parents[1]
+if str(BACKEND_DIR) not in sys.path:
+    sys.path.insert(0, str(BACKEND_DIR))
+
+import httpx  # noqa: E402
+
+import database  # noqa: E402
+import main  # noqa: E402
+import models  # noqa: E402
+
+
+def summarize(samples):
+    ordered = sorted(samples)
+    return {
+        "p50_ms": round(statistics.median(ordered) * 1000, 2),
+        "p95_ms": round(ordered[int(len(ordered) * 0.95) - 1] * 1000, 2),
+        "max_ms": round(ordered[-1] * 1000, 2),
+    }
+
+
+async def probe(client, headers, count, interval):
+    samples = []
+    for _ in range(count):
+        started = time.perf_counter()
+        response = await client.get("/api/items", headers=headers)
+        response.raise_for_status()
+        samples.append(time.perf_counter() - started)
+        await asyncio.sleep(interval)
+    return samples
+
+
+async def upload(client, headers, payload):
+    files = {"file": ("photo.jpg", payload, "image/jpeg")}
+    response = await client.post("/api/upload", headers=headers, files=files)
+    response.raise_for_status()
+
+
+async def run(args):
+    models.Base.metadata.create_all(bind=database.engine)
+    transport = httpx.ASGITransport(app=main.app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+        credentials = {"username": "bench", "email": "bench@example.com", "password": "bench-password"}
+        await client.post("/api/auth/register", json=credentials)
+        login = await client.post("/api/auth/login", json=credentials)
+        headers = {"Authorization": f"Bearer {login.json()['access_token']}"}
+
+        idle = await probe(client, headers, args.probes, args.interval)
+
+        payload = b"\xff\xd8\xff\xe0" + os.urandom(args.size_mb * 1024 * 1024)
+        uploads = [asyncio.create_task(upload(client, headers, payload)) for _ in range(args.uploads)]
+        busy = await probe(client, headers, args.probes, args.interval)
+        await asyncio.gather(*uploads)
+
+    print(f"idle:          {summarize(idle)}")
+    print(f"during upload: {summarize(busy)}  ({args.uploads} x {args.size_mb} MiB)")
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--uploads", type=int, default=8)
+    parser.add_argument("--size-mb", type=int, default=8)
+    parser.add_argument("--probes", type=int, default=50)
+    parser.add_argument("--interval", type=float, default=0.005)
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    asyncio.run(run(parse_args()))
@@ -0,0 +1,169 @@
+import argparse
+import contextlib
+import os
+import time
+from datetime import datetime, timedelta
+from pathlib import Path
+from typing import List, Optional
+
+from sqlalchemy import and_, delete, exists, select
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.orm import Session
+
+import models
+import storage as storages
+import thumbnails
+
+# Завантаження зберігаються за хешем вмісту (<sha256>.<ext>, uploads.store_upload),
+# тож однакові фото — один файл, на який можуть посилатися кілька рядків. Видалення
+# рядка чи заміна photo_url файл не чіпає: його прибирає sweep, коли на blob
+# не лишилось посилань у items.photo_url / boxes.photo_url.
+
+UPLOAD_URL_PREFIX = "/uploads/"
+# Завантаження стає photo_url окремим запитом: свіжі файли без посилань не чіпаємо
+GC_GRACE_HOURS = float(os.getenv("UPLOAD_GC_GRACE_HOURS", "24"))
+GC_BATCH_SIZE = 500
+
+
+def _insert(db: Session):
+    dialect = postgresql if db.get_bind().dialect.name == "postgresql" else sqlite
+    return dialect.insert(models.Blob)
+
+
+def register(db: Session, name: str, size: int):
+    # Викликається до того, як файл з'явиться під своїм іменем. Свіжий uploaded_at
+    # виводить blob з-під sweep; на Postgres upsert чекає на транзакцію sweep,
+    # що видаляє цей blob, і файл після неї записується знову
+    statement = _insert(db).values(name=name, size=size, uploaded_at=datetime.utcnow())
+    db.execute(statement.on_conflict_do_update(
+        index_elements=[models.Blob.name], set_={"uploaded_at": statement.excluded.uploaded_at}
+    ))
+    db.commit()
+
+
+def _referenced(table):
+    url = UPLOAD_URL_PREFIX + models.Blob.name
+    # LIKE відповідає умові часткових індексів ix_*_photo_url_uploads
+    return exists().where(and_(table.photo_url == url, table.photo_url.like(UPLOAD_URL_PREFIX + "%")))
+
+
+def orphans(cutoff: datetime, limit: int, after: str = ""):
+    return (
+        select(models.Blob.name, models.Blob.size)
+        .where(
+            models.Blob.uploaded_at < cutoff,
+            models.Blob.name > after,
+            ~_referenced(models.Item),
+            ~_referenced(models.Box),
+        )
+        .order_by(models.Blob.name)
+        .limit(limit)
+    )
+
+
+def _remove_derivatives(derivative_dir: Path, name: str):
+    # Похідні — локальний кеш цього хоста; на інших хостах їх прибере власний sweep
+    stem = Path(name).stem
+    for size in thumbnails.DERIVATIVE_SIZES:
+        for fmt in thumbnails.DERIVATIVE_FORMATS:
+            with contextlib.suppress(FileNotFoundError):
+                (derivative_dir / thumbnails.derivative_name(stem, size, fmt)).unlink()
+
+
+def sweep(
+    db: Session,
+    upload_dir: Path,
+    grace: timedelta = timedelta(hours=GC_GRACE_HOURS),
+    batch_size: int = GC_BATCH_SIZE,
+    pause: float = 0.0,
+    dry_run: bool = False,
+    storage: Optional[storages.Storage] = None,
+) -> dict:
+    # Пачками, кожна в окремій транзакції: блокування коротке, а pause між пачками
+    # лишає диск і БД запитам
+    storage = storage or storages.LocalStorage(upload_dir)
+    cutoff = datetime.utcnow() - grace
+    derivative_dir = upload_dir / "derivatives"
+    result = {"blobs": 0, "bytes": 0, "partials": 0, "cached": 0, "multipart": 0}
+    after = ""
+    while True:
+        if dry_run:
+            rows = db.execute(orphans(cutoff, batch_size, after)).all()
+        else:
+            candidates = orphans(cutoff, batch_size).with_only_columns(models.Blob.name)
+            rows = db.execute(
+                delete(models.Blob)
+                .where(models.Blob.name.in_(candidates), models.Blob.uploaded_at < cutoff)
+                .returning(models.Blob.name, models.Blob.size)
+            ).all()
+            # Файли — до commit: паралельний register того самого blob чекає на цю транзакцію
+            storage.delete_many(name for name, _ in rows)
+            for name, _ in rows:
+                _remove_derivatives(derivative_dir, name)
+            db.commit()
+        result["blobs"] += len(rows)
+        result["bytes"] += sum(size or 0 for _, size in rows)
+        if len(rows) < batch_size:
+            break
+        after = rows[-1][0]
+        if pause:
+            time.sleep(pause)
+
+    # Недописані завантаження (впав воркер посеред запису)
+    for path in upload_dir.glob(".upload-*.part"):
+        if datetime.utcfromtimestamp(path.stat().st_mtime) < cutoff:
+            result["partials"] += 1
+            if not dry_run:
+                with contextlib.suppress(FileNotFoundError):
+                    path.unlink()
+    if not dry_run:
+        result["cached"] = storage.prune_cache(cutoff)
+        # Їхні blob-рядки (без посилань) прибере наступний sweep
+        result["multipart"] = storage.abort_stale_uploads(cutoff)
+    return result
+
+
+def register_existing(db: Session, upload_dir: Path, batch_size: int = 1000) -> int:
+    # Файли, завантажені до появи таблиці blobs (імена uuid), стають видимими для sweep
+    known = set(db.scalars(select(models.Blob.name)))
+    pending = []
+    added = 0
+    for path in upload_dir.iterdir():
+        if not path.is_file() or path.name.startswith(".") or path.name in known:
+            continue
+        stat = path.stat()
+        pending.append({"name": path.name, "size": stat.st_size, "uploaded_at": datetime.utcfromtimestamp(stat.st_mtime)})
+        if len(pending) >= batch_size:
+            db.execute(_insert(db).on_conflict_do_nothing(), pending)
+            added += len(pending)
+            pending.clear()
+    if pending:
+        db.execute(_insert(db).on_conflict_do_nothing(), pending)
+        added += len(pending)
+    db.commit()
+    return added
+
+
+def main(argv: Optional[List[str]] = None):
+    parser = argparse.ArgumentParser(description="Delete uploaded files that no box or item references any more.")
+    parser.add_argument("--grace-hours", type=float, default=GC_GRACE_HOURS, help="keep unreferenced uploads this long")
+    parser.add_argument("--batch-size", type=int, default=GC_BATCH_SIZE)
+    parser.add_argument("--pause", type=float, default=0.5, help="seconds to sleep between batches")
+    parser.add_argument("--dry-run", action="store_true")
+    parser.add_argument("--register-existing", action="store_true", help="first index files uploaded before blobs existed")
+    args = parser.parse_args(argv)
+
+    import database
+    upload_dir = Path(os.getenv("UPLOAD_DIR", "/app/media/uploads"))
+    storage = storages.from_env(upload_dir)
+    with database.SessionLocal() as db:
+        if args.register_existing:
+            print(f"Registered {register_existing(db, upload_dir)} existing files")
+        result = sweep(db, upload_dir, timedelta(hours=args.grace_hours), args.batch_size, args.pause, args.dry_run,
+                       storage)
+    verb = "Would remove" if args.dry_run else "Removed"
+    print(f"{verb} {result['blobs']} orphaned uploads ({result['bytes'] / 1024 / 1024:.1f} MiB), {result['partials']} partial files, {result['cached']} cached originals, {result['multipart']} abandoned multipart uploads")
+
+
+if __name__ == "__main__":
+    main()
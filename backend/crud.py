@@ -0,0 +1,463 @@
+import uuid
+from datetime import datetime
+from typing import List, Literal, Optional, Tuple
+
+from fastapi import HTTPException
+from sqlalchemy import delete, exists, insert, or_, select, tuple_, update
+from sqlalchemy.orm import Session
+
+import etags
+import events
+import models
+import permissions
+import schemas
+import serialization
+import stats
+import sync
+from pagination import decode_cursor, encode_cursor
+from principals import invalidate_on_commit
+
+# Логіка CRUD, спільна для sync-ендпоінтів main.py і async-ендпоінтів async_api.py
+
+ITEM_SORT_COLUMNS = {
+    "created_at": models.Item.created_at,
+    "updated_at": models.Item.updated_at,
+    "name": models.Item.name,
+}
+ItemSort = Literal["created_at", "-created_at", "updated_at", "-updated_at", "name", "-name"]
+BoxView = Literal["full", "summary"]
+
+
+def list_boxes(db: Session, principal, view: BoxView = "full") -> List[dict]:
+    # Власні коробки + shared коробки одним запитом, власні першими; результат — готові
+    # до orjson dict-и (serialization.py), без ORM-об'єктів і pydantic-моделей
+    shared_box_ids = select(models.box_shares.c.box_id).where(models.box_shares.c.user_id == principal.id)
+    is_shared = models.Box.owner_id != principal.id
+    rows = db.execute(
+        select(*serialization.BOX_COLUMNS, models.Box.item_count, is_shared.label("is_shared"))
+        .where(or_(models.Box.owner_id == principal.id, models.Box.id.in_(shared_box_ids)))
+        .order_by(is_shared, models.Box.id)
+    ).mappings()
+
+    all_boxes = []
+    for row in rows:
+        box = serialization.box_row(row)
+        box["items"] = None if view == "summary" else []
+        all_boxes.append(box)
+
+    if view == "full" and all_boxes:
+        by_id = {box["id"]: box for box in all_boxes}
+        items = db.execute(
+            select(*serialization.ITEM_COLUMNS)
+            .where(models.Item.box_id.in_(permissions.accessible_box_ids(principal.id)))
+            .order_by(models.Item.box_id, models.Item.id)
+        ).mappings()
+        for item in items:
+            by_id[item["box_id"]]["items"].append(serialization.item_row(item))
+
+    return all_boxes
+
+
+def list_items(
+    db: Session,
+    principal,
+    box_id: Optional[int] = None,
+    category: Optional[str] = None,
+    name_prefix: Optional[str] = None,
+    created_after: Optional[datetime] = None,
+    created_before: Optional[datetime] = None,
+    updated_after: Optional[datetime] = None,
+    updated_before: Optional[datetime] = None,
+    sort: ItemSort = "created_at",
+    limit: int = 100,
+    cursor: Optional[str] = None,
+    as_rows: bool = False,
+) -> Tuple[list, Optional[str]]:
+    if box_id is not None and not permissions.can_access(db, principal, box_id):
+        raise HTTPException(status_code=403, detail="Access denied")
+
+    # as_rows: лише колонки, без ORM-об'єктів — для серіалізації одразу в JSON
+    entities = serialization.ITEM_COLUMNS if as_rows else (models.Item,)
+    query = db.query(*entities).filter(models.Item.box_id.in_(permissions.accessible_box_ids(principal.id)))
+
+    if box_id is not None:
+        query = query.filter(models.Item.box_id == box_id)
+    if category is not None:
+        query = query.filter(models.Item.category == category)
+    if name_prefix:
+        query = query.filter(models.Item.name.startswith(name_prefix, autoescape=True))
+    if created_after is not None:
+        query = query.filter(models.Item.created_at >= created_after)
+    if created_before is not None:
+        query = query.filter(models.Item.created_at < created_before)
+    if updated_after is not None:
+        query = query.filter(models.Item.updated_at >= updated_after)
+    if updated_before is not None:
+        query = query.filter(models.Item.updated_at < updated_before)
+
+    # Keyset-пагінація: (колонка сортування, id) однаково в обох напрямках
+    descending = sort.startswith("-")
+    sort_key = sort.lstrip("-")
+    sort_column = ITEM_SORT_COLUMNS[sort_key]
+
+    if cursor:
+        values = decode_cursor(cursor)
+        if len(values) != 3 or values[0] != sort:
+            raise HTTPException(status_code=400, detail="Cursor does not match sort order")
+        _, last_value, last_id = values
+        # Підроблений чи застарілий курсор не має дійти до порівняння в SQL (500)
+        if not isinstance(last_id, int) or isinstance(last_id, bool) or not isinstance(last_value, str):
+            raise HTTPException(status_code=400, detail="Invalid cursor")
+        if sort_key != "name":
+            try:
+                last_value = datetime.fromisoformat(last_value)
+            except ValueError:
+                raise HTTPException(status_code=400, detail="Invalid cursor")
+        position = tuple_(sort_column, models.Item.id)
+        if descending:
+            query = query.filter(position < tuple_(last_value, last_id))
+        else:
+            query = query.filter(position > tuple_(last_value, last_id))
+
+    if descending:
+        query = query.order_by(sort_column.desc(), models.Item.id.desc())
+    else:
+        query = query.order_by(sort_column.asc(), models.Item.id.asc())
+
+    items = query.limit(limit + 1).all()
+    next_cursor = None
+    if len(items) > limit:
+        items = items[:limit]
+        last = items[-1]
+        next_cursor = encode_cursor(sort, getattr(last, sort_key), last.id)
+
+    if as_rows:
+        items = [serialization.item_row(row._mapping) for row in items]
+    return items, next_cursor
+
+
+def create_item(db: Session, principal, item: schemas.ItemCreate) -> models.Item:
+    # Перевірка доступу до коробки (без запиту, якщо коробка є в кешованому principal)
+    permissions.require_box_access(db, principal, item.box_id)
+
+    version = sync.next_version(db)
+    db_item = models.Item(**item.model_dump(), sync_version=version)
+    db.add(db_item)
+    etags.touch_boxes(db, [item.box_id])
+    stats.record(db, [(item.box_id, item.category, 1)])
+    db.flush()
+    events.publish_on_commit(db, "item", "created", item.box_id, [db_item.id], version)
+    db.commit()
+    db.refresh(db_item)
+    return db_item
+
+
+def update_item(db: Session, principal, item_id: int, item_update: schemas.ItemUpdate) -> models.Item:
+    item = permissions.require_item(db, principal, item_id)
+
+    version = sync.next_version(db)
+    old_category = item.category
+    for key, value in item_update.model_dump(exclude_unset=True).items():
+        setattr(item, key, value)
+    item.sync_version = version
+
+    if item.category != old_category:
+        stats.record(db, [(item.box_id, old_category, -1), (item.box_id, item.category, 1)])
+    etags.touch_boxes(db, [item.box_id])
+    events.publish_on_commit(db, "item", "updated", item.box_id, [item.id], version)
+    db.commit()
+    db.refresh(item)
+    return item
+
+
+def delete_item(db: Session, principal, item_id: int):
+    item = permissions.require_item(db, principal, item_id)
+
+    version = sync.next_version(db)
+    sync.item_deleted(db, version, [(item.id, item.box_id)])
+    db.delete(item)
+    stats.record(db, [(item.box_id, item.category, -1)])
+    etags.touch_boxes(db, [item.box_id])
+    events.publish_on_commit(db, "item", "deleted", item.box_id, [item.id], version)
+    db.commit()
+
+
+def batch_items(db: Session, principal, batch: schemas.ItemBatch) -> schemas.ItemBatchResponse:
+    # Доступ перевіряється один раз на кожну унікальну коробку/річ, а не на кожну операцію
+    box_ids = set()
+    item_ids = set()
+    for op in batch.operations:
+        if op.op == "create":
+            box_ids.add(op.item.box_id)
+        elif op.op == "move":
+            box_ids.add(op.box_id)
+            item_ids.update(op.ids)
+        else:
+            item_ids.add(op.id)
+
+    allowed_boxes = permissions.accessible_subset(db, principal, box_ids) if box_ids else set()
+    item_boxes = permissions.item_box_ids(db, principal, item_ids) if item_ids else {}
+    # 403 чи 404 — лише для того, що не пройшло перевірку доступу
+    denied_boxes = box_ids - allowed_boxes
+    if denied_boxes:
+        denied_boxes = set(db.scalars(select(models.Box.id).where(models.Box.id.in_(denied_boxes))))
+    denied_items = item_ids - item_boxes.keys()
+    if denied_items:
+        denied_items = set(db.scalars(select(models.Item.id).where(models.Item.id.in_(denied_items))))
+
+    # Операції застосовуються послідовно до "плану", а пишуться в БД пачками
+    results = []
+    creates = []
+    updates = {}
+    moves = {}
+    deleted = set()
+
+    def box_error(box_id):
+        if box_id in allowed_boxes:
+            return None
+        return (403, "Access denied") if box_id in denied_boxes else (404, "Box not found")
+
+    def item_error(item_id):
+        if item_id in deleted:
+            return 404, "Item not found"
+        if item_id in item_boxes:
+            return None
+        return (403, "Access denied") if item_id in denied_items else (404, "Item not found")
+
+    for index, op in enumerate(batch.operations):
+        ids = []
+        if op.op == "create":
+            error = box_error(op.item.box_id)
+            if not error:
+                creates.append((index, op.item.model_dump()))
+        elif op.op == "update":
+            ids = [op.id]
+            error = item_error(op.id)
+            if not error:
+                updates.setdefault(op.id, {}).update(op.changes.model_dump(exclude_unset=True))
+        elif op.op == "move":
+            ids = list(op.ids)
+            error = box_error(op.box_id) or next(filter(None, map(item_error, ids)), None)
+            if not error:
+                moves.update(dict.fromkeys(ids, op.box_id))
+        else:
+            ids = [op.id]
+            error = item_error(op.id)
+            if not error:
+                deleted.add(op.id)
+                updates.pop(op.id, None)
+                moves.pop(op.id, None)
+
+        status, detail = error or (200, None)
+        results.append(schemas.ItemBatchResult(index=index, op=op.op, status=status, ids=ids, detail=detail))
+
+    if batch.atomic and any(result.status >= 400 for result in results):
+        for result in results:
+            if result.status < 400:
+                result.status, result.detail = 424, "Not applied: another operation in the batch failed"
+        db.rollback()
+        return schemas.ItemBatchResponse(applied=False, results=results)
+
+    categories = _batch_categories(db, updates, moves, deleted)
+    version = sync.next_version(db)
+    now = datetime.utcnow()
+    if creates:
+        created_ids = db.scalars(
+            insert(models.Item).returning(models.Item.id, sort_by_parameter_order=True),
+            [{**values, "sync_version": version} for _, values in creates],
+        ).all()
+        for (index, _), item_id in zip(creates, created_ids):
+            results[index].ids = [item_id]
+
+    changed = [
+        {"id": item_id, **values, "updated_at": now, "sync_version": version}
+        for item_id, values in updates.items() if values
+    ]
+    if changed:
+        # ORM bulk UPDATE по первинному ключу: executemany, згруповано за набором колонок
+        db.execute(update(models.Item), changed)
+
+    targets = {}
+    for item_id, box_id in moves.items():
+        targets.setdefault(box_id, []).append(item_id)
+    for box_id, ids in targets.items():
+        db.execute(
+            update(models.Item)
+            .where(models.Item.id.in_(ids))
+            .values(box_id=box_id, updated_at=now, sync_version=version)
+            .execution_options(synchronize_session=False)
+        )
+
+    if deleted:
+        db.execute(
+            delete(models.Item)
+            .where(models.Item.id.in_(deleted))
+            .execution_options(synchronize_session=False)
+        )
+
+    # Надгробки: видалені речі й переміщені — для тих, хто бачить лише стару коробку
+    sync.item_deleted(db, version, [(item_id, item_boxes[item_id]) for item_id in deleted] + [
+        (item_id, item_boxes[item_id]) for item_id, box_id in moves.items() if item_boxes[item_id] != box_id
+    ])
+
+    _record_batch_stats(db, creates, updates, moves, deleted, item_boxes, categories)
+    touched = {values["box_id"] for _, values in creates} | set(targets)
+    touched.update(item_boxes[item_id] for item_id in set(updates) | set(moves) | deleted)
+    etags.touch_boxes(db, touched)
+    _publish_batch(db, version, [
+        ("created", values["box_id"], results[index].ids[0]) for index, values in creates
+    ] + [
+        ("updated", moves.get(item_id, item_boxes[item_id]), item_id) for item_id, values in updates.items() if values
+    ] + [
+        ("updated", box_id, item_id) for item_id, box_id in moves.items()
+    ] + [
+        ("deleted", item_boxes[item_id], item_id) for item_id in deleted
+    ] + [
+        ("deleted", item_boxes[item_id], item_id) for item_id, box_id in moves.items() if item_boxes[item_id] != box_id
+    ])
+    db.commit()
+    return schemas.ItemBatchResponse(applied=True, results=results)
+
+
+def _batch_categories(db: Session, updates, moves, deleted) -> dict:
+    # Стара категорія потрібна лише для речей, що змінять категорію, коробку чи зникнуть
+    affected = deleted | set(moves) | {item_id for item_id, values in updates.items() if "category" in values}
+    if not affected:
+        return {}
+    return dict(db.execute(select(models.Item.id, models.Item.category).where(models.Item.id.in_(affected))).all())
+
+
+def _record_batch_stats(db: Session, creates, updates, moves, deleted, item_boxes, categories):
+    changes = [(values["box_id"], values["category"], 1) for _, values in creates]
+    for item_id, category in categories.items():
+        old = (item_boxes[item_id], category)
+        new = None if item_id in deleted else (moves.get(item_id, old[0]), updates.get(item_id, {}).get("category", old[1]))
+        if new != old:
+            changes.append((*old, -1))
+            if new is not None:
+                changes.append((*new, 1))
+    stats.record(db, changes)
+
+
+def _publish_batch(db: Session, version: int, changes: List[Tuple[str, int, int]]):
+    # Одна подія на (операція, коробка), а не на кожну річ пакета
+    grouped = {}
+    for op, box_id, item_id in changes:
+        grouped.setdefault((op, box_id), set()).add(item_id)
+    for (op, box_id), ids in grouped.items():
+        events.publish_on_commit(db, "item", op, box_id, ids, version)
+
+
+def create_box(db: Session, principal, box: schemas.BoxCreate) -> models.Box:
+    qr_code = str(uuid.uuid4())[:8]
+    db_box = models.Box(
+        **box.model_dump(),
+        owner_id=principal.id,
+        qr_code=qr_code,
+        sync_version=sync.next_version(db),
+    )
+    db.add(db_box)
+    db.flush()
+    events.publish_on_commit(db, "box", "created", db_box.id, [db_box.id], db_box.sync_version, users=[principal.id])
+    db.commit()
+    db.refresh(db_box)
+    return db_box
+
+
+def find_box_by_qr(db: Session, principal, code: str) -> schemas.BoxQrLookup:
+    box = db.execute(
+        select(models.Box.id, models.Box.name, models.Box.location, models.Box.qr_code, models.Box.owner_id, models.Box.item_count)
+        .where(models.Box.qr_code == code)
+    ).first()
+    # Чужий код — теж 404: відповідь не підтверджує, що такий код існує
+    if box is None or not permissions.can_access(db, principal, box.id):
+        raise HTTPException(status_code=404, detail="Box not found")
+    return schemas.BoxQrLookup(
+        id=box.id, name=box.name, location=box.location, qr_code=box.qr_code,
+        item_count=box.item_count, is_shared=box.owner_id != principal.id,
+    )
+
+
+def qr_sheet_boxes(db: Session, principal, box_ids: Optional[List[int]], limit: int) -> List[Tuple[str, str, Optional[str]]]:
+    query = select(models.Box.id, models.Box.qr_code, models.Box.name, models.Box.location).where(
+        models.Box.qr_code.is_not(None)
+    )
+    if box_ids is None:
+        query = query.where(models.Box.id.in_(permissions.accessible_box_ids(principal.id))).order_by(models.Box.name, models.Box.id)
+    else:
+        requested = list(dict.fromkeys(box_ids))
+        denied = set(requested) - permissions.accessible_subset(db, principal, requested)
+        if denied:
+            raise HTTPException(status_code=404, detail=f"Boxes not found: {sorted(denied)}")
+        query = query.where(models.Box.id.in_(requested))
+    rows = db.execute(query.limit(limit + 1)).all()
+    if len(rows) > limit:
+        raise HTTPException(status_code=400, detail=f"At most {limit} labels per sheet")
+    if box_ids is not None:
+        # Порядок етикеток — як у запиті
+        position = {box_id: index for index, box_id in enumerate(requested)}
+        rows.sort(key=lambda row: position[row.id])
+    return [(row.qr_code, row.name, row.location) for row in rows]
+
+
+def update_box(db: Session, principal, box_id: int, box_update: schemas.BoxUpdate) -> models.Box:
+    box = permissions.require_box(db, principal, box_id, owner=True, action="update")
+
+    version = sync.next_version(db)
+    for key, value in box_update.model_dump(exclude_unset=True).items():
+        setattr(box, key, value)
+    box.sync_version = version
+
+    etags.touch_boxes(db, [box.id])
+    events.publish_on_commit(db, "box", "updated", box.id, [box.id], version)
+    db.commit()
+    db.refresh(box)
+    return box
+
+
+def delete_box(db: Session, principal, box_id: int):
+    box = permissions.require_box(db, principal, box_id, owner=True, action="delete")
+
+    version = sync.next_version(db)
+    sync.box_deleted(db, version, box)
+    db.execute(delete(models.ItemStat).where(models.ItemStat.box_id == box.id))
+    db.delete(box)
+    events.publish_on_commit(db, "box", "deleted", box.id, [box.id], version)
+    db.commit()
+
+
+def share_box(db: Session, principal, box_id: int, user_email: str):
+    permissions.require_box(db, principal, box_id, owner=True, action="share")
+
+    user_id = db.scalar(select(models.User.id).where(models.User.email == user_email))
+    if user_id is None:
+        raise HTTPException(status_code=404, detail="User not found")
+
+    # Точкова перевірка по індексу замість завантаження всього shared_with
+    share = models.box_shares.c
+    if db.scalar(select(exists().where(share.box_id == box_id, share.user_id == user_id))):
+        raise HTTPException(status_code=400, detail="Already shared")
+
+    version = sync.next_version(db)
+    db.execute(insert(models.box_shares).values(
+        box_id=box_id, user_id=user_id, shared_at=datetime.utcnow(), sync_version=version
+    ))
+    invalidate_on_commit(db, user_id)
+    events.publish_on_commit(db, "share", "created", box_id, [user_id], version, users=[user_id])
+    db.commit()
+
+
+def unshare_box(db: Session, principal, box_id: int, user_id: int):
+    permissions.require_box(db, principal, box_id, owner=True, action="unshare")
+
+    share = models.box_shares.c
+    version = sync.next_version(db)
+    removed = db.execute(delete(models.box_shares).where(share.box_id == box_id, share.user_id == user_id))
+    if removed.rowcount:
+        sync.share_revoked(db, version, box_id, user_id)
+        invalidate_on_commit(db, user_id)
+        events.publish_on_commit(db, "share", "deleted", box_id, [user_id], version, users=[user_id])
+        db.commit()
+    else:
+        # Нічого не змінилось: відпустити лічильник версій
+        db.rollback()
@@ -1,13 +1,164 @@
-from sqlalchemy import create_engine
+from sqlalchemy import create_engine, text
+from sqlalchemy.engine import make_url
+from sqlalchemy.exc import TimeoutError as PoolTimeoutError
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
 from sqlalchemy.orm import declarative_base
 from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import AsyncAdaptedQueuePool, NullPool, QueuePool
 import os
+import threading
+import time
+import uuid
 
 DATABASE_URL = os.getenv(
     "DATABASE_URL",
     "postgresql://mystorage_user:mystorage_password@db:5432/mystorage_db"
 )
+# Опційний async-режим: CRUD-ендпоінти на AsyncSession (asyncpg / aiosqlite)
+ASYNC_DATABASE = os.getenv("ASYNC_DATABASE", "false").lower() in ("1", "true", "yes")
+ASYNC_DRIVERS = {"postgresql": "postgresql+asyncpg", "sqlite": "sqlite+aiosqlite"}
 
-engine = create_engine(DATABASE_URL)
+# ============ POOL SETTINGS ============
+# Бюджет з'єднань на весь бекенд ділиться між uvicorn-воркерами (WEB_CONCURRENCY)
+# і, в async-режимі, між sync та async engine кожного воркера.
+WEB_CONCURRENCY = max(1, int(os.getenv("WEB_CONCURRENCY", "1")))
+DB_MAX_CONNECTIONS = int(os.getenv("DB_MAX_CONNECTIONS", "80"))
+DB_POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", "10"))
+DB_POOL_RECYCLE = int(os.getenv("DB_POOL_RECYCLE", "1800"))
+DB_POOL_PRE_PING = os.getenv("DB_POOL_PRE_PING", "true").lower() in ("1", "true", "yes")
+# PgBouncer (transaction pooling): без кешу prepared statements на сервері
+DB_PGBOUNCER = os.getenv("DB_PGBOUNCER", "false").lower() in ("1", "true", "yes")
+
+
+def pool_budget(engines_per_worker: int = 2 if ASYNC_DATABASE else 1) -> tuple:
+    per_engine = max(2, DB_MAX_CONNECTIONS // (WEB_CONCURRENCY * engines_per_worker))
+    pool_size = int(os.getenv("DB_POOL_SIZE", str(max(1, per_engine // 2))))
+    max_overflow = int(os.getenv("DB_MAX_OVERFLOW", str(max(0, per_engine - pool_size))))
+    return pool_size, max_overflow
+
+
+class PoolStats:
+    """Wait-time and timeout counters for connection checkouts from one pool."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.waits = 0
+        self.wait_seconds_total = 0.0
+        self.wait_seconds_max = 0.0
+        self.timeouts = 0
+
+    def record(self, seconds: float, timed_out: bool = False):
+        with self._lock:
+            self.waits += 1
+            self.wait_seconds_total += seconds
+            self.wait_seconds_max = max(self.wait_seconds_max, seconds)
+            if timed_out:
+                self.timeouts += 1
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            return {
+                "checkouts": self.waits,
+                "wait_ms_avg": round(self.wait_seconds_total / self.waits * 1000, 3) if self.waits else 0.0,
+                "wait_ms_max": round(self.wait_seconds_max * 1000, 3),
+                "timeouts": self.timeouts,
+            }
+
+
+class _TimedPoolMixin:
+    stats: PoolStats
+
+    def _do_get(self):
+        started = time.perf_counter()
+        try:
+            connection = super()._do_get()
+        except PoolTimeoutError:
+            self.stats.record(time.perf_counter() - started, timed_out=True)
+            raise
+        self.stats.record(time.perf_counter() - started)
+        return connection
+
+
+class TimedQueuePool(_TimedPoolMixin, QueuePool):
+    stats = PoolStats()
+
+
+class TimedAsyncQueuePool(_TimedPoolMixin, AsyncAdaptedQueuePool):
+    stats = PoolStats()
+
+
+def engine_options(url: str, pool_class) -> dict:
+    parsed = make_url(url)
+    if parsed.get_backend_name() == "sqlite" and parsed.database in (None, "", ":memory:"):
+        return {}
+    pool_size, max_overflow = pool_budget()
+    if pool_size <= 0:
+        # DB_POOL_SIZE=0: пул тримає PgBouncer, застосунок не кешує з'єднання
+        return {"poolclass": NullPool, "pool_pre_ping": DB_POOL_PRE_PING}
+    return {
+        "poolclass": pool_class,
+        "pool_size": pool_size,
+        "max_overflow": max_overflow,
+        "pool_timeout": DB_POOL_TIMEOUT,
+        "pool_recycle": DB_POOL_RECYCLE,
+        "pool_pre_ping": DB_POOL_PRE_PING,
+    }
+
+
+def async_database_url(url: str) -> str:
+    parsed = make_url(url)
+    driver = ASYNC_DRIVERS.get(parsed.get_backend_name(), parsed.drivername)
+    return parsed.set(drivername=driver).render_as_string(hide_password=False)
+
+
+def async_connect_args(url: str) -> dict:
+    if not DB_PGBOUNCER or make_url(url).get_backend_name() != "postgresql":
+        return {}
+    # asyncpg інакше готує іменовані statements, які PgBouncer передасть іншому клієнту
+    return {
+        "statement_cache_size": 0,
+        "prepared_statement_cache_size": 0,
+        "prepared_statement_name_func": lambda: f"__asyncpg_{uuid.uuid4()}__",
+    }
+
+
+def pool_status(engine) -> dict:
+    pool = engine.pool
+    status = {"class": type(pool).__name__}
+    if isinstance(pool, QueuePool):
+        status.update({
+            "size": pool.size(),
+            "checked_in": pool.checkedin(),
+            "checked_out": pool.checkedout(),
+            "overflow": max(0, pool.overflow()),
+            "max_overflow": pool._max_overflow,
+        })
+    if isinstance(pool, _TimedPoolMixin):
+        status.update(pool.stats.snapshot())
+    return status
+
+
+def ping(engine):
+    with engine.connect() as connection:
+        connection.execute(text("SELECT 1"))
+
+
+async def async_ping(engine):
+    async with engine.connect() as connection:
+        await connection.execute(text("SELECT 1"))
+
+
+engine = create_engine(DATABASE_URL, **engine_options(DATABASE_URL, TimedQueuePool))
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
-Base = declarative_base()
\ No newline at end of file
+Base = declarative_base()
+
+async_engine = None
+AsyncSessionLocal = None
+if ASYNC_DATABASE:
+    async_url = async_database_url(DATABASE_URL)
+    async_engine = create_async_engine(
+        async_url,
+        connect_args=async_connect_args(async_url),
+        **engine_options(async_url, TimedAsyncQueuePool),
+    )
+    AsyncSessionLocal = async_sessionmaker(async_engine, autoflush=False, expire_on_commit=False)
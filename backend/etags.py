@@ -0,0 +1,65 @@
+import hashlib
+from typing import Iterable, Optional
+
+from fastapi import Response
+from sqlalchemy import select, update
+from sqlalchemy.orm import Session
+
+import models
+from permissions import accessible_box_ids
+
+# Версія колекції користувача = набір доступних коробок + їхні content_version.
+# content_version збільшується при кожному записі в коробку чи її речі (crud.py),
+# тож перевірка ETag — один легкий запит замість повної вибірки й серіалізації.
+
+CACHE_CONTROL = "private, no-cache"
+
+
+def touch_boxes(db: Session, box_ids: Iterable[int]):
+    box_ids = {box_id for box_id in box_ids if box_id is not None}
+    if box_ids:
+        db.execute(
+            update(models.Box)
+            .where(models.Box.id.in_(box_ids))
+            # updated_at лишається як є: зміна речей не є зміною самої коробки
+            .values(content_version=models.Box.content_version + 1, updated_at=models.Box.updated_at)
+            .execution_options(synchronize_session=False)
+        )
+
+
+def collection_etag(db: Session, principal, *params) -> str:
+    rows = db.execute(
+        select(models.Box.id, models.Box.content_version)
+        .where(models.Box.id.in_(accessible_box_ids(principal.id)))
+        .order_by(models.Box.id)
+    )
+    digest = hashlib.blake2b(digest_size=16)
+    # principal.id: is_shared у відповіді залежить від того, хто дивиться
+    digest.update(repr((principal.id, params)).encode("utf-8"))
+    for box_id, version in rows:
+        digest.update(b"%d:%d;" % (box_id, version or 0))
+    # Слабкий тег: GZipMiddleware віддає ті самі дані то стиснутими, то ні, а сильний
+    # ETag мусив би відрізнятися для кожного кодування
+    return f'W/"{digest.hexdigest()}"'
+
+
+def _opaque(tag: str) -> str:
+    return tag[2:] if tag.startswith("W/") else tag
+
+
+def matches(if_none_match: Optional[str], etag: str) -> bool:
+    # Слабке порівняння (RFC 9110), як і належить для If-None-Match: W/ не враховується
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    return _opaque(etag) in (_opaque(tag.strip()) for tag in if_none_match.split(","))
+
+
+def not_modified(etag: str) -> Response:
+    return Response(status_code=304, headers={"ETag": etag, "Cache-Control": CACHE_CONTROL})
+
+
+def set_headers(response: Response, etag: str):
+    response.headers["ETag"] = etag
+    response.headers["Cache-Control"] = CACHE_CONTROL
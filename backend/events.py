@@ -0,0 +1,302 @@
+import asyncio
+import logging
+import os
+import threading
+import time
+from collections import defaultdict
+from select import select as wait_readable
+from typing import Dict, Iterable, List, Optional, Set
+
+import orjson
+from sqlalchemy import event, func, select
+from sqlalchemy.orm import Session
+
+import database
+import metrics
+import principals
+
+# Push змін (/api/events, Server-Sent Events). crud.py додає події до сесії, після
+# commit вони розсилаються підписникам — тим, хто має доступ до коробки. Подія лише
+# каже, що змінилось (тип, коробка, id, версія); дані клієнт бере з /api/sync.
+#
+# Між uvicorn-воркерами події йдуть через Postgres NOTIFY: він транзакційний, тож
+# подія з'являється лише після commit і в порядку commit. Кожен воркер слухає канал
+# окремим з'єднанням і роздає події своїм підписникам. На інших БД (тести, SQLite)
+# події роздаються лише в межах процесу.
+
+logger = logging.getLogger(__name__)
+
+CHANNEL = "mystorage_events"
+# Повільний клієнт: черга переповнилась — події відкидаються, клієнт отримує resync
+EVENT_QUEUE_SIZE = int(os.getenv("EVENT_QUEUE_SIZE", "100"))
+MAX_EVENT_STREAMS = int(os.getenv("MAX_EVENT_STREAMS", "1000"))
+KEEPALIVE_SECONDS = float(os.getenv("EVENT_KEEPALIVE_SECONDS", "15"))
+# Не довше за життя JWT: EventSource перепідключиться й пройде автентифікацію знову
+STREAM_MAX_SECONDS = float(os.getenv("EVENT_STREAM_MAX_SECONDS", "1800"))
+# Межа payload NOTIFY — 8000 байт
+NOTIFY_MAX_BYTES = 7900
+LISTEN_RETRY_SECONDS = 5
+
+RESYNC = {"type": "resync"}
+
+
+# ============ PUBLISHING ============
+
+def publish_on_commit(db: Session, type: str, op: str, box_id: int, ids: Iterable[int], version: int,
+                      users: Iterable[int] = ()):
+    # users — кому подія потрібна поза підпискою на коробку (новий доступ, нова коробка)
+    ids = sorted(set(ids))
+    if ids:
+        db.info.setdefault("change_events", []).append(
+            {"type": type, "op": op, "box_id": box_id, "ids": ids, "version": version, "users": sorted(set(users))}
+        )
+
+
+def _notify_payloads(events: List[dict]) -> List[bytes]:
+    payloads = []
+    chunk = []
+    size = 2
+    for change in events:
+        encoded = orjson.dumps(change)
+        if len(encoded) + 2 > NOTIFY_MAX_BYTES:
+            # Забагато id для одного повідомлення: клієнт перечитає коробку цілком
+            encoded = orjson.dumps({**change, "ids": None})
+        if chunk and size + len(encoded) + 1 > NOTIFY_MAX_BYTES:
+            payloads.append(b"[" + b",".join(chunk) + b"]")
+            chunk, size = [], 2
+        chunk.append(encoded)
+        size += len(encoded) + 1
+    if chunk:
+        payloads.append(b"[" + b",".join(chunk) + b"]")
+    return payloads
+
+
+def _uses_notify(session: Session) -> bool:
+    bind = session.get_bind()
+    return bind is not None and bind.dialect.name == "postgresql"
+
+
+@event.listens_for(Session, "before_commit")
+def _notify_in_transaction(session):
+    events = session.info.get("change_events")
+    if events and _uses_notify(session):
+        session.info.pop("change_events")
+        for payload in _notify_payloads(events):
+            session.execute(select(func.pg_notify(CHANNEL, payload.decode("utf-8"))))
+
+
+@event.listens_for(Session, "after_commit")
+def _publish_locally(session):
+    events = session.info.pop("change_events", None)
+    if events:
+        broker.publish(events)
+
+
+@event.listens_for(Session, "after_rollback")
+def _discard_events(session):
+    session.info.pop("change_events", None)
+
+
+# ============ BROKER ============
+
+class Subscriber:
+    def __init__(self, user_id: int, box_ids: Iterable[int], maxsize: int = EVENT_QUEUE_SIZE):
+        self.user_id = user_id
+        self.box_ids: Set[int] = set(box_ids)
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize)
+        self.overflowed = False
+
+    def offer(self, change: dict):
+        if self.overflowed:
+            return
+        try:
+            self.queue.put_nowait(change)
+        except asyncio.QueueFull:
+            # Не чекаємо на клієнта й не тримаємо пам'ять: черга скидається, клієнт
+            # отримує resync і дочитує пропущене через /api/sync
+            while not self.queue.empty():
+                self.queue.get_nowait()
+            self.queue.put_nowait(RESYNC)
+            self.overflowed = True
+            metrics.EVENT_STREAM_OVERFLOWS.inc()
+
+    async def get(self, timeout: float) -> Optional[dict]:
+        try:
+            change = await asyncio.wait_for(self.queue.get(), timeout)
+        except asyncio.TimeoutError:
+            return None
+        if change is RESYNC:
+            self.overflowed = False
+        return change
+
+
+class Broker:
+    """Per-worker fan-out of change events to SSE subscribers by box and user."""
+
+    def __init__(self):
+        self.loop: Optional[asyncio.AbstractEventLoop] = None
+        self.by_box: Dict[int, Set[Subscriber]] = defaultdict(set)
+        self.by_user: Dict[int, Set[Subscriber]] = defaultdict(set)
+
+    @property
+    def subscribers(self) -> int:
+        return sum(len(subscribers) for subscribers in self.by_user.values())
+
+    def subscribe(self, user_id: int, box_ids: Iterable[int]) -> Subscriber:
+        # Усі зміни підписок і доставка — в потоці event loop, без блокувань
+        self.loop = asyncio.get_running_loop()
+        subscriber = Subscriber(user_id, box_ids)
+        self.by_user[user_id].add(subscriber)
+        for box_id in subscriber.box_ids:
+            self.by_box[box_id].add(subscriber)
+        return subscriber
+
+    def unsubscribe(self, subscriber: Subscriber):
+        self._discard(self.by_user, subscriber.user_id, subscriber)
+        for box_id in subscriber.box_ids:
+            self._discard(self.by_box, box_id, subscriber)
+
+    @staticmethod
+    def _discard(index: dict, key: int, subscriber: Subscriber):
+        subscribers = index.get(key)
+        if subscribers is not None:
+            subscribers.discard(subscriber)
+            if not subscribers:
+                del index[key]
+
+    def publish(self, events: List[dict]):
+        # Викликається з будь-якого потоку (threadpool, слухач NOTIFY)
+        loop = self.loop
+        if loop is None or loop.is_closed():
+            return
+        loop.call_soon_threadsafe(self.deliver, events)
+
+    def resync_all(self):
+        loop = self.loop
+        if loop is not None and not loop.is_closed():
+            loop.call_soon_threadsafe(self._resync_all)
+
+    def _resync_all(self):
+        for subscribers in list(self.by_user.values()):
+            for subscriber in list(subscribers):
+                subscriber.offer(RESYNC)
+
+    def deliver(self, events: List[dict]):
+        for change in events:
+            users = change.get("users") or ()
+            targets = set(self.by_box.get(change["box_id"], ()))
+            for user_id in users:
+                targets.update(self.by_user.get(user_id, ()))
+            if not targets:
+                continue
+            message = {key: value for key, value in change.items() if key != "users"}
+            for subscriber in targets:
+                subscriber.offer(message)
+                self._follow(subscriber, change, users)
+
+    def _follow(self, subscriber: Subscriber, change: dict, users):
+        # Доступ змінився: підписка йде за ним, щоб наступні події коробки доходили (чи ні)
+        box_id = change["box_id"]
+        gained = subscriber.user_id in users and change["op"] == "created" and change["type"] in ("box", "share")
+        lost = change["type"] == "box" and change["op"] == "deleted" or (
+            change["type"] == "share" and change["op"] == "deleted" and subscriber.user_id in users
+        )
+        if gained and box_id not in subscriber.box_ids:
+            subscriber.box_ids.add(box_id)
+            self.by_box[box_id].add(subscriber)
+        elif lost and box_id in subscriber.box_ids:
+            subscriber.box_ids.discard(box_id)
+            self._discard(self.by_box, box_id, subscriber)
+
+
+broker = Broker()
+
+
+def format_event(change: dict) -> bytes:
+    name = "resync" if change is RESYNC else "change"
+    return b"event: " + name.encode() + b"\ndata: " + orjson.dumps(change) + b"\n\n"
+
+
+async def stream(user_id: int, box_ids: Iterable[int], keepalive: float = KEEPALIVE_SECONDS,
+                 max_seconds: float = STREAM_MAX_SECONDS):
+    # Підписка — всередині генератора: якщо клієнт відключився до старту потоку,
+    # finally не виконався б і підписник лишився б у брокері
+    subscriber = broker.subscribe(user_id, box_ids)
+    try:
+        # retry: пауза перед перепідключенням EventSource; ready — підписка активна,
+        # клієнт може дочитати зміни через /api/sync без ризику їх пропустити
+        yield b"retry: 5000\nevent: ready\ndata: {}\n\n"
+        deadline = time.monotonic() + max_seconds
+        while time.monotonic() < deadline:
+            change = await subscriber.get(min(keepalive, max(0.0, deadline - time.monotonic())))
+            if change is None:
+                # Коментар SSE: тримає з'єднання крізь проксі й виявляє мертвих клієнтів
+                yield b": keepalive\n\n"
+            else:
+                yield format_event(change)
+    finally:
+        broker.unsubscribe(subscriber)
+
+
+# ============ CROSS-WORKER FAN-OUT ============
+
+class _Listener:
+    """Background thread that LISTENs on the Postgres channels and feeds the broker and principal cache."""
+
+    def __init__(self):
+        self._thread: Optional[threading.Thread] = None
+        self._stop = threading.Event()
+
+    def start(self, engine=None):
+        engine = engine or database.engine
+        if engine.dialect.name != "postgresql" or self._thread is not None:
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, args=(engine,), name="event-listener", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        if self._thread is not None:
+            self._stop.set()
+            self._thread.join(timeout=LISTEN_RETRY_SECONDS + 1)
+            self._thread = None
+
+    def _run(self, engine):
+        connected_before = False
+        while not self._stop.is_set():
+            connection = None
+            try:
+                # Окреме з'єднання поза пулом: LISTEN живе весь час роботи воркера
+                args, kwargs = engine.dialect.create_connect_args(engine.url)
+                connection = engine.dialect.connect(*args, **kwargs)
+                connection.autocommit = True
+                with connection.cursor() as cursor:
+                    cursor.execute(f"LISTEN {CHANNEL}")
+                    cursor.execute(f"LISTEN {principals.INVALIDATION_CHANNEL}")
+                if connected_before:
+                    # Поки з'єднання не було, події губились — клієнти дочитують через /api/sync,
+                    # а кеш principals міг пропустити скидання
+                    broker.resync_all()
+                    principals.principal_cache.clear()
+                connected_before = True
+                while not self._stop.is_set():
+                    if wait_readable([connection], [], [], 1.0)[0]:
+                        connection.poll()
+                        while connection.notifies:
+                            notification = connection.notifies.pop(0)
+                            if notification.channel == principals.INVALIDATION_CHANNEL:
+                                principals.apply_remote_invalidation(notification.payload)
+                            else:
+                                broker.publish(orjson.loads(notification.payload))
+            except Exception:
+                logger.exception("Event listener lost its database connection, retrying")
+                self._stop.wait(LISTEN_RETRY_SECONDS)
+            finally:
+                if connection is not None:
+                    try:
+                        connection.close()
+                    except Exception:
+                        pass
+
+
+listener = _Listener()
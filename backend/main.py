@@ -1,21 +1,64 @@
-from fastapi import FastAPI, Depends, HTTPException, UploadFile, File
+from fastapi import FastAPI, Depends, HTTPException, UploadFile, File, Header, Query, Response
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.staticfiles import StaticFiles
+from fastapi.middleware.gzip import GZipMiddleware
+from fastapi.responses import FileResponse, ORJSONResponse, PlainTextResponse, RedirectResponse, StreamingResponse
+from starlette.concurrency import run_in_threadpool
+from sqlalchemy.exc import SQLAlchemyError
 from sqlalchemy.orm import Session
-from typing import List, Optional
+from typing import Annotated, List, Literal, Optional
+from contextlib import asynccontextmanager
+from datetime import datetime
+import anyio
+import functools
 import models
 import schemas
 import auth
+import blobs
+import database
+from pagination import encode_cursor, decode_cursor
+import search
+import serialization
+import stats
+import storage
+import sync
+import crud
+import etags
+import events
+import media
+import metrics
+import permissions
+import qrlabels
+import ratelimit
+from permissions import accessible_box_ids
+from principals import Principal, principal_cache
+import thumbnails
+import transfer
+from passwords import hasher
+import uploads
+from uploads import UploadSizeLimitMiddleware, store_upload
 import os
-import uuid
-import shutil
 from pathlib import Path
 
-app = FastAPI(title="MyStorage API")
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    metrics.flusher.start()
+    events.listener.start()
+    yield
+    events.listener.stop()
+    metrics.flusher.stop()
+    thumbnails.shutdown_pool()
+    hasher.shutdown()
+    if database.async_engine is not None:
+        await database.async_engine.dispose()
+
+
+app = FastAPI(title="MyStorage API", lifespan=lifespan, default_response_class=ORJSONResponse)
 
 cors_origins_raw = os.getenv("CORS_ORIGINS", "http://localhost,http://127.0.0.1")
 allow_origins = [origin.strip() for origin in cors_origins_raw.split(",") if origin.strip()]
 
+# Найвнутрішній: відмова (429/503) ще до роботи маршруту, але з CORS-заголовками й у метриках
+app.add_middleware(ratelimit.RateLimitMiddleware)
 # CORS
 app.add_middleware(
     CORSMiddleware,
@@ -23,12 +66,31 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Next-Cursor", "ETag"],
 )
+# Стискаються лише відповіді від GZIP_MIN_SIZE байт; дрібний JSON не варто CPU
+app.add_middleware(GZipMiddleware, minimum_size=int(os.getenv("GZIP_MIN_SIZE", "1024")))
+app.add_middleware(UploadSizeLimitMiddleware, limits={
+    "/api/upload": uploads.MAX_UPLOAD_BYTES,
+    "/api/import": transfer.MAX_IMPORT_BYTES,
+})
+# Найзовнішній: бачить повний час запиту й розмір відповіді після gzip
+app.add_middleware(metrics.MetricsMiddleware)
+
+if database.ASYNC_DATABASE:
+    import async_api
+    # Маршрути роутера реєструються першими й мають пріоритет над sync-версіями нижче
+    app.include_router(async_api.router)
 
 # Папка для uploads
-UPLOAD_DIR = Path("/app/media/uploads")
+UPLOAD_DIR = Path(os.getenv("UPLOAD_DIR", "/app/media/uploads"))
 UPLOAD_DIR.mkdir(parents=True, exist_ok=True)
-app.mount("/uploads", StaticFiles(directory=str(UPLOAD_DIR)), name="uploads")
+DERIVATIVE_DIR = UPLOAD_DIR / "derivatives"
+DERIVATIVE_DIR.mkdir(exist_ok=True)
+QR_DIR = UPLOAD_DIR / "qr"
+QR_DIR.mkdir(exist_ok=True)
+# Оригінали фото: UPLOAD_DIR або S3 (STORAGE_BACKEND); похідні й QR — завжди локальний кеш
+STORAGE = storage.from_env(UPLOAD_DIR)
 
 @app.get("/")
 def read_root():
@@ -36,21 +98,54 @@ def read_root():
 
 @app.get("/api/health")
 def health_check():
-    return {"status": "ok"}
+    return {
+        "status": "ok",
+        "principal_cache": principal_cache.stats(),
+        "password_hasher": hasher.stats(),
+        "load_shedder": ratelimit.load_shedder.stats(),
+    }
+
+@app.get("/api/health/pool")
+def pool_health():
+    pools = {"sync": database.pool_status(database.engine)}
+    if database.async_engine is not None:
+        pools["async"] = database.pool_status(database.async_engine.sync_engine)
+    return pools
+
+READINESS_TIMEOUT = float(os.getenv("READINESS_TIMEOUT", "2"))
+
+@app.get("/api/health/ready")
+async def readiness_check(response: Response):
+    # Справжня перевірка: з'єднання з пулу + SELECT 1, з обмеженням часу.
+    # Вичерпаний пул або недоступна БД -> 503, балансувальник знімає воркер з ротації
+    try:
+        with anyio.fail_after(READINESS_TIMEOUT):
+            await anyio.to_thread.run_sync(database.ping, database.engine, cancellable=True)
+            if database.async_engine is not None:
+                await database.async_ping(database.async_engine)
+    except (TimeoutError, SQLAlchemyError, OSError) as exc:
+        response.status_code = 503
+        detail = "database check timed out" if isinstance(exc, TimeoutError) else type(exc).__name__
+        return {"status": "unavailable", "detail": detail, "pool": database.pool_status(database.engine)}
+    return {"status": "ready", "pool": database.pool_status(database.engine)}
+
+@app.get("/api/metrics", response_class=PlainTextResponse)
+async def metrics_endpoint():
+    # Формат Prometheus text 0.0.4; сума по всіх воркерах з METRICS_DIR
+    snapshots = await run_in_threadpool(metrics.collect)
+    return PlainTextResponse(metrics.render(snapshots), media_type="text/plain; version=0.0.4; charset=utf-8")
 
 # ============ AUTH ============
 
-@app.post("/api/auth/register", response_model=schemas.User)
-def register(user: schemas.UserCreate, db: Session = Depends(auth.get_db)):
-    # Перевірка чи існує користувач
-    db_user = db.query(models.User).filter(
+def _find_existing_user(db: Session, user: schemas.UserCreate) -> bool:
+    exists = db.query(models.User.id).filter(
         (models.User.email == user.email) | (models.User.username == user.username)
-    ).first()
-    if db_user:
-        raise HTTPException(status_code=400, detail="User already exists")
-    
-    # Створення користувача
-    hashed_password = auth.get_password_hash(user.password)
+    ).first() is not None
+    # Звільняємо з'єднання з пулу на час bcrypt
+    db.rollback()
+    return exists
+
+def _create_user(db: Session, user: schemas.UserCreate, hashed_password: str) -> models.User:
     db_user = models.User(
         username=user.username,
         email=user.email,
@@ -61,259 +156,443 @@ def register(user: schemas.UserCreate, db: Session = Depends(auth.get_db)):
     db.refresh(db_user)
     return db_user
 
+def _find_login(db: Session, email: str):
+    db_user = db.query(models.User.id, models.User.password_hash).filter(models.User.email == email).first()
+    db.rollback()
+    return db_user
+
+# async: на час bcrypt маршрут лише чекає future пулу процесів і не тримає потік
+# спільного threadpool; запити до БД — у threadpool, як у sync-маршрутах
+@app.post("/api/auth/register", response_model=schemas.User)
+async def register(user: schemas.UserCreate, db: Session = Depends(auth.get_db)):
+    # Перевірка чи існує користувач
+    if await run_in_threadpool(_find_existing_user, db, user):
+        raise HTTPException(status_code=400, detail="User already exists")
+
+    # Створення користувача
+    hashed_password = await auth.get_password_hash_async(user.password)
+    return await run_in_threadpool(_create_user, db, user, hashed_password)
+
 @app.post("/api/auth/login", response_model=schemas.Token)
-def login(user: schemas.UserLogin, db: Session = Depends(auth.get_db)):
-    db_user = db.query(models.User).filter(models.User.email == user.email).first()
-    if not db_user or not auth.verify_password(user.password, db_user.password_hash):
+async def login(user: schemas.UserLogin, db: Session = Depends(auth.get_db)):
+    db_user = await run_in_threadpool(_find_login, db, user.email)
+    if not db_user or not await auth.verify_password_async(user.password, db_user.password_hash):
         raise HTTPException(status_code=400, detail="Incorrect email or password")
     
     access_token = auth.create_access_token(data={"sub": str(db_user.id)})
     return {"access_token": access_token, "token_type": "bearer"}
 
 @app.get("/api/auth/me", response_model=schemas.User)
-def get_me(current_user: models.User = Depends(auth.get_current_user)):
+def get_me(current_user: Principal = Depends(auth.get_current_user)):
     return current_user
 
 # ============ BOXES ============
 
 @app.get("/api/boxes", response_model=List[schemas.Box])
 def get_boxes(
-    current_user: models.User = Depends(auth.get_current_user),
+    response: Response,
+    view: crud.BoxView = "full",
+    if_none_match: Annotated[Optional[str], Header()] = None,
+    current_user: Principal = Depends(auth.get_current_user),
     db: Session = Depends(auth.get_db)
 ):
-    # Власні коробки + shared коробки
-    own_boxes = db.query(models.Box).filter(models.Box.owner_id == current_user.id).all()
-    shared_boxes = current_user.shared_boxes
-    
-    all_boxes = []
-    for box in own_boxes:
-        box_dict = schemas.Box.from_orm(box)
-        box_dict.is_shared = False
-        all_boxes.append(box_dict)
-    
-    for box in shared_boxes:
-        box_dict = schemas.Box.from_orm(box)
-        box_dict.is_shared = True
-        all_boxes.append(box_dict)
-    
-    return all_boxes
+    etag = etags.collection_etag(db, current_user, "boxes", view, media.signing_epoch())
+    if etags.matches(if_none_match, etag):
+        return etags.not_modified(etag)
+    etags.set_headers(response, etag)
+    return serialization.json_response(crud.list_boxes(db, current_user, view), response)
 
 @app.post("/api/boxes", response_model=schemas.Box)
 def create_box(
     box: schemas.BoxCreate,
-    current_user: models.User = Depends(auth.get_current_user),
+    current_user: Principal = Depends(auth.get_current_user),
+    db: Session = Depends(auth.get_db)
+):
+    return crud.create_box(db, current_user, box)
+
+@app.get("/api/boxes/by-qr/{code}", response_model=schemas.BoxQrLookup)
+def get_box_by_qr(
+    code: str,
+    current_user: Principal = Depends(auth.get_current_user),
+    db: Session = Depends(auth.get_db)
+):
+    return crud.find_box_by_qr(db, current_user, code)
+
+@app.post("/api/boxes/qr-sheet")
+def get_qr_sheet(
+    sheet: schemas.QrSheetRequest,
+    current_user: Principal = Depends(auth.get_current_user),
     db: Session = Depends(auth.get_db)
 ):
-    qr_code = str(uuid.uuid4())[:8]
-    db_box = models.Box(
-        **box.dict(),
-        owner_id=current_user.id,
-        qr_code=qr_code
+    labels = crud.qr_sheet_boxes(db, current_user, sheet.box_ids, qrlabels.MAX_SHEET_LABELS)
+    if not labels:
+        raise HTTPException(status_code=404, detail="No boxes to print")
+    return Response(
+        qrlabels.render_sheet(QR_DIR, labels),
+        media_type="application/pdf",
+        headers={"Content-Disposition": 'attachment; filename="mystorage-qr-labels.pdf"'},
     )
-    db.add(db_box)
-    db.commit()
-    db.refresh(db_box)
-    return db_box
+
+@app.get("/api/boxes/{box_id}/qr")
+def get_box_qr(
+    box_id: int,
+    format: Literal["png", "svg"] = "png",
+    current_user: Principal = Depends(auth.get_current_user),
+    db: Session = Depends(auth.get_db)
+):
+    box = permissions.require_box(db, current_user, box_id)
+    if not box.qr_code:
+        raise HTTPException(status_code=404, detail="Box has no QR code")
+    path = qrlabels.label_path(QR_DIR, box.qr_code, format)
+    # Код коробки не змінюється — мітку можна кешувати назавжди
+    return FileResponse(path, media_type=qrlabels.QR_FORMATS[format], headers={"Cache-Control": "private, max-age=31536000, immutable"})
 
 @app.get("/api/boxes/{box_id}", response_model=schemas.Box)
 def get_box(
     box_id: int,
-    current_user: models.User = Depends(auth.get_current_user),
+    current_user: Principal = Depends(auth.get_current_user),
     db: Session = Depends(auth.get_db)
 ):
-    box = db.query(models.Box).filter(models.Box.id == box_id).first()
-    if not box:
-        raise HTTPException(status_code=404, detail="Box not found")
-    
-    # Перевірка доступу
-    if box.owner_id != current_user.id and current_user not in box.shared_with:
-        raise HTTPException(status_code=403, detail="Access denied")
-    
-    return box
+    return permissions.require_box(db, current_user, box_id)
 
 @app.put("/api/boxes/{box_id}", response_model=schemas.Box)
 def update_box(
     box_id: int,
     box_update: schemas.BoxUpdate,
-    current_user: models.User = Depends(auth.get_current_user),
+    current_user: Principal = Depends(auth.get_current_user),
     db: Session = Depends(auth.get_db)
 ):
-    box = db.query(models.Box).filter(models.Box.id == box_id).first()
-    if not box:
-        raise HTTPException(status_code=404, detail="Box not found")
-    
-    if box.owner_id != current_user.id:
-        raise HTTPException(status_code=403, detail="Only owner can update")
-    
-    for key, value in box_update.dict(exclude_unset=True).items():
-        setattr(box, key, value)
-    
-    db.commit()
-    db.refresh(box)
-    return box
+    return crud.update_box(db, current_user, box_id, box_update)
 
 @app.delete("/api/boxes/{box_id}")
 def delete_box(
     box_id: int,
-    current_user: models.User = Depends(auth.get_current_user),
+    current_user: Principal = Depends(auth.get_current_user),
     db: Session = Depends(auth.get_db)
 ):
-    box = db.query(models.Box).filter(models.Box.id == box_id).first()
-    if not box:
-        raise HTTPException(status_code=404, detail="Box not found")
-    
-    if box.owner_id != current_user.id:
-        raise HTTPException(status_code=403, detail="Only owner can delete")
-    
-    db.delete(box)
-    db.commit()
+    crud.delete_box(db, current_user, box_id)
     return {"message": "Box deleted"}
 
 @app.post("/api/boxes/{box_id}/share")
 def share_box(
     box_id: int,
     share_data: schemas.BoxShare,
-    current_user: models.User = Depends(auth.get_current_user),
+    current_user: Principal = Depends(auth.get_current_user),
     db: Session = Depends(auth.get_db)
 ):
-    box = db.query(models.Box).filter(models.Box.id == box_id).first()
-    if not box:
-        raise HTTPException(status_code=404, detail="Box not found")
-    
-    if box.owner_id != current_user.id:
-        raise HTTPException(status_code=403, detail="Only owner can share")
-    
-    user_to_share = db.query(models.User).filter(models.User.email == share_data.user_email).first()
-    if not user_to_share:
-        raise HTTPException(status_code=404, detail="User not found")
-    
-    if user_to_share in box.shared_with:
-        raise HTTPException(status_code=400, detail="Already shared")
-    
-    box.shared_with.append(user_to_share)
-    db.commit()
+    crud.share_box(db, current_user, box_id, share_data.user_email)
     return {"message": "Box shared successfully"}
 
 @app.delete("/api/boxes/{box_id}/share/{user_id}")
 def unshare_box(
     box_id: int,
     user_id: int,
-    current_user: models.User = Depends(auth.get_current_user),
+    current_user: Principal = Depends(auth.get_current_user),
     db: Session = Depends(auth.get_db)
 ):
-    box = db.query(models.Box).filter(models.Box.id == box_id).first()
-    if not box:
-        raise HTTPException(status_code=404, detail="Box not found")
-    
-    if box.owner_id != current_user.id:
-        raise HTTPException(status_code=403, detail="Only owner can unshare")
-    
-    user_to_remove = db.query(models.User).filter(models.User.id == user_id).first()
-    if user_to_remove in box.shared_with:
-        box.shared_with.remove(user_to_remove)
-        db.commit()
-    
+    crud.unshare_box(db, current_user, box_id, user_id)
     return {"message": "Access removed"}
 
 # ============ ITEMS ============
 
 @app.get("/api/items", response_model=List[schemas.Item])
 def get_items(
+    response: Response,
     box_id: Optional[int] = None,
-    current_user: models.User = Depends(auth.get_current_user),
+    category: Optional[str] = None,
+    name_prefix: Optional[str] = None,
+    created_after: Optional[datetime] = None,
+    created_before: Optional[datetime] = None,
+    updated_after: Optional[datetime] = None,
+    updated_before: Optional[datetime] = None,
+    sort: crud.ItemSort = "created_at",
+    limit: Annotated[int, Query(ge=1, le=500)] = 100,
+    cursor: Optional[str] = None,
+    if_none_match: Annotated[Optional[str], Header()] = None,
+    current_user: Principal = Depends(auth.get_current_user),
     db: Session = Depends(auth.get_db)
 ):
-    accessible_box_ids = [box.id for box in current_user.boxes] + [box.id for box in current_user.shared_boxes]
-
-    if box_id is not None and box_id not in accessible_box_ids:
-        raise HTTPException(status_code=403, detail="Access denied")
-
-    if not accessible_box_ids:
-        return []
-
-    query = db.query(models.Item).filter(models.Item.box_id.in_(accessible_box_ids))
-
-    if box_id is not None:
-        query = query.filter(models.Item.box_id == box_id)
+    filters = dict(
+        box_id=box_id,
+        category=category,
+        name_prefix=name_prefix,
+        created_after=created_after,
+        created_before=created_before,
+        updated_after=updated_after,
+        updated_before=updated_before,
+        sort=sort,
+        limit=limit,
+        cursor=cursor,
+    )
+    etag = etags.collection_etag(db, current_user, "items", sorted(filters.items()), media.signing_epoch())
+    if etags.matches(if_none_match, etag):
+        return etags.not_modified(etag)
 
-    return query.all()
+    items, next_cursor = crud.list_items(db, current_user, as_rows=True, **filters)
+    etags.set_headers(response, etag)
+    if next_cursor:
+        response.headers["X-Next-Cursor"] = next_cursor
+    return serialization.json_response(items, response)
 
 @app.post("/api/items", response_model=schemas.Item)
 def create_item(
     item: schemas.ItemCreate,
-    current_user: models.User = Depends(auth.get_current_user),
+    current_user: Principal = Depends(auth.get_current_user),
     db: Session = Depends(auth.get_db)
 ):
-    # Перевірка доступу до коробки
-    box = db.query(models.Box).filter(models.Box.id == item.box_id).first()
-    if not box:
-        raise HTTPException(status_code=404, detail="Box not found")
-    
-    if box.owner_id != current_user.id and current_user not in box.shared_with:
-        raise HTTPException(status_code=403, detail="Access denied")
-    
-    db_item = models.Item(**item.dict())
-    db.add(db_item)
-    db.commit()
-    db.refresh(db_item)
-    return db_item
+    return crud.create_item(db, current_user, item)
+
+@app.post("/api/items/batch", response_model=schemas.ItemBatchResponse)
+def batch_items(
+    batch: schemas.ItemBatch,
+    response: Response,
+    current_user: Principal = Depends(auth.get_current_user),
+    db: Session = Depends(auth.get_db)
+):
+    result = crud.batch_items(db, current_user, batch)
+    if not result.applied:
+        response.status_code = 409
+    return result
 
 @app.put("/api/items/{item_id}", response_model=schemas.Item)
 def update_item(
     item_id: int,
     item_update: schemas.ItemUpdate,
-    current_user: models.User = Depends(auth.get_current_user),
+    current_user: Principal = Depends(auth.get_current_user),
     db: Session = Depends(auth.get_db)
 ):
-    item = db.query(models.Item).filter(models.Item.id == item_id).first()
-    if not item:
-        raise HTTPException(status_code=404, detail="Item not found")
-    
-    # Перевірка доступу
-    box = item.box
-    if box.owner_id != current_user.id and current_user not in box.shared_with:
-        raise HTTPException(status_code=403, detail="Access denied")
-    
-    for key, value in item_update.dict(exclude_unset=True).items():
-        setattr(item, key, value)
-    
-    db.commit()
-    db.refresh(item)
-    return item
+    return crud.update_item(db, current_user, item_id, item_update)
 
 @app.delete("/api/items/{item_id}")
 def delete_item(
     item_id: int,
-    current_user: models.User = Depends(auth.get_current_user),
+    current_user: Principal = Depends(auth.get_current_user),
     db: Session = Depends(auth.get_db)
 ):
-    item = db.query(models.Item).filter(models.Item.id == item_id).first()
-    if not item:
-        raise HTTPException(status_code=404, detail="Item not found")
-    
-    box = item.box
-    if box.owner_id != current_user.id and current_user not in box.shared_with:
-        raise HTTPException(status_code=403, detail="Access denied")
-    
-    db.delete(item)
-    db.commit()
+    crud.delete_item(db, current_user, item_id)
     return {"message": "Item deleted"}
 
+# ============ SYNC ============
+
+@app.get("/api/sync", response_model=schemas.SyncResponse)
+def sync_changes(
+    since: Optional[str] = None,
+    limit: Annotated[int, Query(ge=1, le=sync.MAX_SYNC_PAGE_SIZE)] = sync.SYNC_PAGE_SIZE,
+    current_user: Principal = Depends(auth.get_current_user),
+    db: Session = Depends(auth.get_db)
+):
+    # Без since — лише токен поточного стану; has_more — одразу запитати наступну сторінку
+    return serialization.json_response(sync.changes(db, current_user, since, limit))
+
+# ============ STATS ============
+
+@app.get("/api/stats", response_model=schemas.InventoryStats)
+def get_stats(
+    response: Response,
+    box_id: Optional[int] = None,
+    category: Optional[str] = None,
+    location: Optional[str] = None,
+    name_prefix: Optional[str] = None,
+    created_after: Optional[datetime] = None,
+    created_before: Optional[datetime] = None,
+    updated_after: Optional[datetime] = None,
+    updated_before: Optional[datetime] = None,
+    if_none_match: Annotated[Optional[str], Header()] = None,
+    current_user: Principal = Depends(auth.get_current_user),
+    db: Session = Depends(auth.get_db)
+):
+    # Фасети для тих самих фільтрів, що й у /api/items; ETag — той самий, що в списків
+    filters = dict(
+        box_id=box_id,
+        category=category,
+        location=location,
+        name_prefix=name_prefix,
+        created_after=created_after,
+        created_before=created_before,
+        updated_after=updated_after,
+        updated_before=updated_before,
+    )
+    etag = etags.collection_etag(db, current_user, "stats", sorted(filters.items()))
+    if etags.matches(if_none_match, etag):
+        return etags.not_modified(etag)
+    etags.set_headers(response, etag)
+    return serialization.json_response(stats.inventory_stats(db, current_user, **filters), response)
+
+# ============ EVENTS ============
+
+@app.post("/api/events/ticket")
+def create_events_ticket(current_user: Principal = Depends(auth.get_current_user)):
+    return {"ticket": auth.create_stream_ticket(current_user.id), "expires_in": auth.STREAM_TICKET_SECONDS}
+
+@app.get("/api/events")
+async def stream_events(
+    ticket: Optional[str] = None,
+    token: Optional[str] = Depends(auth.optional_oauth2_scheme),
+):
+    # EventSource не вміє слати заголовки: замість токена в URL — короткий ?ticket=
+    # з POST /api/events/ticket (URL осідає в логах nginx)
+    current_user = await run_in_threadpool(auth.load_stream_user, token, ticket)
+    if events.broker.subscribers >= events.MAX_EVENT_STREAMS:
+        raise HTTPException(status_code=503, detail="Too many event streams", headers={"Retry-After": "30"})
+    return StreamingResponse(events.stream(current_user.id, current_user.box_ids), media_type="text/event-stream", headers={
+        "Cache-Control": "no-cache",
+        # identity: GZipMiddleware не буферизує потік; X-Accel-Buffering — nginx теж
+        "Content-Encoding": "identity",
+        "X-Accel-Buffering": "no",
+    })
+
+# ============ SEARCH ============
+
+@app.get("/api/search", response_model=List[schemas.SearchResult])
+def search_inventory(
+    q: Annotated[str, Query(min_length=1, max_length=100)],
+    response: Response,
+    limit: Annotated[int, Query(ge=1, le=100)] = 20,
+    cursor: Optional[str] = None,
+    current_user: Principal = Depends(auth.get_current_user),
+    db: Session = Depends(auth.get_db)
+):
+    offset = 0
+    if cursor:
+        cursor_query, offset = (decode_cursor(cursor) + [None, None])[:2]
+        if cursor_query != q or not isinstance(offset, int) or isinstance(offset, bool) or offset < 0:
+            raise HTTPException(status_code=400, detail="Cursor does not match query")
+        if offset > search.MAX_SEARCH_OFFSET:
+            raise HTTPException(status_code=400, detail="Invalid cursor")
+
+    results = search.search(db, q.strip(), accessible_box_ids(current_user.id), limit + 1, offset)
+    if len(results) > limit:
+        results = results[:limit]
+        if offset + limit <= search.MAX_SEARCH_OFFSET:
+            response.headers["X-Next-Cursor"] = encode_cursor(q, offset + limit)
+
+    return results
+
 # ============ UPLOAD ============
 
 @app.post("/api/upload")
 async def upload_file(
     file: UploadFile = File(...),
-    current_user: models.User = Depends(auth.get_current_user)
+    current_user: Principal = Depends(auth.get_current_user),
+    db: Session = Depends(auth.get_db)
 ):
-    if not file.content_type.startswith("image/"):
-        raise HTTPException(status_code=400, detail="Only images allowed")
-    
-    file_ext = file.filename.split(".")[-1]
-    filename = f"{uuid.uuid4()}.{file_ext}"
-    file_path = UPLOAD_DIR / filename
-    
-    with file_path.open("wb") as buffer:
-        shutil.copyfileobj(file.file, buffer)
-    
-    return {"url": f"/uploads/{filename}"}
+    # Тип визначається за magic bytes, запис чанками в потоці поза event loop;
+    # однаковий вміст -> той самий файл, зареєстрований у blobs
+    filename = await run_in_threadpool(
+        store_upload, file.file, UPLOAD_DIR, register=functools.partial(blobs.register, db), storage=STORAGE
+    )
+    thumbnails.schedule_derivatives(STORAGE.local_copy(filename), DERIVATIVE_DIR)
+    return _uploaded(filename)
+
+def _uploaded(filename: str) -> dict:
+    url = f"/uploads/{filename}"
+    # url — для photo_url; src — підписана адреса для попереднього перегляду
+    return {"url": url, "src": media.photo_src(url), "thumbnails": thumbnails.derivative_urls(url)}
+
+@app.post("/api/uploads/direct", response_model=schemas.DirectUpload)
+def begin_direct_upload(
+    request: schemas.DirectUploadRequest,
+    current_user: Principal = Depends(auth.get_current_user),
+    db: Session = Depends(auth.get_db)
+):
+    # Великі фото — напряму в S3 за presigned URL; multipart від S3_MULTIPART_THRESHOLD
+    return uploads.begin_direct_upload(
+        STORAGE, current_user.id, request.content_type, request.size, register=functools.partial(blobs.register, db)
+    )
+
+@app.post("/api/uploads/direct/complete")
+def complete_direct_upload(
+    request: schemas.DirectUploadComplete,
+    current_user: Principal = Depends(auth.get_current_user),
+    db: Session = Depends(auth.get_db)
+):
+    parts = [part.model_dump() for part in request.parts] if request.parts else None
+    filename = uploads.finish_direct_upload(
+        STORAGE, current_user.id, request.token, parts, register=functools.partial(blobs.register, db)
+    )
+    # Похідні — ліниво, на першому запиті /api/images (оригінал скачається в кеш)
+    return _uploaded(filename)
+
+@app.get("/api/media/{name}")
+def get_media(
+    name: str,
+    expires: Optional[int] = None,
+    sig: Optional[str] = None,
+    range_header: Annotated[Optional[str], Header(alias="range")] = None,
+    if_none_match: Annotated[Optional[str], Header()] = None,
+    token: Optional[str] = Depends(auth.optional_oauth2_scheme),
+    db: Session = Depends(auth.get_db)
+):
+    # Підписаний URL перевіряється без БД; з токеном — чи посилається на файл доступна коробка/річ
+    media.check_name(name)
+    if expires is not None and sig is not None:
+        if not media.verify(name, expires, sig):
+            raise HTTPException(status_code=403, detail="Link expired or invalid")
+    elif token is None:
+        raise auth.credentials_exception()
+    else:
+        current_user = auth.get_current_user(token, db)
+        if not media.can_view(db, current_user, name):
+            raise HTTPException(status_code=404, detail="File not found")
+    download_url = STORAGE.download_url(name)
+    if download_url is not None:
+        # S3: байти йдуть зі сховища (Range теж), бекенд лише видає короткий presigned URL
+        return RedirectResponse(download_url, status_code=302, headers={"Cache-Control": "private, max-age=300"})
+    return media.send_file(UPLOAD_DIR / name, UPLOAD_DIR, range_header, if_none_match)
+
+# ============ EXPORT / IMPORT ============
+
+@app.get("/api/export")
+def export_inventory(
+    format: transfer.TransferFormat = "ndjson",
+    current_user: Principal = Depends(auth.get_current_user)
+):
+    # Потоково, через серверний курсор: пам'ять не залежить від розміру інвентарю
+    return StreamingResponse(
+        transfer.stream_export(current_user.id, format),
+        media_type=transfer.MEDIA_TYPES[format],
+        headers={"Content-Disposition": f'attachment; filename="mystorage-export.{format}"'},
+    )
+
+@app.post("/api/import")
+async def import_inventory(
+    file: UploadFile = File(...),
+    format: Optional[transfer.TransferFormat] = None,
+    current_user: Principal = Depends(auth.get_current_user),
+    db: Session = Depends(auth.get_db)
+):
+    if format is None:
+        format = "csv" if (file.filename or "").lower().endswith(".csv") else "ndjson"
+    return await run_in_threadpool(transfer.import_inventory, db, current_user, file.file, format)
+
+def _can_view_derivative(token: str, stem: str) -> bool:
+    with database.SessionLocal() as db:
+        current_user = auth.get_current_user(token, db)
+        name = STORAGE.find(stem)
+        return name is not None and media.can_view(db, current_user, name)
+
+@app.get("/api/images/{size}/{filename}")
+async def get_image_derivative(
+    size: str,
+    filename: str,
+    expires: Optional[int] = None,
+    sig: Optional[str] = None,
+    range_header: Annotated[Optional[str], Header(alias="range")] = None,
+    if_none_match: Annotated[Optional[str], Header()] = None,
+    token: Optional[str] = Depends(auth.optional_oauth2_scheme),
+):
+    # Той самий доступ, що й до оригіналу (/api/media): lg — фактично саме фото
+    media.check_name(filename)
+    stem = filename.rpartition(".")[0]
+    if expires is not None and sig is not None:
+        if not media.verify(stem, expires, sig, purpose=thumbnails.DERIVATIVE_PURPOSE):
+            raise HTTPException(status_code=403, detail="Link expired or invalid")
+    elif token is None:
+        raise auth.credentials_exception()
+    elif not await run_in_threadpool(_can_view_derivative, token, stem):
+        raise HTTPException(status_code=404, detail="Image not found")
+    # Генерується при завантаженні; якщо ще не готово — на першому запиті в пулі процесів
+    path = await thumbnails.ensure_derivative(UPLOAD_DIR, DERIVATIVE_DIR, size, filename, STORAGE)
+    if path is None:
+        raise HTTPException(status_code=404, detail="Image not found")
+    return media.send_file(path, UPLOAD_DIR, range_header, if_none_match)
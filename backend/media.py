@@ -0,0 +1,162 @@
+import base64
+import hashlib
+import hmac
+import mimetypes
+import os
+import re
+import time
+from pathlib import Path
+from typing import Iterator, Optional, Tuple
+
+from fastapi import HTTPException, Response
+from fastapi.responses import StreamingResponse
+from sqlalchemy import exists, select
+from sqlalchemy.orm import Session
+
+import auth
+import etags
+import models
+from permissions import accessible_box_ids
+
+# Віддача завантажених фото (/api/media/<name>). Доступ перевіряється один раз:
+# підписом у URL (photo_src у відповідях API) або токеном + запитом до БД. Самі
+# байти за nginx віддає nginx: бекенд відповідає лише заголовком X-Accel-Redirect
+# на internal location (sendfile, Range, без воркера uvicorn). Без nginx
+# (розробка, тести) файл стрімиться з Python, теж з підтримкою Range.
+
+UPLOAD_URL_PREFIX = "/uploads/"
+MEDIA_URL_PREFIX = "/api/media/"
+# Internal location nginx, що дивиться на UPLOAD_DIR, напр. /_uploads/; порожньо — без nginx
+ACCEL_PREFIX = os.getenv("MEDIA_ACCEL_PREFIX", "")
+# Підпис стабільний упродовж вікна (однакові URL -> кеш браузера працює) і дійсний
+# ще одне вікно після нього: посилання живе 5–10 хвилин. Списки підписують заново
+# на кожну відповідь, а епоха входить у їхній ETag
+SIGNATURE_WINDOW = int(os.getenv("MEDIA_URL_WINDOW_SECONDS", "300"))
+# Ім'я файлу не змінює вмісту: sha256 (і старі uuid) ніколи не перезаписуються
+IMMUTABLE = "private, max-age=31536000, immutable"
+CHUNK_SIZE = 256 * 1024
+
+_SAFE_NAME = re.compile(r"^[A-Za-z0-9_-]+\.[A-Za-z0-9]{1,5}$")
+_RANGE = re.compile(r"^bytes=(\d*)-(\d*)$")
+
+
+# ============ SIGNED URLS ============
+
+def signing_epoch(now: Optional[float] = None) -> int:
+    # Входить у ETag списків: 304 не віддасть тіло з підписами, що от-от спливуть
+    return int(now if now is not None else time.time()) // SIGNATURE_WINDOW
+
+
+def _signature(name: str, expires: int, purpose: str = "media") -> str:
+    mac = hmac.new(auth.SECRET_KEY.encode("utf-8"), f"{purpose}:{name}:{expires}".encode("utf-8"), hashlib.sha256)
+    return base64.urlsafe_b64encode(mac.digest()[:16]).rstrip(b"=").decode("ascii")
+
+
+def signed_query(name: str, purpose: str = "media", now: Optional[float] = None) -> str:
+    expires = (signing_epoch(now) + 2) * SIGNATURE_WINDOW
+    return f"expires={expires}&sig={_signature(name, expires, purpose)}"
+
+
+def sign(name: str, now: Optional[float] = None) -> str:
+    return f"{MEDIA_URL_PREFIX}{name}?{signed_query(name, now=now)}"
+
+
+def photo_src(photo_url: Optional[str]) -> Optional[str]:
+    # Адреса для <img>: власні завантаження — підписаний /api/media, зовнішні URL як є
+    if not photo_url or not photo_url.startswith(UPLOAD_URL_PREFIX):
+        return photo_url
+    name = photo_url[len(UPLOAD_URL_PREFIX):]
+    return sign(name) if _SAFE_NAME.match(name) else None
+
+
+def verify(name: str, expires: int, sig: str, now: Optional[float] = None, purpose: str = "media") -> bool:
+    if expires < (now if now is not None else time.time()):
+        return False
+    return hmac.compare_digest(sig.encode("ascii", "replace"), _signature(name, expires, purpose).encode("ascii"))
+
+
+# ============ ACCESS ============
+
+def can_view(db: Session, principal, name: str) -> bool:
+    # Файл видно, якщо на нього посилається доступна коробка чи річ (часткові індекси photo_url)
+    url = UPLOAD_URL_PREFIX + name
+    boxes = accessible_box_ids(principal.id)
+    item = select(models.Item.id).where(
+        models.Item.photo_url == url, models.Item.photo_url.like(UPLOAD_URL_PREFIX + "%"), models.Item.box_id.in_(boxes)
+    )
+    box = select(models.Box.id).where(
+        models.Box.photo_url == url, models.Box.photo_url.like(UPLOAD_URL_PREFIX + "%"), models.Box.id.in_(boxes)
+    )
+    return bool(db.scalar(select(exists(item) | exists(box))))
+
+
+def check_name(name: str):
+    if not _SAFE_NAME.match(name):
+        raise HTTPException(status_code=404, detail="File not found")
+
+
+# ============ SENDING ============
+
+def parse_range(header: Optional[str], size: int) -> Optional[Tuple[int, int]]:
+    # Один діапазон bytes=a-b / a- / -n; кілька діапазонів чи сміття — ігноруються (200 з усім файлом)
+    match = _RANGE.match(header.strip()) if header else None
+    if match is None or match.groups() == ("", ""):
+        return None
+    first, last = match.groups()
+    if first and last and int(last) < int(first):
+        return None
+    if first == "":
+        start, end = max(0, size - int(last)), size - 1
+    else:
+        start, end = int(first), min(int(last), size - 1) if last else size - 1
+    if start >= size or start > end or size == 0:
+        raise HTTPException(status_code=416, detail="Range not satisfiable", headers={"Content-Range": f"bytes */{size}"})
+    return start, end
+
+
+def _read(path: Path, start: int, length: int) -> Iterator[bytes]:
+    with open(path, "rb") as source:
+        source.seek(start)
+        while length > 0:
+            chunk = source.read(min(CHUNK_SIZE, length))
+            if not chunk:
+                break
+            length -= len(chunk)
+            yield chunk
+
+
+def send_file(
+    path: Path,
+    upload_dir: Path,
+    range_header: Optional[str] = None,
+    if_none_match: Optional[str] = None,
+    media_type: Optional[str] = None,
+    cache_control: str = IMMUTABLE,
+) -> Response:
+    media_type = media_type or mimetypes.guess_type(path.name)[0] or "application/octet-stream"
+    if ACCEL_PREFIX:
+        # nginx сам обробляє Range, If-None-Match і 404; Cache-Control проходить від бекенду
+        relative = path.relative_to(upload_dir).as_posix()
+        return Response(headers={"X-Accel-Redirect": ACCEL_PREFIX + relative, "Cache-Control": cache_control},
+                        media_type=media_type)
+
+    try:
+        size = path.stat().st_size
+    except FileNotFoundError:
+        raise HTTPException(status_code=404, detail="File not found")
+    # Вміст за іменем незмінний — ETag з імені, без читання файлу
+    etag = f'"{path.stem}-{size}"'
+    headers = {"Cache-Control": cache_control, "ETag": etag, "Accept-Ranges": "bytes",
+               # Зображення вже стиснені: GZipMiddleware не чіпає відповідь і не ламає Range
+               "Content-Encoding": "identity"}
+    if etags.matches(if_none_match, etag):
+        return Response(status_code=304, headers=headers)
+    byte_range = parse_range(range_header, size)
+    if byte_range is None:
+        start, end, status_code = 0, size - 1, 200
+    else:
+        (start, end), status_code = byte_range, 206
+        headers["Content-Range"] = f"bytes {start}-{end}/{size}"
+    headers["Content-Length"] = str(end - start + 1)
+    return StreamingResponse(_read(path, start, end - start + 1), status_code=status_code, headers=headers,
+                             media_type=media_type)
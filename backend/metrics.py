@@ -0,0 +1,357 @@
+import contextvars
+import json
+import logging
+import os
+from pathlib import Path
+import tempfile
+import threading
+import time
+from typing import Dict, List, Optional, Tuple
+
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+import database
+
+logger = logging.getLogger(__name__)
+
+# Метрики запитів: латентність за маршрутом, кількість і час SQL на запит, розмір
+# відповіді. Кожен uvicorn-воркер рахує у своїй пам'яті й періодично скидає знімок
+# у METRICS_DIR; /api/metrics підсумовує знімки всіх воркерів (як multiprocess-режим
+# prometheus_client, але без залежності).
+
+# Воркери одного uvicorn мають спільного батька, тож каталог спільний для запуску
+METRICS_DIR = Path(os.getenv("METRICS_DIR", str(Path(tempfile.gettempdir()) / f"mystorage-metrics-{os.getppid()}")))
+METRICS_FLUSH_SECONDS = float(os.getenv("METRICS_FLUSH_SECONDS", "5"))
+SLOW_REQUEST_MS = float(os.getenv("SLOW_REQUEST_MS", "500"))
+# Скільки SQL-запитів зберігати для логу повільного запиту
+SLOW_LOG_QUERIES = 50
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+QUERY_COUNT_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50, 100)
+SQL_TIME_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 5.0)
+SIZE_BUCKETS = (256, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304, 16777216)
+
+
+class Histogram:
+    """Cumulative-bucket histogram keyed by a tuple of label values."""
+
+    def __init__(self, name: str, help: str, labels: Tuple[str, ...], buckets: Tuple[float, ...]):
+        self.name = name
+        self.help = help
+        self.labels = labels
+        self.buckets = buckets
+        self._lock = threading.Lock()
+        # labels -> [лічильники по кошиках..., +Inf], сума
+        self._series: Dict[tuple, list] = {}
+
+    def observe(self, labels: tuple, value: float):
+        with self._lock:
+            series = self._series.get(labels)
+            if series is None:
+                series = self._series[labels] = [[0] * (len(self.buckets) + 1), 0.0]
+            counts = series[0]
+            for index, bound in enumerate(self.buckets):
+                if value <= bound:
+                    counts[index] += 1
+                    break
+            else:
+                counts[-1] += 1
+            series[1] += value
+
+    def snapshot(self) -> list:
+        with self._lock:
+            return [[list(labels), list(counts), total] for labels, (counts, total) in self._series.items()]
+
+
+class Counter:
+    def __init__(self, name: str, help: str, labels: Tuple[str, ...] = ()):
+        self.name = name
+        self.help = help
+        self.labels = labels
+        self._lock = threading.Lock()
+        self._values: Dict[tuple, float] = {}
+
+    def inc(self, labels: tuple = (), amount: float = 1):
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+    def snapshot(self) -> list:
+        with self._lock:
+            return [[list(labels), value] for labels, value in self._values.items()]
+
+
+REQUEST_SECONDS = Histogram(
+    "mystorage_http_request_duration_seconds", "Request latency.", ("method", "route", "status"), LATENCY_BUCKETS
+)
+REQUEST_QUERIES = Histogram(
+    "mystorage_http_request_sql_queries", "SQL statements executed per request.", ("method", "route"), QUERY_COUNT_BUCKETS
+)
+REQUEST_SQL_SECONDS = Histogram(
+    "mystorage_http_request_sql_duration_seconds", "Time spent in SQL per request.", ("method", "route"), SQL_TIME_BUCKETS
+)
+RESPONSE_BYTES = Histogram(
+    "mystorage_http_response_size_bytes", "Response body size on the wire.", ("method", "route"), SIZE_BUCKETS
+)
+SLOW_REQUESTS = Counter("mystorage_http_slow_requests_total", "Requests slower than SLOW_REQUEST_MS.", ("method", "route"))
+EVENT_STREAM_OVERFLOWS = Counter(
+    "mystorage_event_stream_overflows_total", "Event streams that fell behind and were told to resync (events.py)."
+)
+RATE_LIMITED = Counter(
+    "mystorage_rate_limited_requests_total", "Requests rejected with 429 by the token buckets (ratelimit.py).", ("route_class",)
+)
+SHED_REQUESTS = Counter(
+    "mystorage_shed_requests_total", "Requests rejected with 503 by adaptive load shedding (ratelimit.py).", ("route_class",)
+)
+RATE_LIMIT_CONTENDED = Counter(
+    "mystorage_rate_limit_contended_total",
+    "Requests let through unchecked because another worker held the rate-limit table lock (ratelimit.py).",
+    ("route_class",),
+)
+HISTOGRAMS = (REQUEST_SECONDS, REQUEST_QUERIES, REQUEST_SQL_SECONDS, RESPONSE_BYTES)
+COUNTERS = (SLOW_REQUESTS, EVENT_STREAM_OVERFLOWS, RATE_LIMITED, SHED_REQUESTS, RATE_LIMIT_CONTENDED)
+
+
+# ============ SQL ============
+
+class RequestStats:
+    __slots__ = ("queries", "sql_seconds", "statements")
+
+    def __init__(self):
+        self.queries = 0
+        self.sql_seconds = 0.0
+        self.statements: List[Tuple[str, float]] = []
+
+
+# Контекст копіюється в потоки threadpool, тож sync-ендпоінти пишуть у той самий об'єкт
+_current: contextvars.ContextVar[Optional[RequestStats]] = contextvars.ContextVar("request_stats", default=None)
+
+
+@event.listens_for(Engine, "before_cursor_execute")
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    if _current.get() is not None:
+        conn.info.setdefault("query_started", []).append(time.perf_counter())
+
+
+@event.listens_for(Engine, "after_cursor_execute")
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    stats = _current.get()
+    started = conn.info.get("query_started")
+    if stats is None or not started:
+        return
+    elapsed = time.perf_counter() - started.pop()
+    stats.queries += 1
+    stats.sql_seconds += elapsed
+    if len(stats.statements) < SLOW_LOG_QUERIES:
+        stats.statements.append((statement, elapsed))
+
+
+# ============ MIDDLEWARE ============
+
+def route_label(scope) -> str:
+    # Шаблон маршруту, не сирий шлях: інакше кожен id — окрема серія
+    route = scope.get("route")
+    if route is not None:
+        return route.path
+    root_path = scope.get("root_path", "")
+    return root_path or "unmatched"
+
+
+class MetricsMiddleware:
+    """Records latency, SQL usage and response size for every HTTP request."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        stats = RequestStats()
+        token = _current.set(stats)
+        status = 500
+        size = 0
+        streaming = False
+        started = time.perf_counter()
+
+        async def send_wrapper(message):
+            nonlocal status, size, streaming
+            if message["type"] == "http.response.start":
+                status = message["status"]
+                streaming = any(
+                    name == b"content-type" and value.startswith(b"text/event-stream")
+                    for name, value in message.get("headers", ())
+                )
+            elif message["type"] == "http.response.body":
+                size += len(message.get("body", b""))
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            _current.reset(token)
+            elapsed = time.perf_counter() - started
+            method = scope["method"]
+            route = route_label(scope)
+            REQUEST_SECONDS.observe((method, route, str(status)), elapsed)
+            REQUEST_QUERIES.observe((method, route), stats.queries)
+            REQUEST_SQL_SECONDS.observe((method, route), stats.sql_seconds)
+            RESPONSE_BYTES.observe((method, route), size)
+            # Потік подій живе хвилинами — це не повільний запит
+            if elapsed * 1000 >= SLOW_REQUEST_MS and not streaming:
+                SLOW_REQUESTS.inc((method, route))
+                log_slow_request(scope, status, elapsed, stats)
+
+
+def log_slow_request(scope, status: int, elapsed: float, stats: RequestStats):
+    queries = "".join(
+        f"\n  {seconds * 1000:8.1f} ms  {' '.join(statement.split())[:300]}" for statement, seconds in stats.statements
+    )
+    if stats.queries > len(stats.statements):
+        queries += f"\n  ... {stats.queries - len(stats.statements)} more"
+    logger.warning(
+        "Slow request %s %s -> %s in %.0f ms (%d queries, %.0f ms SQL)%s",
+        scope["method"], scope["path"], status, elapsed * 1000, stats.queries, stats.sql_seconds * 1000, queries,
+    )
+
+
+# ============ AGGREGATION ============
+
+def snapshot() -> dict:
+    pools = [database.TimedQueuePool.stats]
+    if database.async_engine is not None:
+        pools.append(database.TimedAsyncQueuePool.stats)
+    return {
+        "histograms": {histogram.name: histogram.snapshot() for histogram in HISTOGRAMS},
+        "counters": {counter.name: counter.snapshot() for counter in COUNTERS},
+        "pool": {
+            "checkouts": sum(pool.waits for pool in pools),
+            "wait_seconds": sum(pool.wait_seconds_total for pool in pools),
+            "timeouts": sum(pool.timeouts for pool in pools),
+        },
+    }
+
+
+def flush():
+    METRICS_DIR.mkdir(parents=True, exist_ok=True)
+    path = METRICS_DIR / f"worker-{os.getpid()}.json"
+    temp = path.with_suffix(".tmp")
+    temp.write_text(json.dumps(snapshot()))
+    # Атомарна заміна: сусідній воркер не прочитає напівзаписаний файл
+    os.replace(temp, path)
+
+
+def collect() -> List[dict]:
+    flush()
+    snapshots = []
+    for path in METRICS_DIR.glob("worker-*.json"):
+        try:
+            snapshots.append(json.loads(path.read_text()))
+        except (OSError, ValueError):
+            continue
+    return snapshots
+
+
+def remove_dead_workers():
+    # Файли воркерів попереднього запуску (той самий каталог після рестарту контейнера)
+    if not METRICS_DIR.exists():
+        return
+    for path in METRICS_DIR.glob("worker-*.json"):
+        pid = int(path.stem.split("-", 1)[1])
+        try:
+            os.kill(pid, 0)
+        except ProcessLookupError:
+            path.unlink(missing_ok=True)
+        except PermissionError:
+            pass
+
+
+class _Flusher:
+    def __init__(self):
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self):
+        if self._thread is None:
+            remove_dead_workers()
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._run, name="metrics-flush", daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        if self._thread is not None:
+            self._stop.set()
+            self._thread.join()
+            self._thread = None
+            flush()
+
+    def _run(self):
+        while not self._stop.wait(METRICS_FLUSH_SECONDS):
+            try:
+                flush()
+            except OSError as exc:
+                logger.warning("Metrics flush failed: %s", exc)
+
+
+flusher = _Flusher()
+
+
+# ============ EXPOSITION ============
+
+def _labels(names, values, extra: str = "") -> str:
+    pairs = [f'{name}="{str(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _format_bound(bound: float) -> str:
+    return str(int(bound)) if float(bound).is_integer() else repr(bound)
+
+
+def render(snapshots: List[dict]) -> str:
+    lines = []
+    for histogram in HISTOGRAMS:
+        merged: Dict[tuple, list] = {}
+        for worker in snapshots:
+            for labels, counts, total in worker["histograms"].get(histogram.name, []):
+                series = merged.setdefault(tuple(labels), [[0] * len(counts), 0.0])
+                series[0] = [a + b for a, b in zip(series[0], counts)]
+                series[1] += total
+        lines.append(f"# HELP {histogram.name} {histogram.help}")
+        lines.append(f"# TYPE {histogram.name} histogram")
+        for labels, (counts, total) in sorted(merged.items()):
+            cumulative = 0
+            for bound, count in zip(histogram.buckets + (float("inf"),), counts):
+                cumulative += count
+                le = "+Inf" if bound == float("inf") else _format_bound(bound)
+                bucket_labels = _labels(histogram.labels, labels, f'le="{le}"')
+                lines.append(f"{histogram.name}_bucket{bucket_labels} {cumulative}")
+            lines.append(f"{histogram.name}_sum{_labels(histogram.labels, labels)} {total}")
+            lines.append(f"{histogram.name}_count{_labels(histogram.labels, labels)} {cumulative}")
+
+    for counter in COUNTERS:
+        merged = {}
+        for worker in snapshots:
+            for labels, value in worker["counters"].get(counter.name, []):
+                merged[tuple(labels)] = merged.get(tuple(labels), 0) + value
+        lines.append(f"# HELP {counter.name} {counter.help}")
+        lines.append(f"# TYPE {counter.name} counter")
+        for labels, value in sorted(merged.items()):
+            lines.append(f"{counter.name}{_labels(counter.labels, labels)} {value}")
+
+    pool = {key: sum(worker["pool"][key] for worker in snapshots) for key in ("checkouts", "wait_seconds", "timeouts")}
+    for key, help in (
+        ("checkouts", "Connection checkouts from the DB pool."),
+        ("wait_seconds", "Time spent waiting for a pooled DB connection."),
+        ("timeouts", "DB pool checkouts that timed out."),
+    ):
+        name = f"mystorage_db_pool_{key}_total"
+        lines.append(f"# HELP {name} {help}")
+        lines.append(f"# TYPE {name} counter")
+        lines.append(f"{name} {pool[key]}")
+    lines.append("# HELP mystorage_workers Worker processes reporting metrics.")
+    lines.append("# TYPE mystorage_workers gauge")
+    lines.append(f"mystorage_workers {len(snapshots)}")
+    return "\n".join(lines) + "\n"
@@ -1,5 +1,5 @@
-from sqlalchemy import Column, Integer, String, Text, ForeignKey, DateTime, Table
-from sqlalchemy.orm import relationship
+from sqlalchemy import DDL, BigInteger, Column, Date, Integer, String, Text, ForeignKey, DateTime, Table, Index, event, select, func, text
+from sqlalchemy.orm import relationship, column_property
 from datetime import datetime
 from database import Base
 
@@ -9,7 +9,13 @@ box_shares = Table(
     Base.metadata,
     Column('box_id', Integer, ForeignKey('boxes.id', ondelete='CASCADE'), primary_key=True),
     Column('user_id', Integer, ForeignKey('users.id', ondelete='CASCADE'), primary_key=True),
-    Column('shared_at', DateTime, default=datetime.utcnow)
+    Column('shared_at', DateTime, default=datetime.utcnow),
+    # Версія змін для /api/sync (sync.py)
+    Column('sync_version', BigInteger, nullable=False, default=0, server_default="0"),
+    # PK починається з box_id; для "до чого має доступ користувач" потрібен user_id першим
+    Index('ix_box_shares_user_id_box_id', 'user_id', 'box_id'),
+    # Дельта доступів за версією: умова з OR не може вести індексом user_id
+    Index('ix_box_shares_sync_version_box_id', 'sync_version', 'box_id'),
 )
 
 class User(Base):
@@ -27,6 +33,13 @@ class User(Base):
 
 class Box(Base):
     __tablename__ = "boxes"
+    __table_args__ = (
+        # Власні коробки користувача: WHERE owner_id = ? [ORDER BY id]
+        Index('ix_boxes_owner_id_id', 'owner_id', 'id'),
+        # Посилання на завантажені файли (blobs.sweep); зовнішні URL можуть бути довгими — не індексуються
+        Index('ix_boxes_photo_url_uploads', 'photo_url',
+              postgresql_where=text("photo_url LIKE '/uploads/%'"), sqlite_where=text("photo_url LIKE '/uploads/%'")),
+    )
     
     id = Column(Integer, primary_key=True, index=True)
     name = Column(String(100), nullable=False)
@@ -37,6 +50,10 @@ class Box(Base):
     owner_id = Column(Integer, ForeignKey("users.id", ondelete="CASCADE"))
     created_at = Column(DateTime, default=datetime.utcnow)
     updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    # Лічильник змін коробки та її речей для ETag колекцій (etags.py)
+    content_version = Column(Integer, nullable=False, default=0, server_default="0")
+    # Глобальна версія останньої зміни самої коробки для /api/sync (sync.py)
+    sync_version = Column(BigInteger, nullable=False, default=0, server_default="0")
     
     owner = relationship("User", back_populates="boxes")
     items = relationship("Item", back_populates="box", cascade="all, delete-orphan")
@@ -44,6 +61,19 @@ class Box(Base):
 
 class Item(Base):
     __tablename__ = "items"
+    __table_args__ = (
+        # Речі коробки в порядку кожного з сортувань /api/items; префікс box_id
+        # обслуговує selectinload, item_count і каскадне видалення
+        Index('ix_items_box_id_created_at_id', 'box_id', 'created_at', 'id'),
+        Index('ix_items_box_id_updated_at_id', 'box_id', 'updated_at', 'id'),
+        Index('ix_items_box_id_name_id', 'box_id', 'name', 'id'),
+        # Дельта для /api/sync: зміни в доступних коробках після версії токена
+        Index('ix_items_box_id_sync_version_id', 'box_id', 'sync_version', 'id'),
+        # Фільтр ?category= у списку речей і перерахунок item_stats
+        Index('ix_items_box_id_category_created_at_id', 'box_id', 'category', 'created_at', 'id'),
+        Index('ix_items_photo_url_uploads', 'photo_url',
+              postgresql_where=text("photo_url LIKE '/uploads/%'"), sqlite_where=text("photo_url LIKE '/uploads/%'")),
+    )
     
     id = Column(Integer, primary_key=True, index=True)
     name = Column(String(100), nullable=False)
@@ -53,5 +83,71 @@ class Item(Base):
     box_id = Column(Integer, ForeignKey("boxes.id", ondelete="CASCADE"))
     created_at = Column(DateTime, default=datetime.utcnow)
     updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    sync_version = Column(BigInteger, nullable=False, default=0, server_default="0")
     
-    box = relationship("Box", back_populates="items")
\ No newline at end of file
+    box = relationship("Box", back_populates="items")
+
+
+class SyncState(Base):
+    # Один рядок: межа видалених надгробків; на SQLite ще й лічильник версій змін
+    # (на Postgres версія — id транзакції, див. sync.py)
+    __tablename__ = "sync_state"
+
+    id = Column(Integer, primary_key=True)
+    version = Column(BigInteger, nullable=False, default=0, server_default="0")
+    # Надгробки до цієї версії видалено: старіші токени мусять робити повне завантаження
+    pruned_version = Column(BigInteger, nullable=False, default=0, server_default="0")
+
+
+# Єдиний рядок лічильника; для create_all (тести, бенчмарки) — як у міграції 20261018_000006
+event.listen(
+    SyncState.__table__, "after_create", DDL("INSERT INTO sync_state (id, version, pruned_version) VALUES (1, 0, 0)")
+)
+
+
+class SyncTombstone(Base):
+    # Видалення для /api/sync. kind: box (один рядок на кожного, хто мав доступ),
+    # item (box_id — коробка, де річ була), share (entity_id — користувач, у якого забрали доступ)
+    __tablename__ = "sync_tombstones"
+    __table_args__ = (
+        Index('ix_sync_tombstones_box_id_version', 'box_id', 'version'),
+        Index('ix_sync_tombstones_user_id_version', 'user_id', 'version'),
+    )
+
+    id = Column(Integer, primary_key=True)
+    version = Column(BigInteger, nullable=False)
+    kind = Column(String(10), nullable=False)
+    entity_id = Column(Integer, nullable=False)
+    box_id = Column(Integer, nullable=False)
+    user_id = Column(Integer)
+    deleted_at = Column(DateTime, default=datetime.utcnow, index=True)
+
+class Blob(Base):
+    # Завантажений файл у UPLOAD_DIR, ім'я — sha256 вмісту (blobs.py). Посилання —
+    # photo_url = '/uploads/<name>' у items і boxes
+    __tablename__ = "blobs"
+
+    name = Column(String(100), primary_key=True)
+    size = Column(BigInteger)
+    # Останнє завантаження цього вмісту; sweep не чіпає свіжі
+    uploaded_at = Column(DateTime, nullable=False, default=datetime.utcnow, index=True)
+
+
+class ItemStat(Base):
+    # Агрегати для /api/stats (stats.py): скільки речей категорії додано й прибрано
+    # з коробки за місяць. Оновлюються в тих самих транзакціях, що й речі, тож
+    # читання залежить від кількості коробок і категорій, а не речей
+    __tablename__ = "item_stats"
+
+    box_id = Column(Integer, ForeignKey("boxes.id", ondelete="CASCADE"), primary_key=True)
+    category = Column(String(50), primary_key=True)
+    month = Column(Date, primary_key=True)
+    added = Column(Integer, nullable=False, default=0, server_default="0")
+    removed = Column(Integer, nullable=False, default=0, server_default="0")
+
+
+# Кількість речей рахується в SQL; deferred, щоб не додавати підзапит до кожного SELECT
+Box.item_count = column_property(
+    select(func.count(Item.id)).where(Item.box_id == Box.id).correlate_except(Item).scalar_subquery(),
+    deferred=True,
+)
@@ -0,0 +1,121 @@
+import asyncio
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from typing import Optional
+
+import anyio
+import bcrypt
+from fastapi import HTTPException, status
+
+BCRYPT_ROUNDS = int(os.getenv("BCRYPT_ROUNDS", "12"))
+# 0 — хешувати в потоці запиту, без пулу процесів
+PASSWORD_HASH_WORKERS = int(os.getenv("PASSWORD_HASH_WORKERS", "2"))
+PASSWORD_HASH_MAX_PENDING = int(os.getenv("PASSWORD_HASH_MAX_PENDING", "16"))
+
+
+def hash_password(password: str, rounds: int = BCRYPT_ROUNDS) -> str:
+    salt = bcrypt.gensalt(rounds=rounds)
+    return bcrypt.hashpw(password.encode("utf-8"), salt).decode("utf-8")
+
+
+def check_password(plain_password: str, hashed_password: str) -> bool:
+    return bcrypt.checkpw(plain_password.encode("utf-8"), hashed_password.encode("utf-8"))
+
+
+class PasswordHasher:
+    """Runs bcrypt in a size-limited process pool and sheds load when it is saturated."""
+
+    def __init__(
+        self,
+        workers: int = PASSWORD_HASH_WORKERS,
+        max_pending: int = PASSWORD_HASH_MAX_PENDING,
+        rounds: int = BCRYPT_ROUNDS,
+    ):
+        self.workers = workers
+        self.rounds = rounds
+        self._slots = threading.BoundedSemaphore(max_pending)
+        self._pool: Optional[ProcessPoolExecutor] = None
+        self._pool_lock = threading.Lock()
+        self.completed = 0
+        self.rejected = 0
+
+    def _get_pool(self) -> ProcessPoolExecutor:
+        with self._pool_lock:
+            if self._pool is None:
+                self._pool = ProcessPoolExecutor(max_workers=self.workers)
+            return self._pool
+
+    def _acquire(self):
+        # Черга переповнена — швидка відмова замість зайнятого потоку на секунди
+        if not self._slots.acquire(blocking=False):
+            self.rejected += 1
+            raise HTTPException(
+                status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+                detail="Authentication is busy, please retry",
+                headers={"Retry-After": "1"},
+            )
+
+    def _run(self, fn, *args):
+        self._acquire()
+        try:
+            if self.workers <= 0:
+                result = fn(*args)
+            else:
+                result = self._get_pool().submit(fn, *args).result()
+            self.completed += 1
+            return result
+        finally:
+            self._slots.release()
+
+    def _finished(self, future):
+        # Викликається пулом, коли bcrypt справді завершився (або задачу зняли з черги)
+        self._slots.release()
+        if not future.cancelled() and future.exception() is None:
+            self.completed += 1
+
+    async def _run_async(self, fn, *args):
+        # Для async-маршрутів: на час bcrypt не зайнятий жоден потік (ні event loop,
+        # ні спільний threadpool anyio) — лише очікування future пулу процесів
+        self._acquire()
+        if self.workers <= 0:
+            # to_thread не переривається скасуванням: слот звільняється після роботи
+            try:
+                result = await anyio.to_thread.run_sync(fn, *args)
+                self.completed += 1
+                return result
+            finally:
+                self._slots.release()
+        try:
+            future = self._get_pool().submit(fn, *args)
+        except BaseException:
+            self._slots.release()
+            raise
+        # Слот звільняє сам future: якщо клієнт відключився посеред логіну, await
+        # скасовується, а процес рахує далі — і має займати місце в черзі до кінця
+        future.add_done_callback(self._finished)
+        return await asyncio.wrap_future(future)
+
+    def hash(self, password: str) -> str:
+        return self._run(hash_password, password, self.rounds)
+
+    def verify(self, plain_password: str, hashed_password: str) -> bool:
+        return self._run(check_password, plain_password, hashed_password)
+
+    async def hash_async(self, password: str) -> str:
+        return await self._run_async(hash_password, password, self.rounds)
+
+    async def verify_async(self, plain_password: str, hashed_password: str) -> bool:
+        return await self._run_async(check_password, plain_password, hashed_password)
+
+    def stats(self) -> dict:
+        return {"workers": self.workers, "completed": self.completed, "rejected": self.rejected}
+
+    def shutdown(self):
+        with self._pool_lock:
+            if self._pool is not None:
+                self._pool.shutdown(wait=False, cancel_futures=True)
+                self._pool = None
+
+
+hasher = PasswordHasher()
@@ -0,0 +1,92 @@
+from typing import Dict, Iterable, Set
+
+from fastapi import HTTPException
+from sqlalchemy import exists, or_, select
+from sqlalchemy.orm import Session
+
+import models
+
+# Власник: читання, запис речей, зміна/видалення/шаринг коробки.
+# Користувач, з яким поділились: читання й запис речей.
+
+
+def accessible_box_ids(user_id: int):
+    owned = select(models.Box.id).where(models.Box.owner_id == user_id)
+    shared = select(models.box_shares.c.box_id).where(models.box_shares.c.user_id == user_id)
+    return owned.union(shared)
+
+
+def can_access_box(db: Session, user_id: int, box_id: int) -> bool:
+    owned = exists().where(models.Box.id == box_id, models.Box.owner_id == user_id)
+    shared = exists().where(models.box_shares.c.box_id == box_id, models.box_shares.c.user_id == user_id)
+    return bool(db.scalar(select(or_(owned, shared))))
+
+
+def can_access(db: Session, principal, box_id: int) -> bool:
+    # Кешований набір — швидкий позитивний шлях; промах перевіряється в БД,
+    # щоб щойно створені чи поділені коробки працювали одразу
+    if box_id in principal.box_ids:
+        return True
+    return can_access_box(db, principal.id, box_id)
+
+
+def accessible_subset(db: Session, principal, box_ids: Iterable[int]) -> Set[int]:
+    requested = set(box_ids)
+    allowed = requested & principal.box_ids
+    missing = requested - allowed
+    if missing:
+        allowed.update(db.scalars(
+            select(models.Box.id).where(
+                models.Box.id.in_(missing),
+                models.Box.id.in_(accessible_box_ids(principal.id)),
+            )
+        ))
+    return allowed
+
+
+def owned_subset(db: Session, principal, box_ids: Iterable[int]) -> Set[int]:
+    requested = set(box_ids)
+    allowed = requested & principal.owned_box_ids
+    missing = requested - allowed
+    if missing:
+        allowed.update(db.scalars(
+            select(models.Box.id).where(models.Box.id.in_(missing), models.Box.owner_id == principal.id)
+        ))
+    return allowed
+
+
+def item_box_ids(db: Session, principal, item_ids: Iterable[int]) -> Dict[int, int]:
+    # item_id -> box_id лише для речей, до яких є доступ
+    rows = db.execute(
+        select(models.Item.id, models.Item.box_id).where(models.Item.id.in_(set(item_ids)))
+    ).all()
+    allowed = accessible_subset(db, principal, {box_id for _, box_id in rows})
+    return {item_id: box_id for item_id, box_id in rows if box_id in allowed}
+
+
+def require_box(db: Session, principal, box_id: int, owner: bool = False, action: str = "access") -> models.Box:
+    box = db.query(models.Box).filter(models.Box.id == box_id).first()
+    if not box:
+        raise HTTPException(status_code=404, detail="Box not found")
+    if owner:
+        if box.owner_id != principal.id:
+            raise HTTPException(status_code=403, detail=f"Only owner can {action}")
+    elif box.owner_id != principal.id and not can_access(db, principal, box.id):
+        raise HTTPException(status_code=403, detail="Access denied")
+    return box
+
+
+def require_box_access(db: Session, principal, box_id: int):
+    if not can_access(db, principal, box_id):
+        if db.scalar(select(exists().where(models.Box.id == box_id))):
+            raise HTTPException(status_code=403, detail="Access denied")
+        raise HTTPException(status_code=404, detail="Box not found")
+
+
+def require_item(db: Session, principal, item_id: int) -> models.Item:
+    item = db.query(models.Item).filter(models.Item.id == item_id).first()
+    if not item:
+        raise HTTPException(status_code=404, detail="Item not found")
+    if not can_access(db, principal, item.box_id):
+        raise HTTPException(status_code=403, detail="Access denied")
+    return item
@@ -0,0 +1,215 @@
+import os
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from datetime import datetime
+from typing import Optional
+
+import orjson
+from sqlalchemy import event, func, inspect, literal, select
+from sqlalchemy.orm import Session
+
+import models
+
+PRINCIPAL_CACHE_TTL = float(os.getenv("PRINCIPAL_CACHE_TTL", "30"))
+PRINCIPAL_CACHE_SIZE = int(os.getenv("PRINCIPAL_CACHE_SIZE", "1024"))
+# Скидання кешу між воркерами (Postgres NOTIFY; слухає events.listener)
+INVALIDATION_CHANNEL = "mystorage_principals"
+# Більше користувачів не вміщається в payload NOTIFY (8000 байт) — скидається весь кеш
+MAX_NOTIFY_USERS = 500
+
+
+@dataclass(frozen=True)
+class Principal:
+    id: int
+    username: str
+    email: str
+    created_at: Optional[datetime]
+    box_ids: frozenset
+    owned_box_ids: frozenset
+
+
+class PrincipalCache:
+    """Per-worker TTL/LRU cache of authenticated principals keyed by user id."""
+
+    def __init__(self, ttl: float = PRINCIPAL_CACHE_TTL, maxsize: int = PRINCIPAL_CACHE_SIZE):
+        self.ttl = ttl
+        self.maxsize = maxsize
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        # Покоління скидань: заповнення, почате до скидання, не записує старий набір коробок
+        self._epoch = 0
+        self._generations = {}
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    def get(self, user_id: int) -> Optional[Principal]:
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(user_id)
+            if entry is None or entry[0] < now:
+                if entry is not None:
+                    del self._entries[user_id]
+                self.misses += 1
+                return None
+            self._entries.move_to_end(user_id)
+            self.hits += 1
+            return entry[1]
+
+    def generation(self, user_id: int) -> tuple:
+        # Брати до завантаження principal з БД і передати в put
+        with self._lock:
+            return self._epoch, self._generations.get(user_id, 0)
+
+    def put(self, principal: Principal, generation: Optional[tuple] = None):
+        with self._lock:
+            if generation is not None and generation != (self._epoch, self._generations.get(principal.id, 0)):
+                return
+            self._entries[principal.id] = (time.monotonic() + self.ttl, principal)
+            self._entries.move_to_end(principal.id)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def invalidate(self, *user_ids: int):
+        with self._lock:
+            for user_id in user_ids:
+                self._generations[user_id] = self._generations.get(user_id, 0) + 1
+                if self._entries.pop(user_id, None) is not None:
+                    self.invalidations += 1
+            if len(self._generations) > self.maxsize * 4:
+                # Нова епоха так само відкидає всі незавершені заповнення
+                self._generations.clear()
+                self._epoch += 1
+
+    def clear(self):
+        with self._lock:
+            self.invalidations += len(self._entries)
+            self._entries.clear()
+            self._generations.clear()
+            self._epoch += 1
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "size": len(self._entries),
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "invalidations": self.invalidations,
+            }
+
+
+principal_cache = PrincipalCache()
+
+
+def load_principal(db: Session, user_id: int) -> Optional[Principal]:
+    user = db.execute(
+        select(models.User.id, models.User.username, models.User.email, models.User.created_at)
+        .where(models.User.id == user_id)
+    ).first()
+    if user is None:
+        return None
+
+    owned = select(models.Box.id, literal(True).label("owned")).where(models.Box.owner_id == user_id)
+    shared = select(models.box_shares.c.box_id, literal(False).label("owned")).where(
+        models.box_shares.c.user_id == user_id
+    )
+    rows = db.execute(owned.union_all(shared)).all()
+    return Principal(
+        id=user.id,
+        username=user.username,
+        email=user.email,
+        created_at=user.created_at,
+        box_ids=frozenset(box_id for box_id, _ in rows),
+        owned_box_ids=frozenset(box_id for box_id, owned in rows if owned),
+    )
+
+
+def get_principal(db: Session, user_id: int) -> Optional[Principal]:
+    principal = principal_cache.get(user_id)
+    if principal is None:
+        generation = principal_cache.generation(user_id)
+        principal = load_principal(db, user_id)
+        if principal is not None:
+            principal_cache.put(principal, generation)
+    return principal
+
+
+# ============ INVALIDATION ============
+# Зміни користувачів, коробок і shares скидають кеш після commit у цьому воркері.
+# На Postgres ті самі скидання йдуть іншим воркерам через NOTIFY у тій самій
+# транзакції: після unshare користувач втрачає доступ на всіх воркерах одразу, а не
+# через PRINCIPAL_CACHE_TTL (TTL лишається запобіжником, поки слухач перепідключається).
+
+def invalidate_on_commit(session: Session, *user_ids: int):
+    # Для змін через Core (insert/delete box_shares), яких after_flush не бачить
+    session.info.setdefault("principal_invalidations", set()).update(user_ids)
+
+
+@event.listens_for(Session, "after_flush")
+def _collect_invalidations(session, flush_context):
+    pending = session.info.setdefault("principal_invalidations", set())
+    for obj in session.deleted:
+        if isinstance(obj, models.Box):
+            # Невідомо, з ким коробку поділено, без додаткового запиту
+            session.info["principal_invalidate_all"] = True
+        elif isinstance(obj, models.User):
+            pending.add(obj.id)
+    for obj in list(session.new) + list(session.dirty):
+        if isinstance(obj, models.User):
+            pending.add(obj.id)
+        elif isinstance(obj, models.Box):
+            state = inspect(obj)
+            pending.add(obj.owner_id)
+            pending.update(owner_id for owner_id in state.attrs.owner_id.history.deleted if owner_id)
+            shares = state.attrs.shared_with.history
+            pending.update(user.id for user in list(shares.added) + list(shares.deleted))
+
+
+def _uses_notify(session: Session) -> bool:
+    bind = session.get_bind()
+    return bind is not None and bind.dialect.name == "postgresql"
+
+
+@event.listens_for(Session, "before_commit")
+def _notify_invalidations(session):
+    if not _uses_notify(session):
+        return
+    # before_commit іде до фінального flush: зміни з нього теж мають потрапити в NOTIFY
+    session.flush()
+    pending = {user_id for user_id in session.info.get("principal_invalidations", ()) if user_id is not None}
+    if session.info.get("principal_invalidate_all") or len(pending) > MAX_NOTIFY_USERS:
+        payload = {"all": True}
+    elif pending:
+        payload = {"users": sorted(pending)}
+    else:
+        return
+    session.execute(select(func.pg_notify(INVALIDATION_CHANNEL, orjson.dumps(payload).decode("utf-8"))))
+
+
+def apply_remote_invalidation(payload: str):
+    # Повідомлення від іншого (чи цього ж) воркера — зайве скидання лише коштує перезавантаження
+    message = orjson.loads(payload)
+    if message.get("all"):
+        principal_cache.clear()
+    else:
+        principal_cache.invalidate(*message.get("users", ()))
+
+
+@event.listens_for(Session, "after_commit")
+def _apply_invalidations(session):
+    if session.info.pop("principal_invalidate_all", False):
+        principal_cache.clear()
+    pending = session.info.pop("principal_invalidations", None)
+    if pending:
+        principal_cache.invalidate(*(user_id for user_id in pending if user_id is not None))
+
+
+@event.listens_for(Session, "after_rollback")
+def _discard_invalidations(session):
+    session.info.pop("principal_invalidate_all", None)
+    session.info.pop("principal_invalidations", None)
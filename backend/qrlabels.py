@@ -0,0 +1,115 @@
+import functools
+import hashlib
+import io
+import os
+import re
+from pathlib import Path
+from typing import Iterable, Optional, Tuple
+
+import segno
+from PIL import Image, ImageDraw, ImageFont
+
+# QR-мітки коробок. Код коробки незмінний, тож зображення рендериться один раз
+# і лежить на диску під іменем коду; аркуш для друку збирається з цих файлів.
+
+QR_FORMATS = {"png": "image/png", "svg": "image/svg+xml"}
+QR_SCALE = 10
+QR_BORDER = 4
+# Аркуш A4 при 300 dpi, сітка 3 x 8 (типові самоклейні етикетки 70 x 37 мм)
+SHEET_DPI = 300
+SHEET_SIZE = (2480, 3508)
+SHEET_COLUMNS = 3
+SHEET_ROWS = 8
+SHEET_MARGIN = 60
+MAX_SHEET_LABELS = int(os.getenv("MAX_QR_SHEET_LABELS", "1000"))
+# Шрифт з кирилицею; вбудований у Pillow покриває лише латиницю
+LABEL_FONT = os.getenv("QR_LABEL_FONT", "/usr/share/fonts/truetype/dejavu/DejaVuSans.ttf")
+
+_SAFE_CODE = re.compile(r"^[A-Za-z0-9_-]{1,100}$")
+
+
+def label_path(qr_dir: Path, code: str, fmt: str) -> Path:
+    path = qr_dir / f"{_stem(code)}.{fmt}"
+    if not path.exists():
+        temp_path = path.with_name(f".{path.name}.{os.getpid()}.part")
+        qr = segno.make(code, error="m", micro=False)
+        qr.save(str(temp_path), kind=fmt, scale=QR_SCALE, border=QR_BORDER)
+        # Паралельні запити можуть рендерити той самий код: останній replace виграє, вміст однаковий
+        os.replace(temp_path, path)
+    return path
+
+
+def _fit(draw: ImageDraw.ImageDraw, text: str, font, width: int) -> str:
+    if draw.textlength(text, font=font) <= width:
+        return text
+    while text and draw.textlength(text + "…", font=font) > width:
+        text = text[:-1]
+    return text + "…"
+
+
+@functools.lru_cache(maxsize=None)
+def _font(size: int):
+    try:
+        return ImageFont.truetype(LABEL_FONT, size)
+    except OSError:
+        return ImageFont.load_default(size=size)
+
+
+CELL_SIZE = ((SHEET_SIZE[0] - 2 * SHEET_MARGIN) // SHEET_COLUMNS, (SHEET_SIZE[1] - 2 * SHEET_MARGIN) // SHEET_ROWS)
+
+
+def _stem(code: str) -> str:
+    # Імпортовані коди можуть містити будь-що; такі файли називаються хешем коду
+    return code if _SAFE_CODE.match(code) else "h-" + hashlib.sha256(code.encode("utf-8")).hexdigest()
+
+
+def label_tile(qr_dir: Path, code: str, name: str, location: Optional[str]) -> Path:
+    # Готова клітинка аркуша (QR + підпис). Рендер тексту — найдорожча частина аркуша,
+    # тож клітинка кешується за кодом і вмістом підпису; перейменування дає нову
+    text_key = hashlib.blake2b(f"{name}\0{location or ''}".encode("utf-8"), digest_size=8).hexdigest()
+    path = qr_dir / "tiles" / f"{_stem(code)}-{text_key}.png"
+    if path.exists():
+        return path
+
+    cell_width, cell_height = CELL_SIZE
+    tile = Image.new("1", CELL_SIZE, 1)
+    with Image.open(label_path(qr_dir, code, "png")) as qr:
+        qr = qr.convert("L")
+    # Довгі коди дають більшу версію QR — зменшуємо, щоб влізла в клітинку
+    factor = -(-qr.size[0] // (cell_height - 20))
+    if factor > 1:
+        qr = qr.reduce(factor)
+    qr_size = qr.size[0]
+    tile.paste(qr.point(lambda value: 255 if value > 127 else 0, "1"), (0, (cell_height - qr_size) // 2))
+
+    draw = ImageDraw.Draw(tile)
+    title_font = _font(44)
+    small_font = _font(34)
+    text_width = cell_width - qr_size - 20
+    draw.text((qr_size, 110), _fit(draw, name, title_font, text_width), font=title_font, fill=0)
+    if location:
+        draw.text((qr_size, 170), _fit(draw, location, small_font, text_width), font=small_font, fill=0)
+    draw.text((qr_size, 230), _fit(draw, code, small_font, text_width), font=small_font, fill=0)
+
+    path.parent.mkdir(exist_ok=True)
+    temp_path = path.with_name(f".{path.name}.{os.getpid()}.part")
+    tile.save(temp_path, "PNG")
+    os.replace(temp_path, path)
+    return path
+
+
+def render_sheet(qr_dir: Path, labels: Iterable[Tuple[str, str, Optional[str]]]) -> bytes:
+    # labels: (code, name, location). Блокуючий код: викликати з threadpool
+    per_page = SHEET_COLUMNS * SHEET_ROWS
+    pages = []
+    for index, (code, name, location) in enumerate(labels):
+        if index % per_page == 0:
+            pages.append(Image.new("1", SHEET_SIZE, 1))
+        row, column = divmod(index % per_page, SHEET_COLUMNS)
+        with Image.open(label_tile(qr_dir, code, name, location)) as tile:
+            pages[-1].paste(tile, (SHEET_MARGIN + column * CELL_SIZE[0], SHEET_MARGIN + row * CELL_SIZE[1]))
+
+    output = io.BytesIO()
+    # Чорно-білі сторінки стискаються без втрат (CCITT), QR лишається різким
+    pages[0].save(output, "PDF", save_all=True, append_images=pages[1:], resolution=SHEET_DPI)
+    return output.getvalue()
@@ -0,0 +1,316 @@
+import fcntl
+import functools
+import hashlib
+import json
+import math
+import mmap
+import os
+import struct
+import threading
+import time
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Optional, Tuple
+
+from jose import JWTError, jwt
+
+import auth
+import metrics
+
+# Захист спільних воркерів від одного клієнта, що завалює запитами:
+# 1. Token bucket на (клас маршруту, користувач із JWT або IP для анонімних).
+#    Відра лежать у спільному mmap-файлі, тож ліміт один на всі uvicorn-воркери хоста.
+# 2. Адаптивне скидання навантаження: кожен воркер тримає ліміт одночасних запитів
+#    і зменшує його, коли латентність перевищує ціль (черга росте), — зайві запити
+#    одразу отримують 503 з Retry-After замість очікування в черзі.
+
+RATE_LIMIT_ENABLED = os.getenv("RATE_LIMIT_ENABLED", "1") == "1"
+RATE_LIMIT_FILE = Path(os.getenv("RATE_LIMIT_FILE", str(metrics.METRICS_DIR / "rate-limits.bin")))
+RATE_LIMIT_SLOTS = int(os.getenv("RATE_LIMIT_SLOTS", "16384"))
+# IP клієнта — з X-Real-IP від nginx; без проксі заголовок підробляється, тож лише за явним дозволом
+TRUST_PROXY_HEADERS = os.getenv("TRUST_PROXY_HEADERS", "0") == "1"
+
+LOAD_SHED_ENABLED = os.getenv("LOAD_SHED_ENABLED", "1") == "1"
+LOAD_SHED_TARGET_MS = float(os.getenv("LOAD_SHED_TARGET_MS", "250"))
+LOAD_SHED_MIN_INFLIGHT = int(os.getenv("LOAD_SHED_MIN_INFLIGHT", "8"))
+LOAD_SHED_MAX_INFLIGHT = int(os.getenv("LOAD_SHED_MAX_INFLIGHT", "200"))
+LOAD_SHED_INTERVAL = 0.5
+
+
+@dataclass(frozen=True)
+class RouteClass:
+    name: str
+    per_minute: float
+    burst: int
+    # Анонімні маршрути (логін, реєстрація) — завжди за IP
+    by_ip: bool = False
+    # Файли й експорт довгі за природою: не входять у ліміт одночасних запитів і його латентність
+    sheddable: bool = True
+
+    @property
+    def rate(self) -> float:
+        return self.per_minute / 60.0
+
+
+def _route_class(name: str, per_minute: float, burst: int, **options) -> RouteClass:
+    # RATE_LIMIT_AUTH=20:10 — запитів за хвилину : розмір пачки
+    override = os.getenv(f"RATE_LIMIT_{name.upper()}")
+    if override:
+        per_minute, burst = override.split(":")
+    return RouteClass(name, float(per_minute), int(burst), **options)
+
+
+# Логін і реєстрація — bcrypt на кожну спробу
+AUTH = _route_class("auth", 20, 10, by_ip=True)
+TRANSFER = _route_class("transfer", 30, 10, sheddable=False)
+# Повні списки, синхронізація, агрегати, пошук, пакетні записи
+HEAVY = _route_class("heavy", 120, 30)
+WRITE = _route_class("write", 300, 60)
+READ = _route_class("read", 600, 120)
+
+HEAVY_ROUTES = {
+    ("GET", "/api/items"), ("GET", "/api/boxes"), ("GET", "/api/sync"), ("GET", "/api/stats"),
+    ("GET", "/api/search"), ("POST", "/api/items/batch"), ("POST", "/api/boxes/qr-sheet"),
+}
+# Health/metrics, довгий потік подій і фото (у кожній сторінці їх десятки; доступ — підписом)
+EXEMPT_PREFIXES = ("/api/health", "/api/metrics", "/api/media/", "/api/images/")
+EXEMPT_PATHS = {"/api/events"}
+
+
+def classify(method: str, path: str) -> Optional[RouteClass]:
+    if not path.startswith("/api/") or path.startswith(EXEMPT_PREFIXES) or path in EXEMPT_PATHS or method == "OPTIONS":
+        return None
+    if path.startswith("/api/auth/") and method == "POST":
+        return AUTH
+    if path.startswith(("/api/upload", "/api/import", "/api/export")):
+        return TRANSFER
+    if (method, path) in HEAVY_ROUTES:
+        return HEAVY
+    return READ if method in ("GET", "HEAD") else WRITE
+
+
+# ============ SHARED BUCKETS ============
+
+class SharedBuckets:
+    """Token buckets in an mmap'd file shared by all worker processes of one host."""
+
+    # Слот: хеш ключа (0 — порожній), токени, час останнього оновлення
+    SLOT = struct.Struct("<Qdd")
+    PROBES = 8
+    LOCK_ATTEMPTS = 3
+
+    def __init__(self, path: Path = RATE_LIMIT_FILE, slots: int = RATE_LIMIT_SLOTS):
+        self.path = Path(path)
+        self.slots = slots
+        self._lock = threading.Lock()
+        self._fd: Optional[int] = None
+        self._map: Optional[mmap.mmap] = None
+
+    def _open(self):
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o600)
+        size = self.slots * self.SLOT.size
+        # Кілька воркерів можуть створити файл одночасно: ftruncate до того самого розміру безпечний
+        if os.fstat(fd).st_size < size:
+            os.ftruncate(fd, size)
+        self._map = mmap.mmap(fd, size)
+        self._fd = fd
+
+    def _try_lock(self) -> bool:
+        # take викликається з event loop: блокуючий LOCK_EX зупинив би всі корутини воркера,
+        # якщо власника замка в іншому процесі саме витіснив планувальник. Сама критична
+        # секція — кілька мікросекунд, тож кілька спроб з поступкою потоку, а далі — без ліміту
+        for _ in range(self.LOCK_ATTEMPTS):
+            try:
+                fcntl.flock(self._fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                return True
+            except BlockingIOError:
+                time.sleep(0)
+        return False
+
+    def take(self, key: str, rate: float, burst: int, now: Optional[float] = None) -> Optional[float]:
+        # 0 — запит дозволено; інакше через скільки секунд з'явиться токен;
+        # None — спільна таблиця зайнята іншим воркером, запит пропускається без перевірки
+        now = time.time() if now is None else now
+        digest = int.from_bytes(hashlib.blake2b(key.encode("utf-8"), digest_size=8).digest(), "little") or 1
+        with self._lock:
+            if self._map is None:
+                self._open()
+            # flock — між процесами, threading.Lock — між потоками одного процесу
+            if not self._try_lock():
+                return None
+            try:
+                offset, tokens, updated = self._find(digest, now, burst)
+                tokens = min(float(burst), tokens + max(0.0, now - updated) * rate)
+                allowed = tokens >= 1.0
+                if allowed:
+                    tokens -= 1.0
+                self.SLOT.pack_into(self._map, offset, digest, tokens, now)
+            finally:
+                fcntl.flock(self._fd, fcntl.LOCK_UN)
+        return 0.0 if allowed else (1.0 - tokens) / rate
+
+    def _find(self, digest: int, now: float, burst: int) -> Tuple[int, float, float]:
+        # Відкрита адресація на кілька слотів; таблиця повна — витісняється найстаріше
+        # відро (воно здебільшого вже повне, тож ліміт від цього не слабшає)
+        start = digest % self.slots
+        oldest = None
+        for probe in range(self.PROBES):
+            offset = ((start + probe) % self.slots) * self.SLOT.size
+            slot_digest, tokens, updated = self.SLOT.unpack_from(self._map, offset)
+            if slot_digest == digest:
+                return offset, tokens, updated
+            if slot_digest == 0:
+                return offset, float(burst), now
+            if oldest is None or updated < oldest[1]:
+                oldest = (offset, updated)
+        return oldest[0], float(burst), now
+
+    def close(self):
+        with self._lock:
+            if self._map is not None:
+                self._map.close()
+                os.close(self._fd)
+                self._map = self._fd = None
+
+
+# ============ LOAD SHEDDING ============
+
+class LoadShedder:
+    """Per-worker adaptive concurrency limit (AIMD on average latency)."""
+
+    def __init__(self, target_ms: float = LOAD_SHED_TARGET_MS, min_limit: int = LOAD_SHED_MIN_INFLIGHT,
+                 max_limit: int = LOAD_SHED_MAX_INFLIGHT, interval: float = LOAD_SHED_INTERVAL):
+        self.target = target_ms / 1000
+        self.min_limit = min_limit
+        self.max_limit = max_limit
+        self.interval = interval
+        self.limit = max_limit
+        self.in_flight = 0
+        self.shed = 0
+        self._window_started = time.monotonic()
+        self._latency_sum = 0.0
+        self._completed = 0
+        self._peak = 0
+
+    def admit(self) -> bool:
+        # Викликається лише з event loop воркера — без блокувань
+        if self.in_flight >= self.limit:
+            self.shed += 1
+            return False
+        self.in_flight += 1
+        self._peak = max(self._peak, self.in_flight)
+        return True
+
+    def release(self, elapsed: float, now: Optional[float] = None):
+        self.in_flight -= 1
+        self._latency_sum += elapsed
+        self._completed += 1
+        now = time.monotonic() if now is None else now
+        if now - self._window_started >= self.interval:
+            self._adjust()
+            self._window_started = now
+
+    def _adjust(self):
+        average = self._latency_sum / self._completed
+        if average > self.target:
+            # Латентність вища за ціль — запити стоять у черзі (threadpool, пул БД):
+            # ліміт падає нижче фактичної паралельності
+            self.limit = max(self.min_limit, int(min(self.limit, self._peak) * 0.8))
+        elif self._peak >= self.limit * 0.8:
+            # Ліміт досягається, а латентність у нормі — можна більше
+            self.limit = min(self.max_limit, self.limit + max(1, self.limit // 10))
+        self._latency_sum = 0.0
+        self._completed = 0
+        self._peak = self.in_flight
+
+    def stats(self) -> dict:
+        return {"limit": self.limit, "in_flight": self.in_flight, "shed": self.shed}
+
+
+# Ліміт воркера; його стан показує /api/health
+load_shedder = LoadShedder()
+
+
+# ============ MIDDLEWARE ============
+
+@functools.lru_cache(maxsize=4096)
+def _user_from_token(token: str) -> Optional[str]:
+    # Лише для ключа відра: підпис перевіряється (чужий sub не підробити), строк дії — ні;
+    # справжня автентифікація — у самому маршруті
+    try:
+        payload = jwt.decode(token, auth.SECRET_KEY, algorithms=[auth.ALGORITHM], options={"verify_exp": False})
+    except JWTError:
+        return None
+    subject = payload.get("sub")
+    return str(subject) if subject is not None else None
+
+
+def client_key(scope, route_class: RouteClass) -> str:
+    headers = dict(scope["headers"])
+    if not route_class.by_ip:
+        authorization = headers.get(b"authorization", b"").decode("latin-1")
+        scheme, _, token = authorization.partition(" ")
+        user = _user_from_token(token) if scheme.lower() == "bearer" and token else None
+        if user is not None:
+            return f"{route_class.name}:user:{user}"
+    ip = None
+    if TRUST_PROXY_HEADERS:
+        ip = headers.get(b"x-real-ip", b"").decode("latin-1") or None
+    if ip is None:
+        client = scope.get("client")
+        ip = client[0] if client else "unknown"
+    return f"{route_class.name}:ip:{ip}"
+
+
+async def _reject(send, status: int, detail: str, retry_after: float):
+    body = json.dumps({"detail": detail}).encode("utf-8")
+    await send({
+        "type": "http.response.start",
+        "status": status,
+        "headers": [
+            (b"content-type", b"application/json"),
+            (b"content-length", str(len(body)).encode("ascii")),
+            (b"retry-after", str(max(1, math.ceil(retry_after))).encode("ascii")),
+        ],
+    })
+    await send({"type": "http.response.body", "body": body})
+
+
+class RateLimitMiddleware:
+    """Rejects over-budget clients with 429 and sheds excess load with 503, both with Retry-After."""
+
+    def __init__(self, app, buckets: Optional[SharedBuckets] = None, shedder: Optional[LoadShedder] = None,
+                 rate_limits: bool = RATE_LIMIT_ENABLED, load_shedding: bool = LOAD_SHED_ENABLED):
+        self.app = app
+        self.buckets = (buckets or SharedBuckets()) if rate_limits else None
+        self.shedder = (shedder or load_shedder) if load_shedding else None
+
+    async def __call__(self, scope, receive, send):
+        route_class = classify(scope["method"], scope["path"]) if scope["type"] == "http" else None
+        if route_class is None:
+            await self.app(scope, receive, send)
+            return
+
+        if self.buckets is not None:
+            wait = self.buckets.take(client_key(scope, route_class), route_class.rate, route_class.burst)
+            if wait is None:
+                # Fail-open: краще зрідка пропустити запит понад бюджет, ніж гальмувати воркер
+                metrics.RATE_LIMIT_CONTENDED.inc((route_class.name,))
+            elif wait > 0:
+                metrics.RATE_LIMITED.inc((route_class.name,))
+                await _reject(send, 429, "Too many requests", wait)
+                return
+
+        if self.shedder is None or not route_class.sheddable:
+            await self.app(scope, receive, send)
+            return
+        if not self.shedder.admit():
+            metrics.SHED_REQUESTS.inc((route_class.name,))
+            await _reject(send, 503, "Server is busy, please retry", 1)
+            return
+        started = time.perf_counter()
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            self.shedder.release(time.perf_counter() - started)
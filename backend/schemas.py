@@ -1,6 +1,8 @@
-from pydantic import BaseModel, EmailStr
-from typing import Optional, List
+from pydantic import BaseModel, EmailStr, Field, computed_field
+from typing import Annotated, Optional, List, Dict, Literal, Union
 from datetime import datetime
+from thumbnails import derivative_urls
+import media
 
 class UserBase(BaseModel):
     username: str
@@ -44,10 +46,61 @@ class Item(ItemBase):
     box_id: int
     created_at: datetime
     updated_at: datetime
+
+    @computed_field
+    @property
+    def photo_thumbnails(self) -> Optional[Dict[str, str]]:
+        return derivative_urls(self.photo_url)
+
+    @computed_field
+    @property
+    def photo_src(self) -> Optional[str]:
+        return media.photo_src(self.photo_url)
     
     class Config:
         from_attributes = True
 
+MAX_BATCH_OPERATIONS = 1000
+
+class ItemBatchCreate(BaseModel):
+    op: Literal["create"]
+    item: ItemCreate
+
+class ItemBatchUpdate(BaseModel):
+    op: Literal["update"]
+    id: int
+    changes: ItemUpdate
+
+class ItemBatchMove(BaseModel):
+    op: Literal["move"]
+    ids: List[int] = Field(min_length=1, max_length=MAX_BATCH_OPERATIONS)
+    box_id: int
+
+class ItemBatchDelete(BaseModel):
+    op: Literal["delete"]
+    id: int
+
+ItemBatchOperation = Annotated[
+    Union[ItemBatchCreate, ItemBatchUpdate, ItemBatchMove, ItemBatchDelete],
+    Field(discriminator="op"),
+]
+
+class ItemBatch(BaseModel):
+    operations: List[ItemBatchOperation] = Field(min_length=1, max_length=MAX_BATCH_OPERATIONS)
+    # atomic: будь-яка помилка скасовує весь батч; інакше виконуються лише валідні операції
+    atomic: bool = True
+
+class ItemBatchResult(BaseModel):
+    index: int
+    op: str
+    status: int
+    ids: List[int] = []
+    detail: Optional[str] = None
+
+class ItemBatchResponse(BaseModel):
+    applied: bool
+    results: List[ItemBatchResult]
+
 class BoxBase(BaseModel):
     name: str
     description: Optional[str] = None
@@ -72,8 +125,118 @@ class Box(BoxBase):
     owner_id: int
     created_at: datetime
     updated_at: datetime
-    items: List[Item] = []
+    items: Optional[List[Item]] = None
+    item_count: int = 0
     is_shared: bool = False
+
+    @computed_field
+    @property
+    def photo_thumbnails(self) -> Optional[Dict[str, str]]:
+        return derivative_urls(self.photo_url)
+
+    @computed_field
+    @property
+    def photo_src(self) -> Optional[str]:
+        return media.photo_src(self.photo_url)
     
     class Config:
-        from_attributes = True
\ No newline at end of file
+        from_attributes = True
+
+class BoxQrLookup(BaseModel):
+    # Компактна відповідь для сканера: без речей і фото
+    id: int
+    name: str
+    location: Optional[str] = None
+    qr_code: str
+    item_count: int = 0
+    is_shared: bool = False
+
+class QrSheetRequest(BaseModel):
+    # None = усі доступні коробки
+    box_ids: Optional[List[int]] = Field(None, min_length=1)
+
+class SyncShare(BaseModel):
+    box_id: int
+    user_id: int
+    shared_at: Optional[datetime] = None
+
+class SyncDeletion(BaseModel):
+    # box; item — видалена чи перенесена з box_id; share — у користувача id забрали доступ до box_id
+    type: Literal["box", "item", "share"]
+    id: int
+    box_id: int
+
+class SyncResponse(BaseModel):
+    token: str
+    has_more: bool
+    # true: токен відсутній чи застарів — повне завантаження, потім sync від token
+    reset: bool
+    boxes: List[Box]
+    items: List[Item]
+    shares: List[SyncShare]
+    deleted: List[SyncDeletion]
+
+class BoxFacet(BaseModel):
+    box_id: int
+    name: str
+    location: Optional[str] = None
+    count: int
+
+class CategoryFacet(BaseModel):
+    category: str
+    count: int
+
+class LocationFacet(BaseModel):
+    location: Optional[str] = None
+    count: int
+
+class GrowthPoint(BaseModel):
+    month: str  # YYYY-MM
+    added: int
+    removed: int
+    total: int
+
+class InventoryStats(BaseModel):
+    total: int
+    # aggregates — з item_stats; items — фільтри по назві/датах рахуються по речах
+    source: Literal["aggregates", "items"]
+    boxes: List[BoxFacet]
+    categories: List[CategoryFacet]
+    locations: List[LocationFacet]
+    growth: List[GrowthPoint]
+
+class SearchResult(BaseModel):
+    type: str
+    id: int
+    name: str
+    box_id: int
+    category: Optional[str] = None
+    location: Optional[str] = None
+    rank: float
+
+class DirectUploadRequest(BaseModel):
+    content_type: str
+    size: int = Field(gt=0)
+
+class DirectUploadPart(BaseModel):
+    part_number: int
+    url: str
+
+class DirectUpload(BaseModel):
+    token: str
+    photo_url: str
+    # Заголовки, які клієнт мусить надіслати з PUT (входять у підпис)
+    headers: Dict[str, str]
+    expires_at: int
+    # Один PUT на url або multipart: частини по part_size байт, кожна на свій url
+    url: Optional[str] = None
+    part_size: Optional[int] = None
+    parts: Optional[List[DirectUploadPart]] = None
+
+class CompletedPart(BaseModel):
+    part_number: int = Field(ge=1, le=10000)
+    etag: str
+
+class DirectUploadComplete(BaseModel):
+    token: str
+    parts: Optional[List[CompletedPart]] = Field(default=None, max_length=10000)
@@ -0,0 +1,139 @@
+from sqlalchemy import String, case, func, literal, literal_column, null, or_, select, union_all
+from sqlalchemy.orm import Session
+
+import models
+
+# Ранжований пошук гортається OFFSET-ом по union-запиту: глибше цієї межі сторінок
+# немає, щоб курсор не змушував БД рахувати й відкидати довільно багато рядків
+MAX_SEARCH_OFFSET = 1000
+
+# Об'єкти схеми, які створює лише міграція пошуку (Postgres) і яких немає в models.py
+SEARCH_SCHEMA_OBJECTS = {
+    "search_vector",
+    "ix_items_search_vector",
+    "ix_items_name_trgm",
+    "ix_items_description_trgm",
+    "ix_items_category_trgm",
+    "ix_boxes_search_vector",
+    "ix_boxes_name_trgm",
+    "ix_boxes_location_trgm",
+}
+
+
+def _postgres_queries(q: str, accessible_box_ids):
+    tsquery = func.websearch_to_tsquery("simple", q)
+    item_vector = literal_column("items.search_vector")
+    box_vector = literal_column("boxes.search_vector")
+
+    item_rank = func.ts_rank(item_vector, tsquery) + func.greatest(
+        func.similarity(models.Item.name, q),
+        func.similarity(models.Item.category, q),
+        func.word_similarity(q, models.Item.description),
+    )
+    items = select(
+        literal("item").label("type"),
+        models.Item.id,
+        models.Item.name,
+        models.Item.box_id,
+        models.Item.category,
+        null().cast(String).label("location"),
+        item_rank.label("rank"),
+    ).where(
+        models.Item.box_id.in_(accessible_box_ids),
+        or_(
+            item_vector.op("@@")(tsquery),
+            models.Item.name.op("%")(q),
+            models.Item.category.op("%")(q),
+            literal(q).op("<%")(models.Item.description),
+        ),
+    )
+
+    box_rank = func.ts_rank(box_vector, tsquery) + func.greatest(
+        func.similarity(models.Box.name, q),
+        func.similarity(models.Box.location, q),
+    )
+    boxes = select(
+        literal("box").label("type"),
+        models.Box.id,
+        models.Box.name,
+        models.Box.id.label("box_id"),
+        null().cast(String).label("category"),
+        models.Box.location,
+        box_rank.label("rank"),
+    ).where(
+        models.Box.id.in_(accessible_box_ids),
+        or_(
+            box_vector.op("@@")(tsquery),
+            models.Box.name.op("%")(q),
+            models.Box.location.op("%")(q),
+        ),
+    )
+    return items, boxes
+
+
+def _fallback_queries(q: str, accessible_box_ids):
+    # SQLite та інші: LIKE без індексів, ранг — збіг на початку назви важить більше.
+    # autoescape: % і _ у запиті шукаються буквально, а не як шаблон
+    def contains(column):
+        return column.icontains(q, autoescape=True)
+
+    def starts(column):
+        return column.istartswith(q, autoescape=True)
+
+    item_rank = case(
+        (starts(models.Item.name), 1.0),
+        (contains(models.Item.name), 0.75),
+        (contains(models.Item.category), 0.5),
+        else_=0.25,
+    )
+    items = select(
+        literal("item").label("type"),
+        models.Item.id,
+        models.Item.name,
+        models.Item.box_id,
+        models.Item.category,
+        null().cast(String).label("location"),
+        item_rank.label("rank"),
+    ).where(
+        models.Item.box_id.in_(accessible_box_ids),
+        or_(
+            contains(models.Item.name),
+            contains(models.Item.description),
+            contains(models.Item.category),
+        ),
+    )
+
+    box_rank = case(
+        (starts(models.Box.name), 1.0),
+        (contains(models.Box.name), 0.75),
+        else_=0.5,
+    )
+    boxes = select(
+        literal("box").label("type"),
+        models.Box.id,
+        models.Box.name,
+        models.Box.id.label("box_id"),
+        null().cast(String).label("category"),
+        models.Box.location,
+        box_rank.label("rank"),
+    ).where(
+        models.Box.id.in_(accessible_box_ids),
+        or_(contains(models.Box.name), contains(models.Box.location)),
+    )
+    return items, boxes
+
+
+def search(db: Session, q: str, accessible_box_ids, limit: int, offset: int = 0):
+    if db.get_bind().dialect.name == "postgresql":
+        items, boxes = _postgres_queries(q, accessible_box_ids)
+    else:
+        items, boxes = _fallback_queries(q, accessible_box_ids)
+
+    results = union_all(items, boxes).subquery()
+    query = (
+        select(results)
+        .order_by(results.c.rank.desc(), results.c.type, results.c.id)
+        .limit(limit)
+        .offset(offset)
+    )
+    return db.execute(query).mappings().all()
@@ -0,0 +1,50 @@
+from typing import Any, Dict, Mapping, Optional
+
+from fastapi import Response
+from fastapi.responses import ORJSONResponse
+
+import media
+import models
+from thumbnails import derivative_urls
+
+# Швидкий шлях для великих списків: рядки SQL -> dict -> orjson, без pydantic-моделей
+# і без повторної валідації response_model. Форма JSON та сама, що в schemas.Box/Item.
+
+BOX_COLUMNS = (
+    models.Box.id, models.Box.name, models.Box.description, models.Box.location, models.Box.photo_url,
+    models.Box.qr_code, models.Box.owner_id, models.Box.created_at, models.Box.updated_at,
+)
+ITEM_COLUMNS = (
+    models.Item.id, models.Item.name, models.Item.description, models.Item.category, models.Item.photo_url,
+    models.Item.box_id, models.Item.created_at, models.Item.updated_at,
+)
+
+# Заголовки тіла рахуються заново для нової відповіді
+_BODY_HEADERS = {"content-length", "content-type"}
+
+
+def item_row(row: Mapping[str, Any]) -> Dict[str, Any]:
+    item = dict(row)
+    item["photo_thumbnails"] = derivative_urls(item["photo_url"])
+    item["photo_src"] = media.photo_src(item["photo_url"])
+    return item
+
+
+def box_row(row: Mapping[str, Any]) -> Dict[str, Any]:
+    box = dict(row)
+    box["is_shared"] = bool(box.get("is_shared"))
+    box["photo_thumbnails"] = derivative_urls(box["photo_url"])
+    box["photo_src"] = media.photo_src(box["photo_url"])
+    return box
+
+
+def json_response(content: Any, response: Optional[Response] = None) -> ORJSONResponse:
+    # Заголовки, виставлені обробником на injected Response (ETag, X-Next-Cursor),
+    # інакше загубились би: FastAPI не зливає їх, коли повертається готова відповідь
+    result = ORJSONResponse(content)
+    if response is not None:
+        for key, value in response.headers.items():
+            if key not in _BODY_HEADERS:
+                result.headers[key] = value
+    return result
+
@@ -0,0 +1,212 @@
+import argparse
+from datetime import date, datetime
+from typing import Iterable, List, Optional, Tuple
+
+from fastapi import HTTPException
+from sqlalchemy import Date, cast, delete, func, insert, literal, select
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.orm import Session
+
+import models
+import permissions
+
+# Статистика інвентарю (/api/stats): кількість речей за коробками, категоріями,
+# місцями й приріст по місяцях. Записи речей оновлюють item_stats у своїй транзакції
+# (record), тож читання — кілька GROUP BY по агрегатах, незалежно від кількості речей.
+# Фільтри, яких агрегати не знають (назва, дати), рахуються по самих речах.
+
+def month_start(moment: Optional[datetime] = None) -> date:
+    moment = moment or datetime.utcnow()
+    return date(moment.year, moment.month, 1)
+
+
+def month_of(db: Session, column):
+    # Перше число місяця як DATE; на SQLite дати — рядки 'YYYY-MM-DD'
+    if db.get_bind().dialect.name == "postgresql":
+        return cast(func.date_trunc("month", column), Date)
+    return func.date(column, "start of month")
+
+
+# ============ WRITE PATH ============
+
+def record(db: Session, changes: Iterable[Tuple[int, str, int]], moment: Optional[datetime] = None):
+    # changes: (box_id, category, +n/-n). Переміщення й зміна категорії — пара -1/+1
+    totals = {}
+    for box_id, category, delta in changes:
+        entry = totals.setdefault((box_id, category), [0, 0])
+        entry[0 if delta > 0 else 1] += abs(delta)
+    if not totals:
+        return
+    month = month_start(moment)
+    # Від дедлоків захищає лише порядок: паралельні транзакції блокують рядки item_stats
+    # у тому самому (відсортованому) порядку ключів; спільного лічильника-замка, що
+    # серіалізував би записи, немає. rebuild (DELETE + INSERT…SELECT) блокує в іншому
+    # порядку, тож його викликають лише для щойно вставлених коробок (імпорт) або з CLI,
+    # коли на ці рядки ніхто інший не пише
+    rows = [
+        {"box_id": box_id, "category": category, "month": month, "added": added, "removed": removed}
+        for (box_id, category), (added, removed) in sorted(totals.items())
+    ]
+    dialect = postgresql if db.get_bind().dialect.name == "postgresql" else sqlite
+    statement = dialect.insert(models.ItemStat)
+    db.execute(
+        statement.on_conflict_do_update(
+            index_elements=[models.ItemStat.box_id, models.ItemStat.category, models.ItemStat.month],
+            set_={
+                "added": models.ItemStat.added + statement.excluded.added,
+                "removed": models.ItemStat.removed + statement.excluded.removed,
+            },
+        ),
+        rows,
+    )
+
+
+def rebuild(db: Session, box_ids: Optional[Iterable[int]] = None):
+    # Перерахунок з items: після імпорту (нові коробки, ще не видимі іншим) або для
+    # виправлення розбіжностей. Не для коробок, у які паралельно пишуть (див. record).
+    # Історія прибраних речей при цьому втрачається — лишається поточний стан за місяцем створення
+    item = models.Item
+    month = month_of(db, item.created_at)
+    query = select(item.box_id, item.category, month, func.count(), literal(0)).group_by(item.box_id, item.category, month)
+    clear = delete(models.ItemStat)
+    if box_ids is not None:
+        box_ids = list(box_ids)
+        query = query.where(item.box_id.in_(box_ids))
+        clear = clear.where(models.ItemStat.box_id.in_(box_ids))
+    db.execute(clear)
+    db.execute(insert(models.ItemStat).from_select(["box_id", "category", "month", "added", "removed"], query))
+
+
+# ============ READ ============
+
+def _month_label(value) -> str:
+    return str(value)[:7]
+
+
+def inventory_stats(
+    db: Session,
+    principal,
+    box_id: Optional[int] = None,
+    category: Optional[str] = None,
+    location: Optional[str] = None,
+    **item_filters,
+) -> dict:
+    if box_id is not None and not permissions.can_access(db, principal, box_id):
+        raise HTTPException(status_code=403, detail="Access denied")
+
+    boxes = select(models.Box.id).where(models.Box.id.in_(permissions.accessible_box_ids(principal.id)))
+    if box_id is not None:
+        boxes = boxes.where(models.Box.id == box_id)
+    if location is not None:
+        boxes = boxes.where(models.Box.location == location)
+
+    if any(value is not None for value in item_filters.values()):
+        by_box, by_category, growth = _from_items(db, boxes, category, **item_filters)
+        source = "items"
+    else:
+        by_box, by_category, growth = _from_aggregates(db, boxes, category)
+        source = "aggregates"
+
+    names = {}
+    if by_box:
+        names = {
+            row.id: row for row in db.execute(
+                select(models.Box.id, models.Box.name, models.Box.location).where(models.Box.id.in_(list(by_box)))
+            )
+        }
+    box_facets = sorted(
+        ({"box_id": key, "name": names[key].name, "location": names[key].location, "count": count}
+         for key, count in by_box.items() if key in names),
+        key=lambda facet: (-facet["count"], facet["name"], facet["box_id"]),
+    )
+    locations = {}
+    for facet in box_facets:
+        locations[facet["location"]] = locations.get(facet["location"], 0) + facet["count"]
+
+    total = 0
+    months = []
+    for month, added, removed in growth:
+        total += added - removed
+        months.append({"month": _month_label(month), "added": added, "removed": removed, "total": total})
+
+    return {
+        "total": sum(by_box.values()),
+        "source": source,
+        "boxes": box_facets,
+        "categories": [
+            {"category": key, "count": count}
+            for key, count in sorted(by_category.items(), key=lambda pair: (-pair[1], pair[0]))
+        ],
+        "locations": [
+            {"location": key, "count": count}
+            for key, count in sorted(locations.items(), key=lambda pair: (-pair[1], pair[0] or ""))
+        ],
+        "growth": months,
+    }
+
+
+def _from_aggregates(db: Session, boxes, category: Optional[str]):
+    stat = models.ItemStat
+    conditions = [stat.box_id.in_(boxes)]
+    if category is not None:
+        conditions.append(stat.category == category)
+    count = func.sum(stat.added - stat.removed)
+    by_box = dict(db.execute(select(stat.box_id, count).where(*conditions).group_by(stat.box_id).having(count > 0)).all())
+    by_category = dict(
+        db.execute(select(stat.category, count).where(*conditions).group_by(stat.category).having(count > 0)).all()
+    )
+    growth = db.execute(
+        select(stat.month, func.sum(stat.added), func.sum(stat.removed))
+        .where(*conditions).group_by(stat.month).order_by(stat.month)
+    ).all()
+    return by_box, by_category, growth
+
+
+def _from_items(db: Session, boxes, category: Optional[str], name_prefix=None, created_after=None, created_before=None,
+                updated_after=None, updated_before=None):
+    # Ті самі умови, що й у crud.list_items; приріст — за місяцем створення
+    item = models.Item
+    conditions = [item.box_id.in_(boxes)]
+    if category is not None:
+        conditions.append(item.category == category)
+    if name_prefix:
+        conditions.append(item.name.startswith(name_prefix, autoescape=True))
+    if created_after is not None:
+        conditions.append(item.created_at >= created_after)
+    if created_before is not None:
+        conditions.append(item.created_at < created_before)
+    if updated_after is not None:
+        conditions.append(item.updated_at >= updated_after)
+    if updated_before is not None:
+        conditions.append(item.updated_at < updated_before)
+
+    month = month_of(db, item.created_at)
+    rows = db.execute(
+        select(item.box_id, item.category, month, func.count()).where(*conditions).group_by(item.box_id, item.category, month)
+    ).all()
+    by_box = {}
+    by_category = {}
+    by_month = {}
+    for box, item_category, item_month, count in rows:
+        by_box[box] = by_box.get(box, 0) + count
+        by_category[item_category] = by_category.get(item_category, 0) + count
+        by_month[item_month] = by_month.get(item_month, 0) + count
+    return by_box, by_category, [(key, count, 0) for key, count in sorted(by_month.items())]
+
+
+# ============ MAINTENANCE ============
+
+def main(argv: Optional[List[str]] = None):
+    parser = argparse.ArgumentParser(description="Recompute item_stats for /api/stats from the items table.")
+    parser.add_argument("--box", type=int, action="append", dest="box_ids", help="only these boxes (repeatable)")
+    args = parser.parse_args(argv)
+
+    import database
+    with database.SessionLocal() as db:
+        rebuild(db, args.box_ids)
+        db.commit()
+    print("Rebuilt item statistics" + (f" for boxes {args.box_ids}" if args.box_ids else ""))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,313 @@
+from abc import ABC, abstractmethod
+import contextlib
+import math
+import os
+from datetime import datetime
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional
+
+# Де лежать оригінали завантажень. local — каталог UPLOAD_DIR (один хост), s3 —
+# S3-сумісне сховище (AWS, MinIO): бекенд можна запускати на кількох хостах, а
+# великі фото клієнт вантажить напряму за presigned URL, повз воркери API.
+# Похідні зображення й QR-мітки відтворювані з оригіналу — вони завжди в
+# локальному UPLOAD_DIR як кеш кожного хоста.
+
+STORAGE_BACKEND = os.getenv("STORAGE_BACKEND", "local")
+S3_BUCKET = os.getenv("S3_BUCKET", "")
+S3_PREFIX = os.getenv("S3_PREFIX", "uploads/")
+S3_REGION = os.getenv("S3_REGION", "us-east-1")
+S3_ENDPOINT_URL = os.getenv("S3_ENDPOINT_URL") or None
+# Адреса сховища для браузера, якщо відрізняється від внутрішньої (MinIO у docker-мережі)
+S3_PUBLIC_ENDPOINT_URL = os.getenv("S3_PUBLIC_ENDPOINT_URL") or None
+# Файли від порогу йдуть частинами: паралельно й з повтором лише невдалої частини
+S3_MULTIPART_THRESHOLD = int(os.getenv("S3_MULTIPART_THRESHOLD", str(16 * 1024 * 1024)))
+S3_MULTIPART_CHUNK_SIZE = int(os.getenv("S3_MULTIPART_CHUNK_SIZE", str(8 * 1024 * 1024)))
+# Обмеження S3: частина від 5 MiB (крім останньої), не більше 10000 частин
+S3_MIN_PART_SIZE = 5 * 1024 * 1024
+S3_MAX_PARTS = 10000
+PRESIGN_EXPIRES_SECONDS = int(os.getenv("PRESIGN_EXPIRES_SECONDS", "3600"))
+CACHE_CONTROL = "private, max-age=31536000, immutable"
+
+
+class Storage(ABC):
+    """Interface for original uploads; names are flat (`<sha256>.<ext>`, `<uuid>.<ext>`)."""
+
+    supports_direct_upload = False
+
+    @abstractmethod
+    def put_file(self, path: Path, name: str, content_type: Optional[str] = None):
+        # Забирає готовий локальний файл (path більше не існує після виклику)
+        ...
+
+    @abstractmethod
+    def exists(self, name: str) -> bool:
+        ...
+
+    @abstractmethod
+    def find(self, stem: str) -> Optional[str]:
+        # Ім'я з розширенням за stem — для похідних /api/images/<size>/<stem>.<fmt>
+        ...
+
+    @abstractmethod
+    def local_copy(self, name: str) -> Optional[Path]:
+        # Локальний шлях для Pillow; None — файлу немає
+        ...
+
+    @abstractmethod
+    def read_head(self, name: str, length: int) -> bytes:
+        ...
+
+    @abstractmethod
+    def size(self, name: str) -> Optional[int]:
+        ...
+
+    @abstractmethod
+    def delete_many(self, names: Iterable[str]):
+        ...
+
+    def download_url(self, name: str) -> Optional[str]:
+        # None — файл віддає сам бекенд/nginx (media.send_file)
+        return None
+
+    def prune_cache(self, cutoff: datetime) -> int:
+        return 0
+
+    def abort_stale_uploads(self, cutoff: datetime) -> int:
+        # Прямі multipart-завантаження, початі до cutoff і не завершені
+        return 0
+
+
+# ============ LOCAL ============
+
+class LocalStorage(Storage):
+    def __init__(self, root: Path):
+        self.root = Path(root)
+
+    def path(self, name: str) -> Path:
+        return self.root / name
+
+    def put_file(self, path: Path, name: str, content_type: Optional[str] = None):
+        # Той самий вміст уже є (ім'я — хеш): тимчасовий файл просто прибирається
+        target = self.path(name)
+        if target.exists():
+            os.unlink(path)
+        else:
+            os.replace(path, target)
+
+    def exists(self, name: str) -> bool:
+        return self.path(name).is_file()
+
+    def find(self, stem: str) -> Optional[str]:
+        for path in self.root.glob(f"{stem}.*"):
+            if path.is_file() and not path.name.endswith(".part"):
+                return path.name
+        return None
+
+    def local_copy(self, name: str) -> Optional[Path]:
+        path = self.path(name)
+        return path if path.is_file() else None
+
+    def read_head(self, name: str, length: int) -> bytes:
+        with open(self.path(name), "rb") as source:
+            return source.read(length)
+
+    def size(self, name: str) -> Optional[int]:
+        try:
+            return self.path(name).stat().st_size
+        except FileNotFoundError:
+            return None
+
+    def delete_many(self, names: Iterable[str]):
+        for name in names:
+            with contextlib.suppress(FileNotFoundError):
+                self.path(name).unlink()
+
+
+# ============ S3 ============
+
+class S3Storage(Storage):
+    supports_direct_upload = True
+
+    def __init__(self, bucket: str, cache_dir: Path, prefix: str = S3_PREFIX, client=None, presign_client=None):
+        # boto3 потрібен лише з STORAGE_BACKEND=s3
+        import boto3
+        from boto3.s3.transfer import TransferConfig
+        from botocore.config import Config
+
+        self.bucket = bucket
+        self.prefix = prefix
+        # Оригінали, потрібні для похідних: щойно завантажені й скачані; чистить blobs.sweep
+        self.cache_dir = Path(cache_dir)
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+        config = Config(signature_version="s3v4", s3={"addressing_style": "path" if S3_ENDPOINT_URL else "auto"})
+        self.client = client or boto3.client("s3", endpoint_url=S3_ENDPOINT_URL, region_name=S3_REGION, config=config)
+        self.presign_client = presign_client or (
+            boto3.client("s3", endpoint_url=S3_PUBLIC_ENDPOINT_URL, region_name=S3_REGION, config=config)
+            if S3_PUBLIC_ENDPOINT_URL else self.client
+        )
+        self.transfer_config = TransferConfig(
+            multipart_threshold=S3_MULTIPART_THRESHOLD, multipart_chunksize=S3_MULTIPART_CHUNK_SIZE
+        )
+
+    def key(self, name: str) -> str:
+        return self.prefix + name
+
+    def _missing(self, error) -> bool:
+        return error.response.get("Error", {}).get("Code") in ("404", "NoSuchKey", "NotFound")
+
+    def put_file(self, path: Path, name: str, content_type: Optional[str] = None):
+        if not self.exists(name):
+            extra = {"CacheControl": CACHE_CONTROL}
+            if content_type:
+                extra["ContentType"] = content_type
+            # upload_file сам переходить на multipart від multipart_threshold
+            self.client.upload_file(str(path), self.bucket, self.key(name), ExtraArgs=extra, Config=self.transfer_config)
+        # Лишається в кеші: з нього одразу рендеряться похідні
+        os.replace(path, self.cache_dir / name)
+
+    def head(self, name: str) -> Optional[dict]:
+        from botocore.exceptions import ClientError
+        try:
+            return self.client.head_object(Bucket=self.bucket, Key=self.key(name))
+        except ClientError as error:
+            if self._missing(error):
+                return None
+            raise
+
+    def exists(self, name: str) -> bool:
+        return self.head(name) is not None
+
+    def size(self, name: str) -> Optional[int]:
+        head = self.head(name)
+        return None if head is None else head["ContentLength"]
+
+    def find(self, stem: str) -> Optional[str]:
+        cached = next((path.name for path in self.cache_dir.glob(f"{stem}.*") if not path.name.startswith(".")), None)
+        if cached is not None:
+            return cached
+        listing = self.client.list_objects_v2(Bucket=self.bucket, Prefix=self.key(stem + "."), MaxKeys=1)
+        contents = listing.get("Contents") or []
+        return contents[0]["Key"][len(self.prefix):] if contents else None
+
+    def local_copy(self, name: str) -> Optional[Path]:
+        from botocore.exceptions import ClientError
+        path = self.cache_dir / name
+        if path.is_file():
+            return path
+        temp_path = self.cache_dir / f".{name}.{os.getpid()}.part"
+        try:
+            self.client.download_file(self.bucket, self.key(name), str(temp_path), Config=self.transfer_config)
+        except ClientError as error:
+            with contextlib.suppress(FileNotFoundError):
+                temp_path.unlink()
+            if self._missing(error):
+                return None
+            raise
+        os.replace(temp_path, path)
+        return path
+
+    def read_head(self, name: str, length: int) -> bytes:
+        response = self.client.get_object(Bucket=self.bucket, Key=self.key(name), Range=f"bytes=0-{length - 1}")
+        return response["Body"].read()
+
+    def delete_many(self, names: Iterable[str]):
+        names = list(names)
+        # delete_objects — до 1000 ключів за запит
+        for start in range(0, len(names), 1000):
+            chunk = names[start:start + 1000]
+            self.client.delete_objects(
+                Bucket=self.bucket,
+                Delete={"Objects": [{"Key": self.key(name)} for name in chunk], "Quiet": True},
+            )
+        for name in names:
+            with contextlib.suppress(FileNotFoundError):
+                (self.cache_dir / name).unlink()
+
+    def download_url(self, name: str, expires: int = PRESIGN_EXPIRES_SECONDS) -> str:
+        return self.presign_client.generate_presigned_url(
+            "get_object", Params={"Bucket": self.bucket, "Key": self.key(name)}, ExpiresIn=expires
+        )
+
+    def prune_cache(self, cutoff: datetime) -> int:
+        removed = 0
+        for path in self.cache_dir.iterdir():
+            if path.is_file() and datetime.utcfromtimestamp(path.stat().st_mtime) < cutoff:
+                with contextlib.suppress(FileNotFoundError):
+                    path.unlink()
+                    removed += 1
+        return removed
+
+    # ---- прямі завантаження (presigned) ----
+
+    def upload_headers(self, content_type: str) -> Dict[str, str]:
+        # Заголовки входять у підпис presigned PUT: клієнт мусить надіслати саме їх
+        return {"Content-Type": content_type, "Cache-Control": CACHE_CONTROL}
+
+    def presign_put(self, name: str, content_type: str, expires: int = PRESIGN_EXPIRES_SECONDS) -> str:
+        headers = self.upload_headers(content_type)
+        return self.presign_client.generate_presigned_url(
+            "put_object",
+            Params={"Bucket": self.bucket, "Key": self.key(name), "ContentType": headers["Content-Type"],
+                    "CacheControl": headers["Cache-Control"]},
+            ExpiresIn=expires,
+        )
+
+    def create_multipart(self, name: str, content_type: str) -> str:
+        response = self.client.create_multipart_upload(
+            Bucket=self.bucket, Key=self.key(name), ContentType=content_type, CacheControl=CACHE_CONTROL
+        )
+        return response["UploadId"]
+
+    def presign_parts(self, name: str, upload_id: str, parts: int, expires: int = PRESIGN_EXPIRES_SECONDS) -> List[Dict]:
+        return [
+            {
+                "part_number": number,
+                "url": self.presign_client.generate_presigned_url(
+                    "upload_part",
+                    Params={"Bucket": self.bucket, "Key": self.key(name), "UploadId": upload_id, "PartNumber": number},
+                    ExpiresIn=expires,
+                ),
+            }
+            for number in range(1, parts + 1)
+        ]
+
+    def complete_multipart(self, name: str, upload_id: str, parts: List[Dict]):
+        self.client.complete_multipart_upload(
+            Bucket=self.bucket, Key=self.key(name), UploadId=upload_id,
+            MultipartUpload={"Parts": [
+                {"PartNumber": part["part_number"], "ETag": part["etag"]}
+                for part in sorted(parts, key=lambda part: part["part_number"])
+            ]},
+        )
+
+    def abort_multipart(self, name: str, upload_id: str):
+        from botocore.exceptions import ClientError
+        with contextlib.suppress(ClientError):
+            self.client.abort_multipart_upload(Bucket=self.bucket, Key=self.key(name), UploadId=upload_id)
+
+    def abort_stale_uploads(self, cutoff: datetime) -> int:
+        # Клієнт почав multipart і зник: частини займають місце в бакеті, доки їх не скасувати
+        aborted = 0
+        paginator = self.client.get_paginator("list_multipart_uploads")
+        for page in paginator.paginate(Bucket=self.bucket, Prefix=self.prefix):
+            for upload in page.get("Uploads", []):
+                if upload["Initiated"].replace(tzinfo=None) < cutoff:
+                    self.abort_multipart(upload["Key"][len(self.prefix):], upload["UploadId"])
+                    aborted += 1
+        return aborted
+
+
+def part_plan(size: int, chunk_size: int = S3_MULTIPART_CHUNK_SIZE):
+    # (розмір частини, кількість): частина не менша за 5 MiB і вміщається в 10000 частин
+    part_size = max(chunk_size, S3_MIN_PART_SIZE, math.ceil(size / S3_MAX_PARTS))
+    return part_size, max(1, math.ceil(size / part_size))
+
+
+def from_env(upload_dir: Path) -> Storage:
+    if STORAGE_BACKEND == "s3":
+        if not S3_BUCKET:
+            raise RuntimeError("STORAGE_BACKEND=s3 needs S3_BUCKET")
+        return S3Storage(S3_BUCKET, Path(upload_dir) / "cache")
+    if STORAGE_BACKEND != "local":
+        raise RuntimeError(f"Unknown STORAGE_BACKEND {STORAGE_BACKEND!r}")
+    return LocalStorage(upload_dir)
@@ -0,0 +1,237 @@
+import argparse
+from datetime import datetime, timedelta
+from typing import Iterable, List, Optional
+
+from fastapi import HTTPException
+from sqlalchemy import BigInteger, Text, and_, delete, func, insert, or_, select, tuple_, update
+from sqlalchemy.orm import Session
+
+import models
+import serialization
+from pagination import decode_cursor, encode_cursor
+from permissions import accessible_box_ids
+
+# Дельта-синхронізація (/api/sync). Кожна записуюча транзакція ставить змінених
+# рядкам свою версію; видалення лишають надгробки.
+#
+# На Postgres версія — id транзакції (pg_current_xact_id), без спільного лічильника:
+# записи різних користувачів не чекають один на одного. Id видаються на початку
+# транзакції, а не в порядку commit, тож читач віддає лише зміни нижче межі
+# видимості — xmin свого знімка: усі транзакції з меншим id уже завершились, і жодна
+# нова версія нижче межі не з'явиться. Довга транзакція лише затримує межу.
+# Старі версії з лічильника sync_state менші за будь-який id транзакції (кожне
+# збільшення лічильника сам витрачав окремий id), тож токени лишаються дійсними.
+#
+# SQLite (тести, розробка) і так пропускає одного записувача за раз: там версія —
+# лічильник sync_state, а межа — його значення.
+#
+# Порядок змін у відповіді: (версія, потік, id), у межах версії видалення йдуть
+# перед оновленнями — клієнт застосовує їх по черзі.
+
+SYNC_PAGE_SIZE = 500
+MAX_SYNC_PAGE_SIZE = 5000
+TOMBSTONE_RETENTION_DAYS = 30
+
+DELETED, BOXES, SHARES, ITEMS = range(4)
+# Позиція "усе до версії включно" — більша за будь-який потік
+DONE = 9
+
+
+def _postgres(db: Session) -> bool:
+    return db.get_bind().dialect.name == "postgresql"
+
+
+def next_version(db: Session) -> int:
+    # Повторний виклик у тій самій транзакції повертає ту саму версію (Postgres)
+    if _postgres(db):
+        return db.scalar(select(func.pg_current_xact_id().cast(Text).cast(BigInteger)))
+    # SQLite: спершу лічильник, потім рядки — одна транзакція запису за раз
+    return db.scalar(
+        update(models.SyncState)
+        .where(models.SyncState.id == 1)
+        .values(version=models.SyncState.version + 1)
+        .returning(models.SyncState.version)
+        .execution_options(synchronize_session=False)
+    )
+
+
+def visible_version(db: Session) -> int:
+    # Найбільша версія, нижче (і включно з) якої вже не з'явиться нових змін
+    if _postgres(db):
+        xmin = func.pg_snapshot_xmin(func.pg_current_snapshot()).cast(Text).cast(BigInteger)
+        return db.scalar(select(xmin)) - 1
+    return db.scalar(select(models.SyncState.version)) or 0
+
+
+def stamp_box_items(db: Session, version: int, box_ids: Iterable[int]):
+    # Для масового імпорту: речі нових коробок отримують версію одним UPDATE наприкінці
+    box_ids = set(box_ids)
+    if box_ids:
+        db.execute(
+            update(models.Item)
+            .where(models.Item.box_id.in_(box_ids))
+            .values(sync_version=version, updated_at=models.Item.updated_at)
+            .execution_options(synchronize_session=False)
+        )
+
+
+def item_deleted(db: Session, version: int, moves: Iterable[tuple]):
+    # moves: (item_id, box_id, де річ була) — видалення або переміщення в іншу коробку
+    rows = [{"version": version, "kind": "item", "entity_id": item_id, "box_id": box_id} for item_id, box_id in moves]
+    if rows:
+        db.execute(insert(models.SyncTombstone), rows)
+
+
+def box_deleted(db: Session, version: int, box: models.Box):
+    # Після видалення доступ уже не обчислити: надгробок кожному, хто бачив коробку
+    user_ids = {box.owner_id}
+    user_ids.update(db.scalars(select(models.box_shares.c.user_id).where(models.box_shares.c.box_id == box.id)))
+    db.execute(insert(models.SyncTombstone), [
+        {"version": version, "kind": "box", "entity_id": box.id, "box_id": box.id, "user_id": user_id}
+        for user_id in user_ids
+    ])
+
+
+def share_revoked(db: Session, version: int, box_id: int, user_id: int):
+    db.execute(insert(models.SyncTombstone).values(
+        version=version, kind="share", entity_id=user_id, box_id=box_id, user_id=user_id
+    ))
+
+
+# ============ READ ============
+
+def _after(version_column, id_column, stream: int, position: list, upto: int):
+    version, last_stream, last_id = position
+    if stream > last_stream:
+        after = version_column >= version
+    elif stream < last_stream:
+        after = version_column > version
+    else:
+        after = tuple_(version_column, id_column) > tuple_(version, last_id)
+    return and_(after, version_column <= upto)
+
+
+def _position(since: str, pruned_version: int) -> Optional[list]:
+    values = decode_cursor(since)
+    if len(values) != 4 or values[0] != "sync" or not all(isinstance(value, int) for value in values[1:]):
+        raise HTTPException(status_code=400, detail="Invalid sync token")
+    position = values[1:]
+    # Надгробки старші за токен вже видалено — дельта була б неповною
+    if position[0] < pruned_version:
+        return None
+    return position
+
+
+def changes(db: Session, principal, since: Optional[str], limit: int = SYNC_PAGE_SIZE) -> dict:
+    # Межа — до читання змін: усе нижче неї вже зафіксовано й буде видно запитам нижче
+    upto = visible_version(db)
+    pruned_version = db.scalar(select(models.SyncState.pruned_version)) or 0
+    position = _position(since, pruned_version) if since else None
+    response = {"token": encode_cursor("sync", upto, DONE, 0), "has_more": False, "reset": position is None,
+                "boxes": [], "items": [], "shares": [], "deleted": []}
+    # Без токена (або з застарілим) — лише поточний токен: клієнт завантажує все через
+    # /api/boxes і /api/items, потім синхронізується від цього токена
+    if position is None:
+        return response
+
+    accessible = accessible_box_ids(principal.id)
+    tombstone = models.SyncTombstone
+    share = models.box_shares.c
+    streams = [
+        (DELETED, db.execute(
+            select(tombstone.version, tombstone.id, tombstone.kind, tombstone.entity_id, tombstone.box_id)
+            .where(
+                or_(tombstone.user_id == principal.id, tombstone.box_id.in_(accessible)),
+                _after(tombstone.version, tombstone.id, DELETED, position, upto),
+            )
+            .order_by(tombstone.version, tombstone.id)
+            .limit(limit + 1)
+        ).all()),
+        (BOXES, db.execute(
+            select(models.Box.sync_version, *serialization.BOX_COLUMNS, models.Box.item_count)
+            .where(models.Box.id.in_(accessible), _after(models.Box.sync_version, models.Box.id, BOXES, position, upto))
+            .order_by(models.Box.sync_version, models.Box.id)
+            .limit(limit + 1)
+        ).all()),
+        (SHARES, db.execute(
+            select(share.sync_version, share.box_id, share.user_id, share.shared_at)
+            .where(
+                or_(share.user_id == principal.id, share.box_id.in_(select(models.Box.id).where(models.Box.owner_id == principal.id))),
+                _after(share.sync_version, share.box_id, SHARES, position, upto),
+            )
+            .order_by(share.sync_version, share.box_id)
+            .limit(limit + 1)
+        ).all()),
+        (ITEMS, db.execute(
+            select(models.Item.sync_version, *serialization.ITEM_COLUMNS)
+            .where(models.Item.box_id.in_(accessible), _after(models.Item.sync_version, models.Item.id, ITEMS, position, upto))
+            .order_by(models.Item.sync_version, models.Item.id)
+            .limit(limit + 1)
+        ).all()),
+    ]
+
+    merged = sorted((row[0], stream, row[1], row) for stream, rows in streams for row in rows)
+    page = merged[:limit]
+    if len(merged) > limit:
+        version, stream, entity_id, _ = page[-1]
+        response.update(token=encode_cursor("sync", version, stream, entity_id), has_more=True)
+
+    granted = set()
+    for _, stream, _, row in page:
+        if stream == DELETED:
+            response["deleted"].append({"type": row.kind, "id": row.entity_id, "box_id": row.box_id})
+        elif stream == BOXES:
+            box = serialization.box_row(row._mapping)
+            del box["sync_version"]
+            box["is_shared"] = box["owner_id"] != principal.id
+            response["boxes"].append(box)
+        elif stream == SHARES:
+            response["shares"].append({"box_id": row.box_id, "user_id": row.user_id, "shared_at": row.shared_at})
+            if row.user_id == principal.id:
+                granted.add(row.box_id)
+        else:
+            item = serialization.item_row(row._mapping)
+            del item["sync_version"]
+            response["items"].append(item)
+
+    # Коробку, якою щойно поділились, клієнт ще не бачив: її рядок іде разом з подією,
+    # речі клієнт довантажує через /api/items?box_id=
+    granted -= {box["id"] for box in response["boxes"]}
+    if granted:
+        rows = db.execute(
+            select(*serialization.BOX_COLUMNS, models.Box.item_count).where(models.Box.id.in_(granted))
+        ).all()
+        response["boxes"].extend({**serialization.box_row(row._mapping), "is_shared": True} for row in rows)
+    return response
+
+
+# ============ MAINTENANCE ============
+
+def prune_tombstones(db: Session, older_than: timedelta) -> int:
+    cutoff = datetime.utcnow() - older_than
+    last_version = db.scalar(select(func.max(models.SyncTombstone.version)).where(models.SyncTombstone.deleted_at < cutoff))
+    if last_version is None:
+        return 0
+    removed = db.execute(delete(models.SyncTombstone).where(models.SyncTombstone.version <= last_version)).rowcount
+    db.execute(
+        update(models.SyncState)
+        .where(models.SyncState.id == 1, models.SyncState.pruned_version < last_version)
+        .values(pruned_version=last_version)
+    )
+    db.commit()
+    return removed
+
+
+def main(argv: Optional[List[str]] = None):
+    parser = argparse.ArgumentParser(description="Delete /api/sync tombstones older than the retention period.")
+    parser.add_argument("--days", type=int, default=TOMBSTONE_RETENTION_DAYS)
+    args = parser.parse_args(argv)
+
+    import database
+    with database.SessionLocal() as db:
+        removed = prune_tombstones(db, timedelta(days=args.days))
+    print(f"Removed {removed} tombstones older than {args.days} days")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,66 @@
+import asyncio
+import json
+from pathlib import Path
+import sys
+
+import pytest
+from fastapi import HTTPException, Response
+from sqlalchemy import create_engine
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+
+BACKEND_DIR = Path(__file__).resolve().parents[1]
+if str(BACKEND_DIR) not in sys.path:
+    sys.path.insert(0, str(BACKEND_DIR))
+
+import async_api  # noqa: E402
+import models  # noqa: E402
+import schemas  # noqa: E402
+from principals import load_principal  # noqa: E402
+
+
+def test_async_crud_endpoints_share_sync_logic(tmp_path):
+    db_path = tmp_path / "async.db"
+    sync_engine = create_engine(f"sqlite:///{db_path}")
+    models.Base.metadata.create_all(bind=sync_engine)
+    with sync_engine.begin() as connection:
+        connection.execute(models.User.__table__.insert().values(
+            username="async", email="async@example.com", password_hash="x"
+        ))
+    sync_engine.dispose()
+
+    async def scenario():
+        engine = create_async_engine(f"sqlite+aiosqlite:///{db_path}")
+        Session = async_sessionmaker(engine, autoflush=False, expire_on_commit=False)
+        try:
+            async with Session() as db:
+                principal = await db.run_sync(load_principal, 1)
+                box = await async_api.create_box(schemas.BoxCreate(name="Async box"), current_user=principal, db=db)
+                created = [
+                    await async_api.create_item(
+                        schemas.ItemCreate(name=f"Item {index}", category="misc", box_id=box.id),
+                        current_user=principal,
+                        db=db,
+                    )
+                    for index in range(3)
+                ]
+                # Схема будується всередині run_sync — назовні не лишається ORM-об'єктів
+                assert all(isinstance(item, schemas.Item) for item in created)
+                renamed = await async_api.update_item(
+                    created[2].id, schemas.ItemUpdate(name="Item 2b"), current_user=principal, db=db
+                )
+                assert isinstance(renamed, schemas.Item) and renamed.name == "Item 2b"
+                response = Response()
+                page = json.loads((await async_api.get_items(response=response, limit=2, current_user=principal, db=db)).body)
+                boxes = json.loads((await async_api.get_boxes(Response(), view="summary", current_user=principal, db=db)).body)
+                await async_api.delete_item(page[0]["id"], current_user=principal, db=db)
+                with pytest.raises(HTTPException) as missing:
+                    await async_api.get_box(999, current_user=principal, db=db)
+                return page, response.headers.get("X-Next-Cursor"), boxes, missing.value.status_code
+        finally:
+            await engine.dispose()
+
+    page, next_cursor, boxes, missing_status = asyncio.run(scenario())
+    assert [item["name"] for item in page] == ["Item 0", "Item 1"]
+    assert next_cursor
+    assert [(box["name"], box["item_count"]) for box in boxes] == [("Async box", 3)]
+    assert missing_status == 404
@@ -0,0 +1,41 @@
+from pathlib import Path
+import sys
+
+import pytest
+from sqlalchemy import create_engine
+from sqlalchemy.exc import TimeoutError as PoolTimeoutError
+
+BACKEND_DIR = Path(__file__).resolve().parents[1]
+if str(BACKEND_DIR) not in sys.path:
+    sys.path.insert(0, str(BACKEND_DIR))
+
+import database  # noqa: E402
+
+
+def test_pool_budget_is_split_across_workers(monkeypatch):
+    monkeypatch.setattr(database, "DB_MAX_CONNECTIONS", 80)
+    monkeypatch.setattr(database, "WEB_CONCURRENCY", 4)
+    assert database.pool_budget(engines_per_worker=1) == (10, 10)
+    assert database.pool_budget(engines_per_worker=2) == (5, 5)
+
+
+def test_timed_pool_reports_checkouts_and_timeouts(tmp_path):
+    class Pool(database.TimedQueuePool):
+        stats = database.PoolStats()
+
+    engine = create_engine(
+        f"sqlite:///{tmp_path / 'pool.db'}", poolclass=Pool, pool_size=1, max_overflow=0, pool_timeout=0.05
+    )
+    try:
+        with engine.connect():
+            status = database.pool_status(engine)
+            assert (status["checked_out"], status["overflow"]) == (1, 0)
+            with pytest.raises(PoolTimeoutError):
+                engine.connect()
+        status = database.pool_status(engine)
+        assert status["checked_out"] == 0
+        assert status["checkouts"] == 2
+        assert status["timeouts"] == 1
+        assert status["wait_ms_max"] >= 50
+    finally:
+        engine.dispose()
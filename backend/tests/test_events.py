@@ -0,0 +1,124 @@
+import asyncio
+from datetime import timedelta
+from pathlib import Path
+import sys
+
+import orjson
+from fastapi.testclient import TestClient
+from sqlalchemy import create_engine, insert
+from sqlalchemy.orm import sessionmaker
+
+BACKEND_DIR = Path(__file__).resolve().parents[1]
+if str(BACKEND_DIR) not in sys.path:
+    sys.path.insert(0, str(BACKEND_DIR))
+
+import auth  # noqa: E402
+import crud  # noqa: E402
+import events  # noqa: E402
+import main  # noqa: E402
+import models  # noqa: E402
+import schemas  # noqa: E402
+from principals import load_principal  # noqa: E402
+
+
+def drain(subscriber):
+    received = []
+    while not subscriber.queue.empty():
+        change = subscriber.queue.get_nowait()
+        received.append((change["type"], change["op"], change.get("box_id")))
+    return received
+
+
+def test_commits_fan_out_to_subscribers_by_access(tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path / 'events.db'}")
+    models.Base.metadata.create_all(bind=engine)
+    with engine.begin() as connection:
+        connection.execute(insert(models.User), [
+            {"id": user_id, "username": f"user{user_id}", "email": f"user{user_id}@example.com", "password_hash": "x"}
+            for user_id in (1, 2, 3)
+        ])
+    Session = sessionmaker(bind=engine, autoflush=False)
+
+    async def scenario():
+        owner, friend, stranger = (events.broker.subscribe(user_id, ()) for user_id in (1, 2, 3))
+        settle = lambda: asyncio.sleep(0)  # noqa: E731
+        with Session() as db:
+            box = crud.create_box(db, load_principal(db, 1), schemas.BoxCreate(name="Garage"))
+            await settle()
+            # Нова коробка — одразу в підписці власника
+            assert drain(owner) == [("box", "created", box.id)] and box.id in owner.box_ids
+
+            crud.share_box(db, load_principal(db, 1), box.id, "user2@example.com")
+            item = crud.create_item(db, load_principal(db, 2), schemas.ItemCreate(name="Saw", category="tools", box_id=box.id))
+            await settle()
+            assert drain(friend) == [("share", "created", box.id), ("item", "created", box.id)]
+            assert drain(owner) == [("share", "created", box.id), ("item", "created", box.id)]
+
+            events.publish_on_commit(db, "item", "updated", box.id, [item.id], 0)
+            db.rollback()
+            crud.unshare_box(db, load_principal(db, 1), box.id, 2)
+            crud.update_item(db, load_principal(db, 1), item.id, schemas.ItemUpdate(name="Hand saw"))
+            await settle()
+            # Після відкликання доступу події коробки другові вже не йдуть
+            assert drain(friend) == [("share", "deleted", box.id)]
+            assert drain(owner) == [("share", "deleted", box.id), ("item", "updated", box.id)]
+            assert drain(stranger) == []
+
+        for subscriber in (owner, friend, stranger):
+            events.broker.unsubscribe(subscriber)
+        assert events.broker.subscribers == 0 and not events.broker.by_box
+
+    asyncio.run(scenario())
+    engine.dispose()
+
+
+def test_slow_subscriber_gets_resync_instead_of_unbounded_queue():
+    async def scenario():
+        subscriber = events.Subscriber(1, [7], maxsize=3)
+        for version in range(10):
+            subscriber.offer({"type": "item", "op": "updated", "box_id": 7, "ids": [1], "version": version})
+        assert subscriber.queue.qsize() == 1
+        assert await subscriber.get(0.1) is events.RESYNC
+        subscriber.offer({"type": "item", "op": "updated", "box_id": 7, "ids": [1], "version": 11})
+        assert (await subscriber.get(0.1))["version"] == 11
+
+        stream = events.stream(1, [7], keepalive=0.01)
+        assert b"event: ready" in await stream.__anext__()
+        assert await stream.__anext__() == b": keepalive\n\n"
+        events.broker.publish([{"type": "box", "op": "updated", "box_id": 7, "ids": [7], "version": 12, "users": []}])
+        chunk = await stream.__anext__()
+        assert chunk.startswith(b"event: change\ndata: ")
+        assert orjson.loads(chunk.split(b"data: ")[1]) == {"type": "box", "op": "updated", "box_id": 7, "ids": [7], "version": 12}
+        await stream.aclose()
+        assert events.broker.subscribers == 0
+
+    asyncio.run(scenario())
+
+
+def test_notify_payloads_stay_under_postgres_limit():
+    changes = [{"type": "item", "op": "created", "box_id": box_id, "ids": list(range(100)), "version": 1} for box_id in range(50)]
+    changes.append({"type": "item", "op": "deleted", "box_id": 99, "ids": list(range(5000)), "version": 1})
+    payloads = events._notify_payloads(changes)
+    assert len(payloads) > 1 and all(len(payload) <= events.NOTIFY_MAX_BYTES for payload in payloads)
+    decoded = [change for payload in payloads for change in orjson.loads(payload)]
+    assert [change["box_id"] for change in decoded] == list(range(50)) + [99]
+    assert decoded[-1]["ids"] is None
+
+
+def test_event_stream_requires_token():
+    response = TestClient(main.app).get("/api/events")
+    assert response.status_code == 401
+
+
+def test_event_stream_takes_a_short_lived_ticket_not_the_access_token():
+    client = TestClient(main.app)
+    access_token = auth.create_access_token({"sub": "1"})
+    ticket = auth.create_stream_ticket(1)
+    # Основний токен у URL більше не приймається, а квиток — лише для потоку подій
+    assert client.get("/api/events", params={"access_token": access_token}).status_code == 401
+    assert client.get("/api/events", params={"ticket": access_token}).status_code == 401
+    assert client.get("/api/auth/me", headers={"Authorization": f"Bearer {ticket}"}).status_code == 401
+    assert auth.decode_user_id(ticket, purpose=auth.STREAM_TICKET_PURPOSE) == 1
+
+    expired = auth.create_access_token({"sub": "1", "purpose": auth.STREAM_TICKET_PURPOSE}, timedelta(seconds=-1))
+    assert client.get("/api/events", params={"ticket": expired}).status_code == 401
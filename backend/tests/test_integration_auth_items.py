@@ -1,10 +1,15 @@
+import asyncio
+from datetime import timedelta
+import json
 import os
 from pathlib import Path
 import sys
+from typing import List
 
 import pytest
-from fastapi import HTTPException
-from sqlalchemy import create_engine
+from pydantic import TypeAdapter
+from fastapi import HTTPException, Response
+from sqlalchemy import create_engine, event
 from sqlalchemy.orm import sessionmaker
 
 TEST_DB = Path(__file__).parent / "test_integration.db"
@@ -17,14 +22,50 @@ if str(BACKEND_DIR) not in sys.path:
 
 import models  # noqa: E402
 import schemas  # noqa: E402
+import search  # noqa: E402
+from principals import apply_remote_invalidation, load_principal, principal_cache, get_principal  # noqa: E402
 from main import (  # noqa: E402
-    register,
-    login,
     create_box,
     create_item,
     share_box,
     get_items,
+    get_boxes,
+    search_inventory,
+    unshare_box,
+    update_item,
+    batch_items,
+    get_box_by_qr,
+    get_box_qr,
+    get_qr_sheet,
+    sync_changes,
+    delete_box,
+    delete_item,
+    get_stats,
 )
+import main  # noqa: E402
+from pagination import encode_cursor  # noqa: E402
+import permissions  # noqa: E402
+import stats  # noqa: E402
+import sync  # noqa: E402
+
+
+def register(user, db):
+    # Маршрути автентифікації async: bcrypt чекає на пул процесів без потоку
+    return asyncio.run(main.register(user, db))
+
+
+def login(user, db):
+    return asyncio.run(main.login(user, db))
+
+
+def as_principal(db, user):
+    # Кожен запит отримує свіжий principal, як з auth.get_current_user
+    return load_principal(db, user.id)
+
+
+def body(response):
+    # Списки віддаються готовою JSON-відповіддю (serialization.json_response)
+    return json.loads(response.body)
 
 
 @pytest.fixture(scope="session")
@@ -60,13 +101,13 @@ def test_auth_and_items_access_flow(db):
 
     box = create_box(
         schemas.BoxCreate(name="Owner box", description="", location="home", photo_url=""),
-        current_user=owner,
+        current_user=as_principal(db, owner),
         db=db,
     )
 
     created_item = create_item(
         schemas.ItemCreate(name="Laptop", description="work", category="electronics", photo_url="", box_id=box.id),
-        current_user=owner,
+        current_user=as_principal(db, owner),
         db=db,
     )
     assert created_item.name == "Laptop"
@@ -75,19 +116,483 @@ def test_auth_and_items_access_flow(db):
     fresh_guest = db.query(models.User).filter(models.User.id == guest.id).first()
 
     with pytest.raises(HTTPException) as forbidden_exc:
-        get_items(box_id=box.id, current_user=fresh_guest, db=db)
+        get_items(Response(), box_id=box.id, current_user=as_principal(db, fresh_guest), db=db)
     assert getattr(forbidden_exc.value, "status_code", None) == 403
 
     share_result = share_box(
         box_id=box.id,
         share_data=schemas.BoxShare(user_email="guest@example.com"),
-        current_user=owner,
+        current_user=as_principal(db, owner),
         db=db,
     )
     assert share_result["message"] == "Box shared successfully"
 
     db.expire_all()
     shared_guest = db.query(models.User).filter(models.User.id == guest.id).first()
-    visible_items = get_items(box_id=box.id, current_user=shared_guest, db=db)
+    visible_items = body(get_items(Response(), box_id=box.id, current_user=as_principal(db, shared_guest), db=db))
     assert len(visible_items) == 1
-    assert visible_items[0].name == "Laptop"
+    assert visible_items[0]["name"] == "Laptop"
+
+
+def test_items_keyset_pagination_and_filters(db):
+    owner = register(schemas.UserCreate(username="pager", email="pager@example.com", password="secret123"), db)
+    box = create_box(schemas.BoxCreate(name="Shelf"), current_user=as_principal(db, owner), db=db)
+    for index in range(5):
+        create_item(
+            schemas.ItemCreate(name=f"Cable {index}", category="cables" if index % 2 else "misc", box_id=box.id),
+            current_user=as_principal(db, owner),
+            db=db,
+        )
+
+    seen = []
+    cursor = None
+    while True:
+        response = Response()
+        page = get_items(response=response, box_id=box.id, sort="-name", limit=2, cursor=cursor, current_user=as_principal(db, owner), db=db)
+        seen.extend(item["name"] for item in body(page))
+        cursor = response.headers.get("X-Next-Cursor")
+        if cursor is None:
+            break
+    assert seen == [f"Cable {index}" for index in reversed(range(5))]
+
+    cables = body(get_items(Response(), box_id=box.id, category="cables", current_user=as_principal(db, owner), db=db))
+    assert [item["name"] for item in cables] == ["Cable 1", "Cable 3"]
+
+    prefixed = body(get_items(Response(), name_prefix="Cable 4", current_user=as_principal(db, owner), db=db))
+    assert [item["name"] for item in prefixed] == ["Cable 4"]
+
+    with pytest.raises(HTTPException) as bad_cursor:
+        get_items(Response(), sort="name", cursor="bm90LWEtY3Vyc29y", current_user=as_principal(db, owner), db=db)
+    assert bad_cursor.value.status_code == 400
+    # Правильний base64, але значення не того типу чи форми — теж 400, а не 500
+    for forged in [("name", {"a": 1}, 1), ("name", "Drill", "1"), ("name", "Drill"), ("-created_at", 5, 1), ("name", "Drill", True)]:
+        with pytest.raises(HTTPException) as bad_cursor:
+            get_items(Response(), sort=forged[0], cursor=encode_cursor(*forged), current_user=as_principal(db, owner), db=db)
+        assert bad_cursor.value.status_code == 400
+
+
+def test_boxes_listing_runs_fixed_number_of_queries(db, engine):
+    owner = register(schemas.UserCreate(username="shelf", email="shelf@example.com", password="secret123"), db)
+    friend = register(schemas.UserCreate(username="friend", email="friend@example.com", password="secret123"), db)
+    for index in range(3):
+        box = create_box(schemas.BoxCreate(name=f"Box {index}"), current_user=as_principal(db, friend), db=db)
+        create_item(schemas.ItemCreate(name="Tape", category="tools", box_id=box.id), current_user=as_principal(db, friend), db=db)
+        share_box(box_id=box.id, share_data=schemas.BoxShare(user_email="shelf@example.com"), current_user=as_principal(db, friend), db=db)
+    own_box = create_box(schemas.BoxCreate(name="Own"), current_user=as_principal(db, owner), db=db)
+
+    principal = as_principal(db, owner)
+    statements = []
+    listener = lambda *args: statements.append(args[2])  # noqa: E731
+    event.listen(engine, "before_cursor_execute", listener)
+    try:
+        db.expire_all()
+        full = body(get_boxes(Response(), current_user=principal, db=db))
+        full_queries = len(statements)
+        statements.clear()
+        summary = body(get_boxes(Response(), view="summary", current_user=principal, db=db))
+        summary_queries = len(statements)
+    finally:
+        event.remove(engine, "before_cursor_execute", listener)
+
+    assert [box["id"] for box in full][0] == own_box.id
+    assert [box["is_shared"] for box in full] == [False, True, True, True]
+    assert [len(box["items"]) for box in full] == [0, 1, 1, 1]
+    # +1 запит версії колекції для ETag
+    assert full_queries == 3
+    assert summary_queries == 2
+    assert [box["items"] for box in summary] == [None] * 4
+    assert [box["item_count"] for box in summary] == [0, 1, 1, 1]
+
+
+def test_search_ranks_and_limits_to_accessible_boxes(db, monkeypatch):
+    owner = register(schemas.UserCreate(username="finder", email="finder@example.com", password="secret123"), db)
+    stranger = register(schemas.UserCreate(username="stranger", email="stranger@example.com", password="secret123"), db)
+    garage = create_box(schemas.BoxCreate(name="Garage shelf", location="Drill corner"), current_user=as_principal(db, owner), db=db)
+    create_item(schemas.ItemCreate(name="Drill", category="tools", box_id=garage.id), current_user=as_principal(db, owner), db=db)
+    create_item(
+        schemas.ItemCreate(name="Bits", description="spare drill bits", category="tools", box_id=garage.id),
+        current_user=as_principal(db, owner),
+        db=db,
+    )
+    hidden = create_box(schemas.BoxCreate(name="Drill case"), current_user=as_principal(db, stranger), db=db)
+
+    response = Response()
+    first = search_inventory(q="drill", response=response, limit=2, current_user=as_principal(db, owner), db=db)
+    assert [(hit["type"], hit["name"]) for hit in first] == [("item", "Drill"), ("box", "Garage shelf")]
+
+    rest = search_inventory(q="drill", response=Response(), cursor=response.headers["X-Next-Cursor"], limit=2, current_user=as_principal(db, owner), db=db)
+    assert [(hit["type"], hit["name"]) for hit in rest] == [("item", "Bits")]
+    assert hidden.id not in [hit["box_id"] for hit in first + rest]
+
+    # Підроблені курсори: True як зсув, зсув за межею
+    for forged in (["drill", True], ["drill", search.MAX_SEARCH_OFFSET + 1]):
+        with pytest.raises(HTTPException) as invalid:
+            search_inventory(q="drill", response=Response(), cursor=encode_cursor(*forged), current_user=as_principal(db, owner), db=db)
+        assert invalid.value.status_code == 400
+    # Остання дозволена сторінка не дає курсора далі, хоч результати ще є
+    monkeypatch.setattr(search, "MAX_SEARCH_OFFSET", 1)
+    last_page = Response()
+    hits = search_inventory(q="drill", response=last_page, limit=1, cursor=encode_cursor("drill", 1),
+                            current_user=as_principal(db, owner), db=db)
+    assert len(hits) == 1 and "X-Next-Cursor" not in last_page.headers
+
+    # % і _ у запиті — звичайні символи, а не шаблон LIKE
+    create_item(schemas.ItemCreate(name="Paint 100%", category="paint", box_id=garage.id), current_user=as_principal(db, owner), db=db)
+    assert [hit["name"] for hit in search_inventory(q="%", response=Response(), current_user=as_principal(db, owner), db=db)] == ["Paint 100%"]
+    assert search_inventory(q="_rill", response=Response(), current_user=as_principal(db, owner), db=db) == []
+
+
+def test_principal_cache_hits_and_invalidates_on_share(db):
+    owner = register(schemas.UserCreate(username="cacher", email="cacher@example.com", password="secret123"), db)
+    guest = register(schemas.UserCreate(username="cached", email="cached@example.com", password="secret123"), db)
+    box = create_box(schemas.BoxCreate(name="Cached box"), current_user=as_principal(db, owner), db=db)
+
+    principal_cache.clear()
+    before = principal_cache.stats()
+    first = get_principal(db, guest.id)
+    assert get_principal(db, guest.id) is first
+    after = principal_cache.stats()
+    assert (after["misses"] - before["misses"], after["hits"] - before["hits"]) == (1, 1)
+    assert box.id not in first.box_ids
+
+    share_box(
+        box_id=box.id,
+        share_data=schemas.BoxShare(user_email="cached@example.com"),
+        current_user=as_principal(db, owner),
+        db=db,
+    )
+    refreshed = get_principal(db, guest.id)
+    assert refreshed is not first
+    assert box.id in refreshed.box_ids
+
+
+def test_principal_cache_drops_stale_fills_and_applies_remote_invalidations(db):
+    user = register(schemas.UserCreate(username="racer", email="racer@example.com", password="secret123"), db)
+    principal_cache.clear()
+
+    # Заповнення почалось до скидання (unshare в іншому запиті) — старий набір не кешується
+    generation = principal_cache.generation(user.id)
+    stale = load_principal(db, user.id)
+    principal_cache.invalidate(user.id)
+    principal_cache.put(stale, generation)
+    assert principal_cache.get(user.id) is None
+
+    # Скидання від іншого воркера (NOTIFY mystorage_principals)
+    principal_cache.put(get_principal(db, user.id))
+    apply_remote_invalidation(json.dumps({"users": [user.id]}))
+    assert principal_cache.get(user.id) is None
+    principal_cache.put(get_principal(db, user.id))
+    apply_remote_invalidation(json.dumps({"all": True}))
+    assert principal_cache.stats()["size"] == 0
+
+
+def test_permissions_batch_checks_and_unshare(db):
+    owner = register(schemas.UserCreate(username="lender", email="lender@example.com", password="secret123"), db)
+    borrower = register(schemas.UserCreate(username="borrower", email="borrower@example.com", password="secret123"), db)
+    lent = create_box(schemas.BoxCreate(name="Lent"), current_user=as_principal(db, owner), db=db)
+    kept = create_box(schemas.BoxCreate(name="Kept"), current_user=as_principal(db, owner), db=db)
+    lent_item = create_item(schemas.ItemCreate(name="Saw", category="tools", box_id=lent.id), current_user=as_principal(db, owner), db=db)
+    kept_item = create_item(schemas.ItemCreate(name="Hammer", category="tools", box_id=kept.id), current_user=as_principal(db, owner), db=db)
+    share_box(box_id=lent.id, share_data=schemas.BoxShare(user_email="borrower@example.com"), current_user=as_principal(db, owner), db=db)
+
+    with pytest.raises(HTTPException) as duplicate:
+        share_box(box_id=lent.id, share_data=schemas.BoxShare(user_email="borrower@example.com"), current_user=as_principal(db, owner), db=db)
+    assert duplicate.value.status_code == 400
+
+    guest = as_principal(db, borrower)
+    assert permissions.accessible_subset(db, guest, [lent.id, kept.id, 999999]) == {lent.id}
+    assert permissions.owned_subset(db, guest, [lent.id, kept.id]) == set()
+    assert permissions.item_box_ids(db, guest, [lent_item.id, kept_item.id]) == {lent_item.id: lent.id}
+
+    renamed = update_item(item_id=lent_item.id, item_update=schemas.ItemUpdate(name="Hand saw"), current_user=guest, db=db)
+    assert renamed.name == "Hand saw"
+    with pytest.raises(HTTPException) as forbidden:
+        update_item(item_id=kept_item.id, item_update=schemas.ItemUpdate(name="Mine"), current_user=guest, db=db)
+    assert forbidden.value.status_code == 403
+    with pytest.raises(HTTPException) as missing:
+        create_item(schemas.ItemCreate(name="Ghost", category="x", box_id=999999), current_user=guest, db=db)
+    assert missing.value.status_code == 404
+
+    unshare_box(box_id=lent.id, user_id=borrower.id, current_user=as_principal(db, owner), db=db)
+    assert permissions.accessible_subset(db, as_principal(db, borrower), [lent.id]) == set()
+
+
+def test_items_batch_applies_in_one_transaction(db, engine):
+    owner = register(schemas.UserCreate(username="stocker", email="stocker@example.com", password="secret123"), db)
+    other = register(schemas.UserCreate(username="outsider", email="outsider@example.com", password="secret123"), db)
+    shelf = create_box(schemas.BoxCreate(name="Shelf"), current_user=as_principal(db, owner), db=db)
+    bin_box = create_box(schemas.BoxCreate(name="Bin"), current_user=as_principal(db, owner), db=db)
+    foreign = create_box(schemas.BoxCreate(name="Foreign"), current_user=as_principal(db, other), db=db)
+    old = create_item(schemas.ItemCreate(name="Old", category="misc", box_id=shelf.id), current_user=as_principal(db, owner), db=db)
+
+    principal = as_principal(db, owner)
+    creates = [{"op": "create", "item": {"name": f"Screw {n}", "category": "parts", "box_id": shelf.id}} for n in range(50)]
+    statements = []
+    listener = lambda *args: statements.append(args[2])  # noqa: E731
+    event.listen(engine, "before_cursor_execute", listener)
+    try:
+        result = batch_items(schemas.ItemBatch(operations=creates), Response(), current_user=principal, db=db)
+    finally:
+        event.remove(engine, "before_cursor_execute", listener)
+    assert result.applied
+    # Доступ до коробки — з principal; SQLite не гарантує порядок RETURNING у пачці,
+    # тому вставляє по рядку, Postgres — одним INSERT ... VALUES (...), (...)
+    assert statements[0].startswith("UPDATE sync_state SET")
+    assert all(statement.startswith("INSERT INTO items") for statement in statements[1:-2])
+    # Агрегати /api/stats — один upsert на всю пачку
+    assert statements[-2].startswith("INSERT INTO item_stats")
+    assert statements[-1].startswith("UPDATE boxes SET")
+    screw_ids = [op.ids[0] for op in result.results]
+    assert len(set(screw_ids)) == 50
+
+    response = Response()
+    rejected = batch_items(
+        schemas.ItemBatch(operations=[
+            {"op": "update", "id": old.id, "changes": {"name": "Renamed"}},
+            {"op": "create", "item": {"name": "Smuggled", "category": "x", "box_id": foreign.id}},
+            {"op": "delete", "id": 999999},
+        ]),
+        response=response,
+        current_user=principal,
+        db=db,
+    )
+    assert not rejected.applied and response.status_code == 409
+    assert [op.status for op in rejected.results] == [424, 403, 404]
+    db.expire_all()
+    assert db.get(models.Item, old.id).name == "Old"
+
+    partial = batch_items(
+        schemas.ItemBatch(atomic=False, operations=[
+            {"op": "update", "id": old.id, "changes": {"description": "dusty"}},
+            {"op": "move", "ids": screw_ids[:10] + [old.id], "box_id": bin_box.id},
+            {"op": "delete", "id": screw_ids[0]},
+            {"op": "update", "id": screw_ids[0], "changes": {"name": "Gone"}},
+            {"op": "move", "ids": [old.id], "box_id": foreign.id},
+        ]), Response(),
+        current_user=principal,
+        db=db,
+    )
+    assert partial.applied
+    assert [op.status for op in partial.results] == [200, 200, 200, 404, 403]
+    db.expire_all()
+    moved = db.get(models.Item, old.id)
+    assert (moved.description, moved.box_id) == ("dusty", bin_box.id)
+    assert db.get(models.Item, screw_ids[0]) is None
+    assert db.query(models.Item).filter(models.Item.box_id == bin_box.id).count() == 10
+
+
+def test_collection_etags_return_304_until_a_write(db, engine):
+    owner = register(schemas.UserCreate(username="poller", email="poller@example.com", password="secret123"), db)
+    helper = register(schemas.UserCreate(username="helper", email="helper@example.com", password="secret123"), db)
+    box = create_box(schemas.BoxCreate(name="Polled"), current_user=as_principal(db, owner), db=db)
+    item = create_item(schemas.ItemCreate(name="Cup", category="kitchen", box_id=box.id), current_user=as_principal(db, owner), db=db)
+    share_box(box_id=box.id, share_data=schemas.BoxShare(user_email="helper@example.com"), current_user=as_principal(db, owner), db=db)
+
+    principal = as_principal(db, owner)
+    first = Response()
+    get_boxes(response=first, current_user=principal, db=db)
+    etag = first.headers["ETag"]
+    assert etag.startswith('W/"') and first.headers["Cache-Control"] == "private, no-cache"
+
+    statements = []
+    listener = lambda *args: statements.append(args[2])  # noqa: E731
+    event.listen(engine, "before_cursor_execute", listener)
+    try:
+        # Порівняння слабке: тег без W/ (як його віддають деякі проксі) теж збігається
+        cached = get_boxes(Response(), if_none_match=f'"x", {etag[2:]}', current_user=principal, db=db)
+    finally:
+        event.remove(engine, "before_cursor_execute", listener)
+    assert cached.status_code == 304
+    assert len(statements) == 1
+
+    items_page = Response()
+    get_items(response=items_page, current_user=principal, db=db)
+    assert items_page.headers["ETag"] != etag
+    assert get_items(Response(), if_none_match=items_page.headers["ETag"], current_user=principal, db=db).status_code == 304
+
+    # Запис іншого користувача в спільну коробку змінює версію колекції власника
+    update_item(item_id=item.id, item_update=schemas.ItemUpdate(name="Mug"), current_user=as_principal(db, helper), db=db)
+    refreshed = Response()
+    boxes = body(get_boxes(response=refreshed, if_none_match=etag, current_user=principal, db=db))
+    assert boxes[0]["items"][0]["name"] == "Mug"
+    assert refreshed.headers["ETag"] != etag
+
+
+def test_row_serialization_matches_response_schemas(db):
+    owner = register(schemas.UserCreate(username="shaper", email="shaper@example.com", password="secret123"), db)
+    box = create_box(schemas.BoxCreate(name="Shaped", photo_url="/uploads/box-photo.jpg"), current_user=as_principal(db, owner), db=db)
+    for name in ("Cup", "Plate"):
+        create_item(
+            schemas.ItemCreate(name=name, category="kitchen", photo_url=f"/uploads/{name.lower()}.jpg", box_id=box.id),
+            current_user=as_principal(db, owner),
+            db=db,
+        )
+    principal = as_principal(db, owner)
+
+    # Швидкий шлях (рядки + orjson) має давати той самий JSON, що й pydantic-схеми
+    items_adapter = TypeAdapter(List[schemas.Item])
+    orm_items = db.query(models.Item).filter(models.Item.box_id == box.id).order_by(models.Item.created_at, models.Item.id).all()
+    expected_items = items_adapter.dump_python(items_adapter.validate_python(orm_items, from_attributes=True), mode="json")
+    assert body(get_items(Response(), box_id=box.id, current_user=principal, db=db)) == expected_items
+
+    db.expire_all()
+    expected_box = schemas.Box.model_validate(db.get(models.Box, box.id)).model_dump(mode="json")
+    expected_box["item_count"] = 2
+    assert body(get_boxes(Response(), current_user=principal, db=db)) == [expected_box]
+
+
+def test_qr_lookup_labels_and_sheet(db, tmp_path, monkeypatch):
+    monkeypatch.setattr(main, "QR_DIR", tmp_path)
+    owner = register(schemas.UserCreate(username="labeler", email="labeler@example.com", password="secret123"), db)
+    stranger = register(schemas.UserCreate(username="scanner", email="scanner@example.com", password="secret123"), db)
+    boxes = [
+        create_box(schemas.BoxCreate(name=f"Коробка {n}", location="Гараж"), current_user=as_principal(db, owner), db=db)
+        for n in range(30)
+    ]
+    create_item(schemas.ItemCreate(name="Drill", category="tools", box_id=boxes[0].id), current_user=as_principal(db, owner), db=db)
+
+    found = get_box_by_qr(boxes[0].qr_code, current_user=as_principal(db, owner), db=db)
+    assert found.model_dump() == {
+        "id": boxes[0].id, "name": "Коробка 0", "location": "Гараж", "qr_code": boxes[0].qr_code,
+        "item_count": 1, "is_shared": False,
+    }
+    # Чужа коробка не відрізняється від неіснуючої
+    for code in (boxes[0].qr_code, "missing"):
+        with pytest.raises(HTTPException) as exc:
+            get_box_by_qr(code, current_user=as_principal(db, stranger), db=db)
+        assert exc.value.status_code == 404
+
+    png = get_box_qr(boxes[0].id, current_user=as_principal(db, owner), db=db)
+    assert Path(png.path) == tmp_path / f"{boxes[0].qr_code}.png"
+    assert Path(png.path).read_bytes().startswith(b"\x89PNG")
+    assert png.headers["Cache-Control"].endswith("immutable")
+    svg = get_box_qr(boxes[0].id, format="svg", current_user=as_principal(db, owner), db=db)
+    assert b"<svg" in Path(svg.path).read_bytes()
+
+    sheet = get_qr_sheet(schemas.QrSheetRequest(), current_user=as_principal(db, owner), db=db)
+    assert sheet.media_type == "application/pdf"
+    # 30 етикеток по 24 на аркуш — дві сторінки; PNG для кожного коду закешовано
+    assert sheet.body.startswith(b"%PDF") and sheet.body.count(b"/Type /Page\n") == 2
+    assert len(list(tmp_path.glob("*.png"))) == 30
+
+    with pytest.raises(HTTPException) as exc:
+        get_qr_sheet(schemas.QrSheetRequest(box_ids=[boxes[1].id]), current_user=as_principal(db, stranger), db=db)
+    assert exc.value.status_code == 404
+
+
+def test_sync_returns_deltas_tombstones_and_pages(db):
+    owner = register(schemas.UserCreate(username="syncer", email="syncer@example.com", password="secret123"), db)
+    friend = register(schemas.UserCreate(username="syncfriend", email="syncfriend@example.com", password="secret123"), db)
+
+    def pull(user, token, limit=500):
+        pages = []
+        while True:
+            page = body(sync_changes(since=token, limit=limit, current_user=as_principal(db, user), db=db))
+            pages.append(page)
+            token = page["token"]
+            if not page["has_more"]:
+                return pages, token
+
+    # Без токена — лише поточний стан для подальших дельт
+    bootstrap = body(sync_changes(current_user=as_principal(db, owner), db=db))
+    assert bootstrap["reset"] and bootstrap["items"] == []
+    owner_token = bootstrap["token"]
+    friend_token = body(sync_changes(current_user=as_principal(db, friend), db=db))["token"]
+
+    attic = create_box(schemas.BoxCreate(name="Attic"), current_user=as_principal(db, owner), db=db)
+    cellar = create_box(schemas.BoxCreate(name="Cellar"), current_user=as_principal(db, owner), db=db)
+    lamp, fan = (
+        create_item(schemas.ItemCreate(name=name, category="home", box_id=attic.id), current_user=as_principal(db, owner), db=db)
+        for name in ("Lamp", "Fan")
+    )
+    pages, owner_token = pull(owner, owner_token)
+    assert [box["name"] for box in pages[0]["boxes"]] == ["Attic", "Cellar"]
+    assert [item["name"] for item in pages[0]["items"]] == ["Lamp", "Fan"]
+    assert not pages[0]["reset"] and pull(owner, owner_token)[0][0]["boxes"] == []
+
+    update_item(item_id=lamp.id, item_update=schemas.ItemUpdate(name="Desk lamp"), current_user=as_principal(db, owner), db=db)
+    delete_item(item_id=fan.id, current_user=as_principal(db, owner), db=db)
+    share_box(box_id=attic.id, share_data=schemas.BoxShare(user_email="syncfriend@example.com"), current_user=as_principal(db, owner), db=db)
+    batch_items(schemas.ItemBatch(operations=[{"op": "move", "ids": [lamp.id], "box_id": cellar.id}]), Response(),
+                current_user=as_principal(db, owner), db=db)
+
+    # Сторінки по 1 зміні: видалення перед оновленням у межах однієї версії
+    pages, owner_token = pull(owner, owner_token, limit=1)
+    changes = [(key, entry) for page in pages for key in ("deleted", "boxes", "shares", "items") for entry in page[key]]
+    # Рядок речі — поточний стан: проміжне перейменування згорнуте в останню версію
+    assert [(key, entry.get("type"), entry.get("id", entry.get("box_id"))) for key, entry in changes] == [
+        ("deleted", "item", fan.id),
+        ("shares", None, attic.id),
+        ("deleted", "item", lamp.id),
+        ("items", None, lamp.id),
+    ]
+    assert changes[-1][1]["name"] == "Desk lamp" and changes[-1][1]["box_id"] == cellar.id
+    assert changes[2][1]["box_id"] == attic.id
+
+    # Другові: подія доступу разом з коробкою; переміщена в чужу коробку річ — надгробок
+    pages, friend_token = pull(friend, friend_token)
+    assert pages[0]["shares"][0]["user_id"] == friend.id
+    assert [(box["id"], box["is_shared"]) for box in pages[0]["boxes"]] == [(attic.id, True)]
+    assert {(entry["type"], entry["id"]) for entry in pages[0]["deleted"]} == {("item", fan.id), ("item", lamp.id)}
+    assert pages[0]["items"] == []
+
+    unshare_box(box_id=attic.id, user_id=friend.id, current_user=as_principal(db, owner), db=db)
+    delete_box(box_id=cellar.id, current_user=as_principal(db, owner), db=db)
+    assert pull(friend, friend_token)[0][0]["deleted"] == [{"type": "share", "id": friend.id, "box_id": attic.id}]
+    pages, _ = pull(owner, owner_token)
+    assert [(entry["type"], entry["id"]) for entry in pages[0]["deleted"]] == [("share", friend.id), ("box", cellar.id)]
+
+    # Після чистки надгробків старий токен вимагає повного перезавантаження
+    assert sync.prune_tombstones(db, timedelta(0)) > 0
+    assert body(sync_changes(since=owner_token, current_user=as_principal(db, owner), db=db))["reset"]
+
+
+def test_stats_facets_follow_writes_and_match_item_counts(db):
+    owner = register(schemas.UserCreate(username="counter", email="counter@example.com", password="secret123"), db)
+    friend = register(schemas.UserCreate(username="countfriend", email="countfriend@example.com", password="secret123"), db)
+    garage = create_box(schemas.BoxCreate(name="Garage", location="House"), current_user=as_principal(db, owner), db=db)
+    shed = create_box(schemas.BoxCreate(name="Shed", location="Yard"), current_user=as_principal(db, owner), db=db)
+    drill, saw, _ = (
+        create_item(schemas.ItemCreate(name=name, category=category, box_id=garage.id), current_user=as_principal(db, owner), db=db)
+        for name, category in (("Drill", "tools"), ("Saw", "tools"), ("Rope", "camping"))
+    )
+    tent = create_item(schemas.ItemCreate(name="Tent", category="camping", box_id=shed.id), current_user=as_principal(db, owner), db=db)
+    update_item(item_id=saw.id, item_update=schemas.ItemUpdate(category="garden"), current_user=as_principal(db, owner), db=db)
+    batch_items(schemas.ItemBatch(operations=[
+        {"op": "move", "ids": [drill.id], "box_id": shed.id},
+        {"op": "create", "item": {"name": "Lamp", "category": "camping", "box_id": shed.id}},
+        {"op": "delete", "id": tent.id},
+    ]), Response(), current_user=as_principal(db, owner), db=db)
+
+    def facets(user, **filters):
+        response = Response()
+        result = body(get_stats(response=response, current_user=as_principal(db, user), db=db, **filters))
+        return result, response.headers["ETag"]
+
+    result, etag = facets(owner)
+    assert result["source"] == "aggregates" and result["total"] == 4
+    assert [(facet["category"], facet["count"]) for facet in result["categories"]] == [("camping", 2), ("garden", 1), ("tools", 1)]
+    assert [(facet["name"], facet["count"]) for facet in result["boxes"]] == [("Garage", 2), ("Shed", 2)]
+    assert {facet["location"]: facet["count"] for facet in result["locations"]} == {"House": 2, "Yard": 2}
+    assert result["growth"][-1] == {"month": result["growth"][-1]["month"], "added": 7, "removed": 3, "total": 4}
+
+    # Порожній name_prefix — той самий набір речей, але порахований по items
+    exact, _ = facets(owner, name_prefix="")
+    assert exact["source"] == "items"
+    for key in ("total", "boxes", "categories", "locations"):
+        assert exact[key] == result[key]
+
+    assert facets(owner, category="camping", location="Yard")[0]["boxes"] == [
+        {"box_id": shed.id, "name": "Shed", "location": "Yard", "count": 1}
+    ]
+    assert get_stats(Response(), if_none_match=etag, current_user=as_principal(db, owner), db=db).status_code == 304
+    assert facets(friend)[0]["total"] == 0
+    share_box(box_id=shed.id, share_data=schemas.BoxShare(user_email="countfriend@example.com"), current_user=as_principal(db, owner), db=db)
+    assert facets(friend)[0]["total"] == 2
+
+    # Перерахунок з items дає ті самі кількості
+    stats.rebuild(db, [garage.id, shed.id])
+    db.commit()
+    assert facets(owner)[0]["categories"] == result["categories"]
+    delete_box(box_id=garage.id, current_user=as_principal(db, owner), db=db)
+    assert facets(owner)[0]["total"] == 2
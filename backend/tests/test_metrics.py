@@ -0,0 +1,102 @@
+import json
+import logging
+from pathlib import Path
+import sys
+
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+from sqlalchemy import create_engine, text
+
+BACKEND_DIR = Path(__file__).resolve().parents[1]
+if str(BACKEND_DIR) not in sys.path:
+    sys.path.insert(0, str(BACKEND_DIR))
+
+import database  # noqa: E402
+import main  # noqa: E402
+import metrics  # noqa: E402
+
+
+def series(histogram, labels):
+    return next((counts, total) for key, counts, total in histogram.snapshot() if tuple(key) == labels)
+
+
+def test_middleware_records_route_sql_and_size_and_logs_slow_requests(tmp_path, monkeypatch, caplog):
+    engine = create_engine(f"sqlite:///{tmp_path / 'metrics.db'}")
+    app = FastAPI()
+
+    @app.get("/metrics-test/{item_id}")
+    def handler(item_id: int):
+        with engine.connect() as connection:
+            for _ in range(3):
+                connection.execute(text("SELECT :id"), {"id": item_id})
+        return {"payload": "x" * 100}
+
+    app.add_middleware(metrics.MetricsMiddleware)
+    monkeypatch.setattr(metrics, "SLOW_REQUEST_MS", 0)
+    client = TestClient(app)
+
+    with caplog.at_level(logging.WARNING, logger="metrics"):
+        for item_id in (1, 2):
+            assert client.get(f"/metrics-test/{item_id}").status_code == 200
+    engine.dispose()
+
+    # Один шаблон маршруту замість серії на кожен id
+    counts, _ = series(metrics.REQUEST_SECONDS, ("GET", "/metrics-test/{item_id}", "200"))
+    assert sum(counts) == 2
+    counts, total = series(metrics.REQUEST_QUERIES, ("GET", "/metrics-test/{item_id}"))
+    assert (sum(counts), total) == (2, 6)
+    counts, total = series(metrics.RESPONSE_BYTES, ("GET", "/metrics-test/{item_id}"))
+    assert total == 2 * len(json.dumps({"payload": "x" * 100}, separators=(",", ":")))
+
+    slow = [record.getMessage() for record in caplog.records if "Slow request" in record.getMessage()]
+    assert len(slow) == 2
+    assert "GET /metrics-test/1 -> 200" in slow[0] and "(3 queries" in slow[0]
+    assert slow[0].count("SELECT ?") == 3
+
+
+def test_metrics_endpoint_sums_worker_snapshots(tmp_path, monkeypatch):
+    monkeypatch.setattr(metrics, "METRICS_DIR", tmp_path)
+    metrics.REQUEST_SECONDS.observe(("GET", "/api/aggregate-test", "200"), 0.02)
+    # Знімок іншого воркера з тим самим маршрутом
+    other = {
+        "histograms": {
+            metrics.REQUEST_SECONDS.name: [
+                [["GET", "/api/aggregate-test", "200"], [0, 1] + [0] * len(metrics.LATENCY_BUCKETS), 0.007],
+            ],
+        },
+        "counters": {metrics.SLOW_REQUESTS.name: [[["GET", "/api/aggregate-test"], 4]]},
+        "pool": {"checkouts": 10, "wait_seconds": 0.5, "timeouts": 1},
+    }
+    (tmp_path / "worker-999999.json").write_text(json.dumps(other))
+
+    response = TestClient(main.app).get("/api/metrics")
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/plain; version=0.0.4")
+    lines = response.text.splitlines()
+    route = 'method="GET",route="/api/aggregate-test",status="200"'
+    assert f'mystorage_http_request_duration_seconds_bucket{{{route},le="0.01"}} 1' in lines
+    assert f'mystorage_http_request_duration_seconds_bucket{{{route},le="0.025"}} 2' in lines
+    assert f'mystorage_http_request_duration_seconds_bucket{{{route},le="+Inf"}} 2' in lines
+    assert f"mystorage_http_request_duration_seconds_count{{{route}}} 2" in lines
+    assert 'mystorage_http_slow_requests_total{method="GET",route="/api/aggregate-test"} 4' in lines
+    assert "mystorage_workers 2" in lines
+
+
+def test_readiness_fails_when_pool_is_exhausted(tmp_path, monkeypatch):
+    engine = create_engine(
+        f"sqlite:///{tmp_path / 'ready.db'}", poolclass=database.TimedQueuePool, pool_size=1, max_overflow=0, pool_timeout=5
+    )
+    monkeypatch.setattr(database, "engine", engine)
+    monkeypatch.setattr(main, "READINESS_TIMEOUT", 0.2)
+    client = TestClient(main.app)
+    try:
+        ready = client.get("/api/health/ready")
+        assert ready.status_code == 200
+        assert ready.json()["status"] == "ready"
+
+        with engine.connect():
+            busy = client.get("/api/health/ready")
+        assert busy.status_code == 503
+        assert busy.json()["detail"] == "database check timed out"
+    finally:
+        engine.dispose()
@@ -0,0 +1,90 @@
+import asyncio
+from pathlib import Path
+import sys
+import threading
+import time
+
+import pytest
+from fastapi import HTTPException
+
+BACKEND_DIR = Path(__file__).resolve().parents[1]
+if str(BACKEND_DIR) not in sys.path:
+    sys.path.insert(0, str(BACKEND_DIR))
+
+from passwords import PasswordHasher  # noqa: E402
+
+
+def test_hashes_with_configured_cost_in_worker_process():
+    hasher = PasswordHasher(workers=1, max_pending=2, rounds=4)
+    try:
+        hashed = hasher.hash("secret123")
+        assert hashed.startswith("$2b$04$")
+        assert hasher.verify("secret123", hashed)
+        assert not hasher.verify("wrong", hashed)
+    finally:
+        hasher.shutdown()
+
+
+def test_rejects_with_503_when_queue_is_saturated():
+    hasher = PasswordHasher(workers=0, max_pending=1, rounds=4)
+    started, release = threading.Event(), threading.Event()
+
+    def slow_hash():
+        started.set()
+        release.wait(5)
+        return "done"
+
+    worker = threading.Thread(target=hasher._run, args=(slow_hash,))
+    worker.start()
+    started.wait(5)
+    try:
+        with pytest.raises(HTTPException) as busy:
+            hasher.hash("secret123")
+        assert busy.value.status_code == 503
+        assert busy.value.headers["Retry-After"] == "1"
+    finally:
+        release.set()
+        worker.join()
+    assert hasher.stats()["rejected"] == 1
+    assert hasher.verify("secret123", hasher.hash("secret123"))
+
+
+def test_async_hashing_awaits_the_process_pool():
+    hasher = PasswordHasher(workers=1, max_pending=2, rounds=4)
+
+    async def scenario():
+        hashed = await hasher.hash_async("secret123")
+        return hashed, await hasher.verify_async("secret123", hashed), await hasher.verify_async("wrong", hashed)
+
+    try:
+        hashed, valid, invalid = asyncio.run(scenario())
+    finally:
+        hasher.shutdown()
+    assert hashed.startswith("$2b$04$") and valid and not invalid
+    assert hasher.stats()["completed"] == 3
+
+
+def test_cancelled_request_keeps_its_slot_until_bcrypt_finishes():
+    hasher = PasswordHasher(workers=1, max_pending=1, rounds=4)
+
+    async def scenario():
+        # Перший виклик запускає процес пулу, щоб наступна задача одразу виконувалась
+        await hasher.hash_async("warmup")
+        task = asyncio.create_task(hasher._run_async(time.sleep, 0.5))
+        await asyncio.sleep(0.1)
+        task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await task
+        # Клієнт пішов, але процес ще зайнятий: черга повна
+        with pytest.raises(HTTPException) as busy:
+            await hasher.hash_async("secret123")
+        assert busy.value.status_code == 503
+        await asyncio.sleep(0.8)
+        return await hasher.hash_async("secret123")
+
+    try:
+        hashed = asyncio.run(scenario())
+    finally:
+        hasher.shutdown()
+    assert hashed.startswith("$2b$04$")
+    assert hasher.stats() == {"workers": 1, "completed": 3, "rejected": 1}
@@ -0,0 +1,206 @@
+from datetime import datetime, timedelta
+from pathlib import Path
+import re
+import sys
+
+import pytest
+from fastapi import Response
+from sqlalchemy import create_engine, event, insert
+from sqlalchemy.orm import sessionmaker
+
+BACKEND_DIR = Path(__file__).resolve().parents[1]
+if str(BACKEND_DIR) not in sys.path:
+    sys.path.insert(0, str(BACKEND_DIR))
+
+import models  # noqa: E402
+import schemas  # noqa: E402
+from pagination import encode_cursor  # noqa: E402
+from principals import load_principal  # noqa: E402
+from main import (  # noqa: E402
+    batch_items,
+    create_item,
+    delete_item,
+    get_box,
+    get_boxes,
+    get_items,
+    get_stats,
+    search_inventory,
+    share_box,
+    sync_changes,
+    update_item,
+)
+
+# Регресійні перевірки планів запитів гарячих ендпоінтів: кожен SQL-запит
+# проганяється через EXPLAIN QUERY PLAN на реалістичному наборі даних.
+# Повний прохід по таблиці (SCAN) або перевищення бюджету запитів — помилка.
+# Плани SQLite; індекси ті самі, що створює міграція 20261018_000005 для Postgres.
+
+USERS = 6
+BOXES_PER_USER = 40
+ITEMS_PER_BOX = 40
+HOT_TABLES = {"users", "boxes", "items", "box_shares", "sync_tombstones", "item_stats"}
+FULL_SCAN = re.compile(r"\bSCAN (\w+)")
+
+# Максимальна кількість SQL-запитів на виклик ендпоінта (без автентифікації).
+# Кожен запис бере версію для /api/sync (+1), видалення пишуть надгробки (+1),
+# зміни кількості речей оновлюють item_stats (+1, пакет — ще +1 на старі категорії)
+QUERY_BUDGETS = {
+    "principal": 2,
+    "boxes_full": 3,
+    "boxes_summary": 2,
+    "boxes_not_modified": 1,
+    "box_detail": 1,
+    "items_default": 2,
+    "items_box_by_name": 2,
+    "items_next_page": 2,
+    "items_filtered": 2,
+    "search": 1,
+    "create_item": 5,
+    "update_item": 5,
+    "delete_item": 6,
+    "batch": 10,
+    "share": 5,
+    "sync": 6,
+    "stats": 5,
+    "stats_filtered": 5,
+}
+
+
+@pytest.fixture(scope="module")
+def Session(tmp_path_factory):
+    engine = create_engine(f"sqlite:///{tmp_path_factory.mktemp('plans') / 'plans.db'}")
+    models.Base.metadata.create_all(bind=engine)
+    started = datetime(2026, 1, 1)
+    with engine.begin() as connection:
+        connection.execute(insert(models.User), [
+            {"id": user, "username": f"user{user}", "email": f"user{user}@example.com", "password_hash": "x"}
+            for user in range(1, USERS + 1)
+        ])
+        boxes = [
+            {"owner_id": user, "name": f"Box {user}-{n}", "location": f"Shelf {n % 7}", "qr_code": f"qr-{user}-{n}"}
+            for user in range(1, USERS + 1)
+            for n in range(BOXES_PER_USER)
+        ]
+        connection.execute(insert(models.Box), boxes)
+        connection.execute(insert(models.Item), [
+            {
+                "box_id": box_id,
+                "name": f"Item {box_id}-{n}",
+                "category": f"category-{n % 12}",
+                "created_at": started + timedelta(minutes=box_id * ITEMS_PER_BOX + n),
+                "updated_at": started + timedelta(minutes=box_id * ITEMS_PER_BOX + n),
+            }
+            for box_id in range(1, len(boxes) + 1)
+            for n in range(ITEMS_PER_BOX)
+        ])
+        # Кожен користувач бачить кілька коробок сусіда
+        connection.execute(insert(models.box_shares), [
+            {"box_id": (user % USERS) * BOXES_PER_USER + n + 1, "user_id": user}
+            for user in range(1, USERS + 1)
+            for n in range(5)
+        ])
+        # Статистика для планувальника, як після autovacuum на проді
+        connection.exec_driver_sql("ANALYZE")
+    yield sessionmaker(bind=engine, autoflush=False)
+    engine.dispose()
+
+
+def explain(db, statements):
+    plans = []
+    connection = db.connection()
+    for statement, parameters in statements:
+        if not statement.lstrip().upper().startswith(("SELECT", "UPDATE", "DELETE", "WITH")):
+            continue
+        if isinstance(parameters, list):
+            parameters = parameters[0] if parameters else ()
+        rows = connection.exec_driver_sql(f"EXPLAIN QUERY PLAN {statement}", parameters).all()
+        plans.append((statement, [row[-1] for row in rows]))
+    return plans
+
+
+def full_scans(plans):
+    scans = []
+    for statement, details in plans:
+        for detail in details:
+            match = FULL_SCAN.search(detail)
+            if match and match.group(1) in HOT_TABLES:
+                scans.append(f"{detail}\n    in: {statement}")
+    return scans
+
+
+def run(Session, call):
+    with Session() as db:
+        principal = load_principal(db, 1)
+        statements = []
+        listener = lambda conn, cursor, statement, parameters, context, many: statements.append((statement, parameters))  # noqa: E731
+        event.listen(db.get_bind(), "before_cursor_execute", listener)
+        try:
+            call(db, principal)
+        finally:
+            event.remove(db.get_bind(), "before_cursor_execute", listener)
+        plans = explain(db, statements)
+        db.rollback()
+    return len(statements), plans
+
+
+def scenarios():
+    state = {}
+
+    def items_next_page(db, principal):
+        response = Response()
+        get_items(response=response, sort="-updated_at", limit=20, current_user=principal, db=db)
+        state["cursor"] = response.headers["X-Next-Cursor"]
+
+    def boxes_not_modified(db, principal):
+        response = Response()
+        get_boxes(response=response, view="summary", current_user=principal, db=db)
+        state["etag"] = response.headers["ETag"]
+
+    def shared_box_id(principal):
+        return next(iter(principal.box_ids - principal.owned_box_ids))
+
+    return {
+        "principal": lambda db, principal: load_principal(db, principal.id),
+        "boxes_full": lambda db, principal: get_boxes(Response(), current_user=principal, db=db),
+        "boxes_summary": lambda db, principal: get_boxes(Response(), view="summary", current_user=principal, db=db),
+        "boxes_not_modified": lambda db, principal: get_boxes(
+            Response(),
+            view="summary", if_none_match=state.get("etag", '"x"'), current_user=principal, db=db
+        ),
+        "box_detail": lambda db, principal: get_box(shared_box_id(principal), current_user=principal, db=db),
+        "items_default": lambda db, principal: get_items(Response(), current_user=principal, db=db),
+        "items_box_by_name": lambda db, principal: get_items(Response(), box_id=shared_box_id(principal), sort="name", current_user=principal, db=db),
+        "items_next_page": lambda db, principal: get_items(
+            Response(),
+            sort="-updated_at", limit=20, cursor=state.get("cursor"), current_user=principal, db=db
+        ),
+        "items_filtered": lambda db, principal: get_items(Response(), category="category-3", name_prefix="Item 1", current_user=principal, db=db),
+        "search": lambda db, principal: search_inventory(q="item 3-1", response=Response(), current_user=principal, db=db),
+        "create_item": lambda db, principal: create_item(
+            schemas.ItemCreate(name="New", category="misc", box_id=shared_box_id(principal)), current_user=principal, db=db
+        ),
+        "update_item": lambda db, principal: update_item(1, schemas.ItemUpdate(name="Renamed"), current_user=principal, db=db),
+        "delete_item": lambda db, principal: delete_item(2, current_user=principal, db=db),
+        "batch": lambda db, principal: batch_items(schemas.ItemBatch(operations=[
+            {"op": "create", "item": {"name": "Batch", "category": "misc", "box_id": 1}},
+            {"op": "update", "id": 3, "changes": {"category": "moved"}},
+            {"op": "move", "ids": [4, 5], "box_id": 2},
+            {"op": "delete", "id": 6},
+        ]), Response(), current_user=principal, db=db),
+        "share": lambda db, principal: share_box(3, schemas.BoxShare(user_email="user4@example.com"), current_user=principal, db=db),
+        "stats": lambda db, principal: get_stats(Response(), current_user=principal, db=db),
+        "stats_filtered": lambda db, principal: get_stats(Response(), category="category-3", name_prefix="Item 1", current_user=principal, db=db),
+        "sync": lambda db, principal: sync_changes(since=encode_cursor("sync", 0, 9, 0), current_user=principal, db=db),
+    }, {"items_next_page": items_next_page, "boxes_not_modified": boxes_not_modified}
+
+
+@pytest.mark.parametrize("name", list(QUERY_BUDGETS))
+def test_hot_path_queries_use_indexes_and_stay_within_budget(Session, name):
+    calls, setups = scenarios()
+    if name in setups:
+        run(Session, setups[name])
+    count, plans = run(Session, calls[name])
+
+    assert count <= QUERY_BUDGETS[name], f"{name}: {count} queries, budget {QUERY_BUDGETS[name]}"
+    scans = full_scans(plans)
+    assert not scans, f"{name}: full table scans:\n" + "\n".join(scans)
@@ -0,0 +1,172 @@
+import asyncio
+import fcntl
+import multiprocessing
+import os
+from pathlib import Path
+import sys
+import time
+
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+BACKEND_DIR = Path(__file__).resolve().parents[1]
+if str(BACKEND_DIR) not in sys.path:
+    sys.path.insert(0, str(BACKEND_DIR))
+
+import auth  # noqa: E402
+import metrics  # noqa: E402
+import ratelimit  # noqa: E402
+
+
+def _take_in_worker(path, results):
+    buckets = ratelimit.SharedBuckets(path, slots=64)
+    results.put([buckets.take("read:ip:10.0.0.1", 1.0, 5, now=1000.0) for _ in range(3)])
+
+
+def test_shared_buckets_refill_and_are_shared_between_processes(tmp_path):
+    path = tmp_path / "buckets.bin"
+    buckets = ratelimit.SharedBuckets(path, slots=64)
+    assert [buckets.take("read:ip:10.0.0.1", 1.0, 5, now=1000.0) for _ in range(2)] == [0.0, 0.0]
+
+    # Інший процес (воркер) бачить ті самі відра: 3 токени, що лишилися
+    results = multiprocessing.get_context("fork").Queue()
+    worker = multiprocessing.get_context("fork").Process(target=_take_in_worker, args=(path, results))
+    worker.start()
+    worker.join(10)
+    assert results.get(timeout=1) == [0.0, 0.0, 0.0]
+
+    assert buckets.take("read:ip:10.0.0.1", 1.0, 5, now=1000.0) == 1.0
+    assert buckets.take("read:ip:10.0.0.2", 1.0, 5, now=1000.0) == 0.0
+    # Поповнення з часом, не більше за burst
+    assert buckets.take("read:ip:10.0.0.1", 1.0, 5, now=1001.5) == 0.0
+    assert buckets.take("read:ip:10.0.0.1", 1.0, 5, now=1001.5) == 0.5
+    buckets.close()
+
+    # Таблиця з кількох слотів: нові ключі витісняють найстаріші відра, а не ламають ліміт
+    tiny = ratelimit.SharedBuckets(tmp_path / "tiny.bin", slots=2)
+    for index in range(10):
+        assert tiny.take(f"key-{index}", 1.0, 1, now=2000.0 + index) == 0.0
+    assert tiny.take("key-9", 1.0, 1, now=2009.0) == 1.0
+    tiny.close()
+
+
+def test_contended_table_fails_open_instead_of_blocking_the_event_loop(tmp_path):
+    path = tmp_path / "buckets.bin"
+    buckets = ratelimit.SharedBuckets(path, slots=64)
+    assert buckets.take("write:ip:10.0.0.1", 1.0, 1, now=1000.0) == 0.0
+
+    # Інший воркер тримає замок таблиці: take не чекає, а повертає None
+    holder = os.open(path, os.O_RDWR)
+    fcntl.flock(holder, fcntl.LOCK_EX)
+    try:
+        started = time.perf_counter()
+        assert buckets.take("write:ip:10.0.0.1", 1.0, 1, now=1000.0) is None
+        assert time.perf_counter() - started < 0.05
+
+        app = FastAPI()
+
+        @app.put("/api/items/1")
+        def update():
+            return {}
+
+        app.add_middleware(ratelimit.RateLimitMiddleware, buckets=buckets, load_shedding=False)
+        assert TestClient(app).put("/api/items/1").status_code == 200
+        assert any(labels == ["write"] and value >= 1 for labels, value in metrics.RATE_LIMIT_CONTENDED.snapshot())
+    finally:
+        fcntl.flock(holder, fcntl.LOCK_UN)
+        os.close(holder)
+    # Пропущений запит не витратив токен; після звільнення ліміт знову діє
+    assert buckets.take("write:ip:10.0.0.1", 1.0, 1, now=1000.0) == 1.0
+    buckets.close()
+
+
+def test_route_classes_and_client_keys():
+    assert ratelimit.classify("POST", "/api/auth/login") is ratelimit.AUTH
+    assert ratelimit.classify("GET", "/api/auth/me") is ratelimit.READ
+    assert ratelimit.classify("GET", "/api/items") is ratelimit.HEAVY
+    assert ratelimit.classify("GET", "/api/items/5") is ratelimit.READ
+    assert ratelimit.classify("PUT", "/api/items/5") is ratelimit.WRITE
+    assert ratelimit.classify("POST", "/api/upload") is ratelimit.TRANSFER
+    assert ratelimit.classify("POST", "/api/events/ticket") is ratelimit.WRITE
+    for method, path in [("GET", "/api/health/ready"), ("GET", "/api/events"), ("GET", "/api/media/a.png"), ("OPTIONS", "/api/items"), ("GET", "/")]:
+        assert ratelimit.classify(method, path) is None
+
+    token = auth.create_access_token({"sub": "42"})
+    scope = {"headers": [(b"authorization", f"Bearer {token}".encode())], "client": ("10.0.0.7", 5000)}
+    assert ratelimit.client_key(scope, ratelimit.HEAVY) == "heavy:user:42"
+    # Логін — завжди за IP; невалідний токен теж не дає власного відра
+    assert ratelimit.client_key(scope, ratelimit.AUTH) == "auth:ip:10.0.0.7"
+    forged = {"headers": [(b"authorization", b"Bearer not-a-jwt")], "client": ("10.0.0.7", 5000)}
+    assert ratelimit.client_key(forged, ratelimit.HEAVY) == "heavy:ip:10.0.0.7"
+
+
+def test_middleware_answers_429_with_retry_after_per_user(tmp_path, monkeypatch):
+    monkeypatch.setattr(ratelimit, "HEAVY", ratelimit.RouteClass("heavy", 60, 2))
+    app = FastAPI()
+
+    @app.get("/api/items")
+    def items():
+        return []
+
+    app.add_middleware(ratelimit.RateLimitMiddleware, buckets=ratelimit.SharedBuckets(tmp_path / "b.bin", slots=64),
+                       load_shedding=False)
+    client = TestClient(app)
+    alice = {"Authorization": f"Bearer {auth.create_access_token({'sub': '1'})}"}
+    bob = {"Authorization": f"Bearer {auth.create_access_token({'sub': '2'})}"}
+
+    assert [client.get("/api/items", headers=alice).status_code for _ in range(2)] == [200, 200]
+    limited = client.get("/api/items", headers=alice)
+    assert limited.status_code == 429 and limited.json() == {"detail": "Too many requests"}
+    assert int(limited.headers["Retry-After"]) >= 1
+    # Окремий бюджет у кожного користувача
+    assert client.get("/api/items", headers=bob).status_code == 200
+    assert any(labels == ["heavy"] and value >= 1 for labels, value in metrics.RATE_LIMITED.snapshot())
+
+
+def test_load_shedder_backs_off_when_latency_grows():
+    shedder = ratelimit.LoadShedder(target_ms=100, min_limit=2, max_limit=10, interval=1)
+    for _ in range(10):
+        assert shedder.admit()
+    assert not shedder.admit() and shedder.shed == 1
+
+    # Вікно з латентністю вище цілі: ліміт нижче за фактичну паралельність
+    started = shedder._window_started
+    for index in range(10):
+        shedder.release(0.5, now=started + (2 if index == 9 else 0.5))
+    assert shedder.limit == 8 and shedder.in_flight == 0
+
+    # Латентність у нормі при навантаженні біля ліміту — ліміт знову росте
+    for _ in range(8):
+        assert shedder.admit()
+    for index in range(8):
+        shedder.release(0.01, now=started + (3.5 if index == 7 else 2.5))
+    assert shedder.limit == 9
+
+
+def test_middleware_sheds_with_503_when_over_the_concurrency_limit():
+    shedder = ratelimit.LoadShedder(min_limit=1, max_limit=1)
+    release = asyncio.Event()
+    sent = []
+
+    async def slow_app(scope, receive, send):
+        await release.wait()
+        await send({"type": "http.response.start", "status": 200, "headers": []})
+        await send({"type": "http.response.body", "body": b""})
+
+    middleware = ratelimit.RateLimitMiddleware(slow_app, shedder=shedder, rate_limits=False)
+    scope = {"type": "http", "method": "GET", "path": "/api/items", "headers": [], "client": ("10.0.0.1", 1)}
+
+    async def send(message):
+        sent.append(message)
+
+    async def scenario():
+        first = asyncio.create_task(middleware(scope, None, send))
+        await asyncio.sleep(0)
+        await middleware(scope, None, send)
+        release.set()
+        await first
+
+    asyncio.run(scenario())
+    rejected, _, accepted, _ = sent
+    assert rejected["status"] == 503 and (b"retry-after", b"1") in rejected["headers"]
+    assert accepted["status"] == 200 and shedder.in_flight == 0
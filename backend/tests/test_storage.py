@@ -0,0 +1,159 @@
+import asyncio
+from datetime import datetime, timedelta
+import io
+from urllib.parse import parse_qs, urlsplit
+from pathlib import Path
+import sys
+
+import pytest
+from fastapi import HTTPException
+from sqlalchemy import create_engine, insert, select
+from sqlalchemy.orm import Session
+
+BACKEND_DIR = Path(__file__).resolve().parents[1]
+if str(BACKEND_DIR) not in sys.path:
+    sys.path.insert(0, str(BACKEND_DIR))
+
+boto3 = pytest.importorskip("boto3")
+moto = pytest.importorskip("moto")
+requests = pytest.importorskip("requests")
+from boto3.s3.transfer import TransferConfig  # noqa: E402
+from botocore.config import Config  # noqa: E402
+from PIL import Image  # noqa: E402
+
+import blobs  # noqa: E402
+import models  # noqa: E402
+import storage  # noqa: E402
+import thumbnails  # noqa: E402
+import uploads  # noqa: E402
+
+MiB = 1024 * 1024
+PNG_HEADER = b"\x89PNG\r\n\x1a\n"
+
+
+@pytest.fixture()
+def s3(tmp_path, monkeypatch):
+    monkeypatch.setenv("AWS_ACCESS_KEY_ID", "testing")
+    monkeypatch.setenv("AWS_SECRET_ACCESS_KEY", "testing")
+    monkeypatch.setenv("AWS_DEFAULT_REGION", "us-east-1")
+    with moto.mock_aws():
+        client = boto3.client("s3", region_name="us-east-1")
+        client.create_bucket(Bucket="photos")
+        backend = storage.S3Storage("photos", tmp_path / "cache", client=client)
+        # Мінімальна частина S3 — 5 MiB: multipart уже на невеликих тестових файлах
+        backend.transfer_config = TransferConfig(multipart_threshold=5 * MiB, multipart_chunksize=5 * MiB)
+        yield backend
+
+
+def test_s3_storage_keeps_originals_remote_and_a_local_cache(s3, tmp_path):
+    photo = io.BytesIO()
+    Image.new("RGB", (64, 32), "blue").save(photo, "PNG")
+    name = uploads.store_upload(io.BytesIO(photo.getvalue()), tmp_path, storage=s3)
+    assert s3.client.head_object(Bucket="photos", Key=f"uploads/{name}")["ContentType"] == "image/png"
+    assert s3.local_copy(name).read_bytes() == photo.getvalue()
+
+    # Великий файл іде в сховище частинами (multipart)
+    big = tmp_path / ".upload-big.part"
+    big.write_bytes(PNG_HEADER + b"x" * (6 * MiB))
+    s3.put_file(big, "big.png", "image/png")
+    assert s3.size("big.png") == 6 * MiB + len(PNG_HEADER)
+    assert s3.client.head_object(Bucket="photos", Key="uploads/big.png")["ETag"].endswith('-2"')
+
+    # Інший хост: кешу немає, похідні рендеряться з оригіналу, скачаного зі сховища
+    for path in (tmp_path / "cache").iterdir():
+        path.unlink()
+    derivative_dir = tmp_path / "derivatives"
+    derivative_dir.mkdir()
+    stem = Path(name).stem
+    try:
+        rendered = asyncio.run(thumbnails.ensure_derivative(tmp_path, derivative_dir, "sm", f"{stem}.webp", s3))
+    finally:
+        thumbnails.shutdown_pool()
+    assert rendered == derivative_dir / f"{stem}-sm.webp"
+    assert s3.find(stem) == name and s3.read_head(name, 8) == PNG_HEADER
+    assert s3.download_url(name).startswith("https://photos.s3.amazonaws.com/uploads/")
+
+    s3.delete_many([name, "big.png", "missing.png"])
+    assert not s3.exists(name) and s3.size("big.png") is None and s3.local_copy(name) is None
+
+
+def test_direct_uploads_use_presigned_put_and_multipart(s3, monkeypatch):
+    registered = []
+    register = lambda name, size: registered.append((name, size))  # noqa: E731
+
+    single = uploads.begin_direct_upload(s3, 1, "image/png", 100, register=register)
+    assert single["photo_url"] == f"/uploads/{registered[0][0]}" and "parts" not in single
+    put = requests.put(single["url"], data=PNG_HEADER + b"x" * 92, headers=single["headers"])
+    assert put.status_code == 200
+    with pytest.raises(HTTPException) as foreign:
+        uploads.finish_direct_upload(s3, 2, single["token"])
+    assert foreign.value.status_code == 400
+    name = uploads.finish_direct_upload(s3, 1, single["token"], register=register)
+    assert registered == [(name, 100), (name, 100)]
+
+    monkeypatch.setattr(uploads, "S3_MULTIPART_THRESHOLD", 5 * MiB)
+    size = 11 * MiB
+    multipart = uploads.begin_direct_upload(s3, 1, "image/jpeg", size)
+    assert "url" not in multipart and [part["part_number"] for part in multipart["parts"]] == [1, 2]
+    payload = b"\xff\xd8\xff\xe0" + b"y" * (size - 4)
+    parts = []
+    for part in multipart["parts"]:
+        start = (part["part_number"] - 1) * multipart["part_size"]
+        response = requests.put(part["url"], data=payload[start:start + multipart["part_size"]])
+        parts.append({"part_number": part["part_number"], "etag": response.headers["ETag"]})
+    name = uploads.finish_direct_upload(s3, 1, multipart["token"], parts)
+    assert name.endswith(".jpg") and s3.size(name) == size
+
+    # Presigned PUT не перевіряє вміст: не-зображення видаляється при підтвердженні
+    fake = uploads.begin_direct_upload(s3, 1, "image/png", 100)
+    requests.put(fake["url"], data=b"<?php echo 1;", headers=fake["headers"])
+    with pytest.raises(HTTPException) as rejected:
+        uploads.finish_direct_upload(s3, 1, fake["token"])
+    assert rejected.value.status_code == 400
+    assert not s3.exists(fake["photo_url"].rsplit("/", 1)[1])
+
+    for content_type, size, status in [("text/html", 10, 400), ("image/png", uploads.MAX_DIRECT_UPLOAD_BYTES + 1, 413)]:
+        with pytest.raises(HTTPException) as invalid:
+            uploads.begin_direct_upload(s3, 1, content_type, size)
+        assert invalid.value.status_code == status
+
+
+def test_local_storage_has_no_direct_uploads_and_sweep_uses_the_backend(s3, tmp_path):
+    with pytest.raises(HTTPException) as local:
+        uploads.begin_direct_upload(storage.LocalStorage(tmp_path), 1, "image/png", 100)
+    assert local.value.status_code == 400
+
+    engine = create_engine(f"sqlite:///{tmp_path / 'sweep.db'}")
+    models.Base.metadata.create_all(bind=engine)
+    s3.client.put_object(Bucket="photos", Key="uploads/orphan.png", Body=b"x")
+    (tmp_path / "cache" / "orphan.png").write_bytes(b"x")
+    with Session(engine) as db:
+        db.execute(insert(models.Blob).values(name="orphan.png", size=1, uploaded_at=datetime.utcnow() - timedelta(days=2)))
+        db.commit()
+        result = blobs.sweep(db, tmp_path, storage=s3, grace=timedelta(hours=1))
+        assert result["blobs"] == 1 and not s3.exists("orphan.png")
+        assert db.scalars(select(models.Blob.name)).all() == []
+    assert list((tmp_path / "cache").iterdir()) == []
+    engine.dispose()
+
+
+def test_direct_upload_headers_cover_every_signed_header(s3):
+    # moto не перевіряє підписи: звіряємо X-Amz-SignedHeaders (SigV4, як у storage.S3Storage)
+    s3.presign_client = boto3.client("s3", region_name="us-east-1", config=Config(signature_version="s3v4"))
+    plan = uploads.begin_direct_upload(s3, 1, "image/png", 100)
+    signed = parse_qs(urlsplit(plan["url"]).query)["X-Amz-SignedHeaders"][0].split(";")
+    assert "cache-control" in signed
+    assert set(signed) - {"host"} == {header.lower() for header in plan["headers"]}
+
+
+def test_sweep_aborts_abandoned_multipart_uploads(s3, tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path / 'sweep.db'}")
+    models.Base.metadata.create_all(bind=engine)
+    upload_id = s3.create_multipart("abandoned.jpg", "image/jpeg")
+    with Session(engine) as db:
+        assert blobs.sweep(db, tmp_path, storage=s3, grace=timedelta(hours=1), dry_run=True)["multipart"] == 0
+        # moto повертає фіксований Initiated у минулому — завантаження вважається покинутим
+        assert blobs.sweep(db, tmp_path, storage=s3, grace=timedelta(hours=1))["multipart"] == 1
+    uploads_left = s3.client.list_multipart_uploads(Bucket="photos").get("Uploads", [])
+    assert upload_id not in [upload["UploadId"] for upload in uploads_left]
+    engine.dispose()
@@ -0,0 +1,99 @@
+import io
+from pathlib import Path
+import sys
+
+import pytest
+from fastapi import HTTPException
+from sqlalchemy import create_engine, event
+from sqlalchemy.orm import sessionmaker
+
+BACKEND_DIR = Path(__file__).resolve().parents[1]
+if str(BACKEND_DIR) not in sys.path:
+    sys.path.insert(0, str(BACKEND_DIR))
+
+import models  # noqa: E402
+import transfer  # noqa: E402
+from principals import load_principal  # noqa: E402
+
+
+@pytest.fixture()
+def Session(tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path / 'transfer.db'}")
+    models.Base.metadata.create_all(bind=engine)
+    with engine.begin() as connection:
+        for name in ("source", "target"):
+            connection.execute(models.User.__table__.insert().values(
+                username=name, email=f"{name}@example.com", password_hash="x"
+            ))
+    yield sessionmaker(bind=engine, autoflush=False)
+    engine.dispose()
+
+
+@pytest.mark.parametrize("fmt", ["csv", "ndjson"])
+def test_export_import_round_trip(Session, fmt):
+    with Session() as db:
+        shed = models.Box(name="Shed", location="yard", qr_code="shed0001", owner_id=1)
+        empty = models.Box(name="Empty", owner_id=1)
+        db.add_all([shed, empty, models.Box(name="Not mine", owner_id=2)])
+        db.flush()
+        db.add_all([models.Item(name=f"Nail {n}", category="parts", box_id=shed.id) for n in range(25)])
+        db.add(models.Item(name="Rake", description="Кленова ручка", category="garden", box_id=shed.id))
+        db.commit()
+
+    # Маленькі чанки, щоб перевірити розбиття потоку
+    with Session() as db:
+        chunks = list(transfer.encode_rows(transfer.export_rows(db, 1), fmt, chunk_bytes=256))
+    assert len(chunks) > 1
+    payload = b"".join(chunks)
+    assert b"Not mine" not in payload
+
+    with Session() as db:
+        counts = transfer.import_inventory(db, load_principal(db, 2), io.BytesIO(payload), fmt)
+        assert counts == {"boxes": 2, "items": 26}
+        imported = db.query(models.Box).filter(models.Box.owner_id == 2, models.Box.name == "Shed").one()
+        # QR-код уже зайнятий вихідною коробкою, тому згенеровано новий
+        assert imported.qr_code != "shed0001"
+        assert imported.location == "yard"
+        rake = db.query(models.Item).filter(models.Item.box_id == imported.id, models.Item.name == "Rake").one()
+        assert rake.description == "Кленова ручка"
+        assert len(imported.items) == 26
+        assert imported.id in load_principal(db, 2).owned_box_ids
+
+
+def test_import_rejects_invalid_rows_without_partial_writes(Session):
+    payload = (
+        b'{"type":"box","ref":1,"name":"Ok"}\n'
+        b'{"type":"item","box_ref":1,"name":"Fine","category":"misc"}\n'
+        b'{"type":"item","box_ref":1,"name":"No category"}\n'
+    )
+    with Session() as db:
+        with pytest.raises(HTTPException) as invalid:
+            transfer.import_inventory(db, load_principal(db, 1), io.BytesIO(payload), "ndjson")
+        assert invalid.value.status_code == 422
+        assert invalid.value.detail.startswith("Line 3: category")
+
+        with pytest.raises(HTTPException) as unknown:
+            transfer.import_inventory(
+                db, load_principal(db, 1), io.BytesIO(b"type,box_ref,name,category\nitem,9,Orphan,misc\n"), "csv"
+            )
+        assert unknown.value.detail == "Line 2: unknown box_ref"
+        assert db.query(models.Box).count() == 0
+        assert db.query(models.Item).count() == 0
+
+
+def test_import_finalizes_many_boxes_in_chunks(Session, monkeypatch):
+    monkeypatch.setattr(transfer, "IMPORT_FINALIZE_CHUNK", 3)
+    lines = []
+    for ref in range(8):
+        lines.append(f'{{"type":"box","ref":{ref},"name":"Box {ref}"}}')
+        lines.append(f'{{"type":"item","box_ref":{ref},"name":"Thing {ref}","category":"misc"}}')
+    statements = []
+    with Session() as db:
+        event.listen(db.get_bind(), "before_cursor_execute", lambda *args: statements.append(args[2]))
+        counts = transfer.import_inventory(db, load_principal(db, 1), io.BytesIO("\n".join(lines).encode()), "ndjson")
+        assert counts == {"boxes": 8, "items": 8}
+        # Кожна коробка й річ отримала версію, агрегати — по всіх 8 коробках
+        assert {version for (version,) in db.query(models.Box.sync_version)} == {1}
+        assert {version for (version,) in db.query(models.Item.sync_version)} == {1}
+        assert db.query(models.ItemStat).count() == 8
+    assert sum(statement.startswith("UPDATE boxes") for statement in statements) == 3
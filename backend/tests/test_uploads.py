@@ -0,0 +1,281 @@
+import asyncio
+from datetime import datetime, timedelta
+import io
+import os
+from pathlib import Path
+import sys
+
+import pytest
+from fastapi import FastAPI, File, HTTPException, UploadFile
+from fastapi.testclient import TestClient
+from sqlalchemy import create_engine, insert, select
+from sqlalchemy.orm import Session
+
+BACKEND_DIR = Path(__file__).resolve().parents[1]
+if str(BACKEND_DIR) not in sys.path:
+    sys.path.insert(0, str(BACKEND_DIR))
+
+import auth  # noqa: E402
+import blobs  # noqa: E402
+import main  # noqa: E402
+import media  # noqa: E402
+import models  # noqa: E402
+import thumbnails  # noqa: E402
+from uploads import UploadSizeLimitMiddleware, sniff_image_type, store_upload  # noqa: E402
+from PIL import Image  # noqa: E402
+
+PNG_HEADER = b"\x89PNG\r\n\x1a\n"
+
+
+def test_sniffs_images_by_magic_bytes():
+    assert sniff_image_type(PNG_HEADER + b"rest") == "png"
+    assert sniff_image_type(b"\xff\xd8\xff\xe0") == "jpg"
+    assert sniff_image_type(b"RIFF\x00\x00\x00\x00WEBPVP8 ") == "webp"
+    assert sniff_image_type(b"<?php echo 1;") is None
+
+
+def test_store_upload_writes_atomically_and_enforces_limit(tmp_path):
+    filename = store_upload(io.BytesIO(PNG_HEADER + b"x" * 100), tmp_path, max_bytes=1024)
+    assert filename.endswith(".png")
+    assert (tmp_path / filename).read_bytes().startswith(PNG_HEADER)
+
+    with pytest.raises(HTTPException) as too_large:
+        store_upload(io.BytesIO(PNG_HEADER + b"x" * 2048), tmp_path, max_bytes=1024)
+    assert too_large.value.status_code == 413
+
+    with pytest.raises(HTTPException) as not_image:
+        store_upload(io.BytesIO(b"GIF-but-not-really"), tmp_path, max_bytes=1024)
+    assert not_image.value.status_code == 400
+
+    assert [path.name for path in tmp_path.iterdir()] == [filename]
+
+
+def test_identical_uploads_share_one_content_addressed_file(tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path / 'blobs.db'}")
+    models.Base.metadata.create_all(bind=engine)
+    upload_dir = tmp_path / "uploads"
+    upload_dir.mkdir()
+    photo = PNG_HEADER + b"x" * 100
+
+    with Session(engine) as db:
+        register = lambda name, size: blobs.register(db, name, size)  # noqa: E731
+        first = store_upload(io.BytesIO(photo), upload_dir, register=register)
+        second = store_upload(io.BytesIO(photo), upload_dir, register=register)
+        other = store_upload(io.BytesIO(PNG_HEADER + b"y" * 100), upload_dir, register=register)
+        assert first == second != other
+        assert len(first) == 64 + len(".png")
+        assert sorted(path.name for path in upload_dir.iterdir()) == sorted([first, other])
+        assert db.execute(select(models.Blob.name, models.Blob.size).order_by(models.Blob.name)).all() == sorted(
+            [(first, len(photo)), (other, len(photo))]
+        )
+    engine.dispose()
+
+
+def test_sweep_removes_only_old_unreferenced_uploads(tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path / 'sweep.db'}")
+    models.Base.metadata.create_all(bind=engine)
+    upload_dir = tmp_path / "uploads"
+    derivative_dir = upload_dir / "derivatives"
+    derivative_dir.mkdir(parents=True)
+    old = datetime.utcnow() - timedelta(days=2)
+    names = ["kept-item.jpg", "kept-box.jpg", "orphan.jpg", "fresh.jpg", "orphan2.png"]
+    for name in names:
+        (upload_dir / name).write_bytes(b"x" * 10)
+    (derivative_dir / "orphan-sm.webp").write_bytes(b"x")
+    (derivative_dir / "kept-item-sm.webp").write_bytes(b"x")
+    partial = upload_dir / ".upload-abc.part"
+    partial.write_bytes(b"x")
+    os.utime(partial, (old.timestamp(), old.timestamp()))
+
+    with Session(engine) as db:
+        db.execute(insert(models.User).values(id=1, username="owner", email="owner@example.com", password_hash="x"))
+        db.execute(insert(models.Box).values(id=1, name="Garage", owner_id=1, photo_url="/uploads/kept-box.jpg"))
+        db.execute(insert(models.Item).values(name="Saw", category="tools", box_id=1, photo_url="/uploads/kept-item.jpg"))
+        db.execute(insert(models.Blob), [
+            {"name": name, "size": 10, "uploaded_at": datetime.utcnow() if name == "fresh.jpg" else old} for name in names
+        ])
+        db.commit()
+
+        assert blobs.sweep(db, upload_dir, dry_run=True) == {"blobs": 2, "bytes": 20, "partials": 1, "cached": 0, "multipart": 0}
+        assert (upload_dir / "orphan.jpg").exists() and partial.exists()
+
+        assert blobs.sweep(db, upload_dir, batch_size=1) == {"blobs": 2, "bytes": 20, "partials": 1, "cached": 0, "multipart": 0}
+        assert sorted(path.name for path in upload_dir.glob("*.*")) == ["fresh.jpg", "kept-box.jpg", "kept-item.jpg"]
+        assert [path.name for path in derivative_dir.iterdir()] == ["kept-item-sm.webp"]
+        assert sorted(db.scalars(select(models.Blob.name))) == ["fresh.jpg", "kept-box.jpg", "kept-item.jpg"]
+    engine.dispose()
+
+
+def read_body(response):
+    async def collect():
+        return b"".join([chunk async for chunk in response.body_iterator])
+    return asyncio.run(collect())
+
+
+def test_media_urls_are_signed_and_served_with_ranges(tmp_path, monkeypatch):
+    monkeypatch.setattr(main, "UPLOAD_DIR", tmp_path)
+    monkeypatch.setattr(media, "ACCEL_PREFIX", "")
+    (tmp_path / "photo.png").write_bytes(PNG_HEADER + bytes(range(200)))
+
+    src = media.photo_src("/uploads/photo.png")
+    assert src.startswith("/api/media/photo.png?expires=")
+    assert media.photo_src("https://example.com/a.jpg") == "https://example.com/a.jpg"
+    assert media.photo_src("/uploads/../secret.txt") is None
+    # Однаковий URL упродовж вікна — браузер бере фото з кешу
+    assert media.sign("photo.png", now=100) == media.sign("photo.png", now=101)
+    query = dict(part.split("=") for part in src.split("?")[1].split("&"))
+    expires, sig = int(query["expires"]), query["sig"]
+    assert media.verify("photo.png", expires, sig)
+    assert not media.verify("other.png", expires, sig)
+    assert not media.verify("photo.png", expires, sig, now=expires + 1)
+
+    full = main.get_media("photo.png", expires=expires, sig=sig, token=None, db=None)
+    assert full.status_code == 200 and full.headers["Cache-Control"] == media.IMMUTABLE
+    assert full.headers["Content-Length"] == "208" and read_body(full).startswith(PNG_HEADER)
+    partial = main.get_media("photo.png", expires=expires, sig=sig, range_header="bytes=8-11", token=None, db=None)
+    assert partial.status_code == 206 and partial.headers["Content-Range"] == "bytes 8-11/208"
+    assert read_body(partial) == bytes([0, 1, 2, 3])
+    suffix = main.get_media("photo.png", expires=expires, sig=sig, range_header="bytes=-2", token=None, db=None)
+    assert read_body(suffix) == bytes([198, 199])
+    cached = main.get_media("photo.png", expires=expires, sig=sig, if_none_match=full.headers["ETag"], token=None, db=None)
+    assert cached.status_code == 304
+
+    for kwargs, status in [
+        ({"expires": expires, "sig": "forged"}, 403),
+        ({"range_header": "bytes=500-"}, 416),
+        ({"expires": None, "sig": None}, 401),
+    ]:
+        with pytest.raises(HTTPException) as rejected:
+            main.get_media("photo.png", **{"expires": expires, "sig": sig, "token": None, "db": None, **kwargs})
+        assert rejected.value.status_code == status
+
+    # За nginx бекенд віддає лише заголовок, байти йдуть через internal location
+    monkeypatch.setattr(media, "ACCEL_PREFIX", "/_uploads/")
+    accel = main.get_media("photo.png", expires=expires, sig=sig, token=None, db=None)
+    assert accel.headers["X-Accel-Redirect"] == "/_uploads/photo.png" and accel.body == b""
+
+
+def test_media_with_token_requires_a_visible_reference(tmp_path, monkeypatch):
+    monkeypatch.setattr(main, "UPLOAD_DIR", tmp_path)
+    monkeypatch.setattr(media, "ACCEL_PREFIX", "/_uploads/")
+    engine = create_engine(f"sqlite:///{tmp_path / 'media.db'}")
+    models.Base.metadata.create_all(bind=engine)
+    with Session(engine) as db:
+        db.execute(insert(models.User), [
+            {"id": user_id, "username": f"user{user_id}", "email": f"user{user_id}@example.com", "password_hash": "x"}
+            for user_id in (1, 2)
+        ])
+        db.execute(insert(models.Box).values(id=1, name="Garage", owner_id=1))
+        db.execute(insert(models.Item).values(name="Saw", category="tools", box_id=1, photo_url="/uploads/saw.jpg"))
+        db.commit()
+        owner, stranger = (auth.create_access_token({"sub": str(user_id)}) for user_id in (1, 2))
+
+        served = main.get_media("saw.jpg", token=owner, db=db)
+        assert served.headers["X-Accel-Redirect"] == "/_uploads/saw.jpg"
+        for name, token in [("saw.jpg", stranger), ("other.jpg", owner)]:
+            with pytest.raises(HTTPException) as hidden:
+                main.get_media(name, token=token, db=db)
+            assert hidden.value.status_code == 404
+    engine.dispose()
+
+
+def test_middleware_rejects_by_content_length_before_parsing():
+    app = FastAPI()
+
+    @app.post("/api/upload")
+    def upload():
+        return {"ok": True}
+
+    app.add_middleware(UploadSizeLimitMiddleware, limits={"/api/upload": 10})
+    client = TestClient(app)
+
+    assert client.post("/api/upload", content=b"x" * 10).status_code == 200
+    rejected = client.post("/api/upload", content=b"x" * (70 * 1024))
+    assert rejected.status_code == 413
+    assert rejected.json() == {"detail": "File too large"}
+
+
+def test_middleware_counts_streamed_bodies_per_route():
+    app = FastAPI()
+    stored = []
+
+    @app.post("/api/upload")
+    def upload(file: UploadFile = File(...)):
+        stored.append(file.filename)
+        return {"ok": True}
+
+    @app.post("/api/import")
+    def import_file(file: UploadFile = File(...)):
+        stored.append(file.filename)
+        return {"ok": True}
+
+    app.add_middleware(UploadSizeLimitMiddleware, limits={"/api/upload": 10, "/api/import": 1024 * 1024})
+    client = TestClient(app)
+
+    def chunked(size):
+        # Генератор — httpx шле тіло chunked, без Content-Length
+        yield b'--b\r\nContent-Disposition: form-data; name="file"; filename="a.png"\r\n\r\n'
+        for _ in range(size // 1024):
+            yield b"x" * 1024
+        yield b"\r\n--b--\r\n"
+
+    headers = {"Content-Type": "multipart/form-data; boundary=b"}
+    rejected = client.post("/api/upload", content=chunked(200 * 1024), headers=headers)
+    assert rejected.status_code == 413 and rejected.json() == {"detail": "File too large"}
+    assert rejected.headers["connection"] == "close"
+    # Маршрут так і не отримав файл
+    assert stored == []
+    assert client.post("/api/import", content=chunked(200 * 1024), headers=headers).status_code == 200
+    assert stored == ["a.png"]
+
+
+def test_derivatives_are_rendered_once_and_served_lazily(tmp_path):
+    upload_dir = tmp_path / "uploads"
+    derivative_dir = upload_dir / "derivatives"
+    derivative_dir.mkdir(parents=True)
+    Image.new("RGB", (2000, 1000), "red").save(upload_dir / "photo.jpg")
+
+    urls = thumbnails.derivative_urls("/uploads/photo.jpg")
+    assert urls["sm"].startswith("/api/images/sm/photo.jpg?expires=")
+    assert urls["lg_webp"].startswith("/api/images/lg/photo.webp?expires=")
+    assert thumbnails.derivative_urls("https://example.com/photo.jpg") is None
+
+    try:
+        path = asyncio.run(thumbnails.ensure_derivative(upload_dir, derivative_dir, "md", "photo.webp"))
+    finally:
+        thumbnails.shutdown_pool()
+    assert path == derivative_dir / "photo-md.webp"
+    with Image.open(path) as rendered:
+        assert rendered.format == "WEBP"
+        assert rendered.size == (512, 256)
+
+    assert thumbnails.render_derivatives(str(upload_dir / "photo.jpg"), str(derivative_dir)) == 0
+    assert asyncio.run(thumbnails.ensure_derivative(upload_dir, derivative_dir, "md", "../photo.jpg")) is None
+
+
+def test_derivatives_need_a_signature_or_token(tmp_path, monkeypatch):
+    derivative_dir = tmp_path / "derivatives"
+    derivative_dir.mkdir()
+    (derivative_dir / "photo-lg.webp").write_bytes(b"RIFF....WEBP")
+    monkeypatch.setattr(main, "UPLOAD_DIR", tmp_path)
+    monkeypatch.setattr(main, "DERIVATIVE_DIR", derivative_dir)
+    monkeypatch.setattr(media, "ACCEL_PREFIX", "/_uploads/")
+
+    query = thumbnails.derivative_urls("/uploads/photo.jpg")["lg_webp"].split("?")[1]
+    signed = dict(part.split("=") for part in query.split("&"))
+    expires, sig = int(signed["expires"]), signed["sig"]
+    response = asyncio.run(main.get_image_derivative("lg", "photo.webp", expires=expires, sig=sig, token=None))
+    # Приватний кеш і той самий X-Accel-Redirect, що й для оригіналів
+    assert response.headers["X-Accel-Redirect"] == "/_uploads/derivatives/photo-lg.webp"
+    assert response.headers["Cache-Control"] == media.IMMUTABLE
+
+    for kwargs, status in [
+        ({"filename": "other.webp"}, 403),
+        ({"sig": "forged"}, 403),
+        ({"expires": None, "sig": None}, 401),
+        ({"filename": "../photo.webp"}, 404),
+    ]:
+        arguments = {"size": "lg", "filename": "photo.webp", "expires": expires, "sig": sig, "token": None, **kwargs}
+        with pytest.raises(HTTPException) as rejected:
+            asyncio.run(main.get_image_derivative(**arguments))
+        assert rejected.value.status_code == status
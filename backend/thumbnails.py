@@ -0,0 +1,131 @@
+import asyncio
+import logging
+import os
+import re
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+from typing import Dict, Optional
+
+from PIL import Image, ImageOps
+
+import media
+from storage import LocalStorage, Storage
+
+logger = logging.getLogger(__name__)
+
+# Фіксований набір розмірів (довша сторона, px) для списків і перегляду
+DERIVATIVE_SIZES = {"sm": 128, "md": 512, "lg": 1280}
+DERIVATIVE_FORMATS = ("jpg", "webp")
+DERIVATIVE_PURPOSE = "images"
+THUMBNAIL_WORKERS = int(os.getenv("THUMBNAIL_WORKERS", "2"))
+
+_SAFE_STEM = re.compile(r"^[A-Za-z0-9_-]+$")
+_pool: Optional[ProcessPoolExecutor] = None
+
+
+def derivative_name(stem: str, size: str, fmt: str) -> str:
+    return f"{stem}-{size}.{fmt}"
+
+
+def derivative_urls(photo_url: Optional[str]) -> Optional[Dict[str, str]]:
+    # Похідні є лише для власних завантажень (/uploads/<stem>.<ext>)
+    if not photo_url or not photo_url.startswith("/uploads/"):
+        return None
+    stem = Path(photo_url).stem
+    if not _SAFE_STEM.match(stem):
+        return None
+    # Доступ — як до оригіналу (media.py): один підпис на stem покриває всі розміри й формати
+    query = media.signed_query(stem, DERIVATIVE_PURPOSE)
+    urls = {}
+    for size in DERIVATIVE_SIZES:
+        urls[size] = f"/api/images/{size}/{stem}.jpg?{query}"
+        urls[f"{size}_webp"] = f"/api/images/{size}/{stem}.webp?{query}"
+    return urls
+
+
+def render_derivatives(source_path: str, target_dir: str) -> int:
+    # Виконується в окремому процесі: декодування один раз, усі розміри й формати
+    source = Path(source_path)
+    target = Path(target_dir)
+    pending = [
+        (size, fmt)
+        for size in DERIVATIVE_SIZES
+        for fmt in DERIVATIVE_FORMATS
+        if not (target / derivative_name(source.stem, size, fmt)).exists()
+    ]
+    if not pending:
+        return 0
+
+    with Image.open(source) as original:
+        image = ImageOps.exif_transpose(original)
+        if image.mode not in ("RGB", "RGBA"):
+            has_alpha = image.mode in ("LA", "PA") or "transparency" in image.info
+            image = image.convert("RGBA" if has_alpha else "RGB")
+
+        for size in dict.fromkeys(size for size, _ in pending):
+            resized = image.copy()
+            resized.thumbnail((DERIVATIVE_SIZES[size], DERIVATIVE_SIZES[size]), Image.LANCZOS)
+            for fmt in DERIVATIVE_FORMATS:
+                if (size, fmt) not in pending:
+                    continue
+                output = target / derivative_name(source.stem, size, fmt)
+                temp_output = output.with_name(f".{output.name}.{os.getpid()}.part")
+                if fmt == "jpg":
+                    resized.convert("RGB").save(temp_output, "JPEG", quality=82, optimize=True, progressive=True)
+                else:
+                    resized.save(temp_output, "WEBP", quality=80, method=4)
+                os.replace(temp_output, output)
+    return len(pending)
+
+
+def get_pool() -> ProcessPoolExecutor:
+    global _pool
+    if _pool is None:
+        _pool = ProcessPoolExecutor(max_workers=THUMBNAIL_WORKERS)
+    return _pool
+
+
+def shutdown_pool():
+    global _pool
+    if _pool is not None:
+        _pool.shutdown(wait=False, cancel_futures=True)
+        _pool = None
+
+
+def _log_failure(future):
+    if not future.cancelled() and future.exception() is not None:
+        logger.warning("Derivative generation failed: %s", future.exception())
+
+
+def schedule_derivatives(source: Path, target_dir: Path):
+    future = get_pool().submit(render_derivatives, str(source), str(target_dir))
+    future.add_done_callback(_log_failure)
+
+
+def _find_source(storage: Storage, stem: str) -> Optional[Path]:
+    name = storage.find(stem)
+    return storage.local_copy(name) if name else None
+
+
+async def ensure_derivative(upload_dir: Path, target_dir: Path, size: str, filename: str,
+                            storage: Optional[Storage] = None) -> Optional[Path]:
+    stem, _, fmt = filename.rpartition(".")
+    if size not in DERIVATIVE_SIZES or fmt not in DERIVATIVE_FORMATS or not _SAFE_STEM.match(stem):
+        return None
+
+    output = target_dir / derivative_name(stem, size, fmt)
+    if output.exists():
+        return output
+
+    # З S3 оригінал спершу скачується в локальний кеш — поза event loop
+    loop = asyncio.get_running_loop()
+    source = await loop.run_in_executor(None, _find_source, storage or LocalStorage(upload_dir), stem)
+    if source is None:
+        return None
+
+    try:
+        await loop.run_in_executor(get_pool(), render_derivatives, str(source), str(target_dir))
+    except Exception as exc:
+        logger.warning("Derivative generation failed for %s: %s", source.name, exc)
+    # Формат, який Pillow не декодує (напр. HEIC), віддаємо оригіналом
+    return output if output.exists() else source
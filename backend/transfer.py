@@ -0,0 +1,255 @@
+import csv
+import io
+import json
+import os
+import uuid
+from datetime import datetime
+from typing import BinaryIO, Callable, Dict, Iterable, Iterator, List, Literal, Tuple
+
+from fastapi import HTTPException
+from pydantic import ValidationError
+from sqlalchemy import insert, select, update
+from sqlalchemy.orm import Session
+
+import database
+import events
+import models
+import schemas
+import stats
+import sync
+from principals import invalidate_on_commit
+
+# Експорт/імпорт інвентарю власника: спочатку рядки коробок (ref = id коробки),
+# далі рядки речей з box_ref на коробку з того ж файлу
+
+TransferFormat = Literal["ndjson", "csv"]
+MEDIA_TYPES = {"ndjson": "application/x-ndjson", "csv": "text/csv; charset=utf-8"}
+FIELDS = ["type", "ref", "box_ref", "name", "description", "location", "category", "photo_url", "qr_code"]
+OPTIONAL_FIELDS = ("description", "location", "photo_url", "qr_code")
+
+EXPORT_BATCH_SIZE = int(os.getenv("EXPORT_BATCH_SIZE", "2000"))
+EXPORT_CHUNK_BYTES = 64 * 1024
+IMPORT_BATCH_SIZE = int(os.getenv("IMPORT_BATCH_SIZE", "5000"))
+# Фіналізація імпорту фільтрує по id коробок: один bind-параметр на коробку, тож
+# частинами — під межами SQLite (32766) і драйверів Postgres (32767 в asyncpg)
+IMPORT_FINALIZE_CHUNK = 5000
+MAX_IMPORT_BYTES = int(os.getenv("MAX_IMPORT_BYTES", str(512 * 1024 * 1024)))
+
+ITEM_COLUMNS = ("name", "description", "category", "photo_url", "box_id", "created_at", "updated_at")
+
+
+# ============ EXPORT ============
+
+def export_rows(db: Session, owner_id: int) -> Iterator[Dict]:
+    # yield_per: серверний курсор (psycopg2) / fetchmany, у пам'яті лише одна пачка
+    boxes = db.execute(
+        select(
+            models.Box.id, models.Box.name, models.Box.description,
+            models.Box.location, models.Box.photo_url, models.Box.qr_code,
+        )
+        .where(models.Box.owner_id == owner_id)
+        .order_by(models.Box.id)
+        .execution_options(yield_per=EXPORT_BATCH_SIZE)
+    )
+    for box in boxes:
+        yield {
+            "type": "box", "ref": box.id, "name": box.name, "description": box.description,
+            "location": box.location, "photo_url": box.photo_url, "qr_code": box.qr_code,
+        }
+
+    items = db.execute(
+        select(
+            models.Item.box_id, models.Item.name, models.Item.description,
+            models.Item.category, models.Item.photo_url,
+        )
+        .join(models.Box, models.Item.box_id == models.Box.id)
+        .where(models.Box.owner_id == owner_id)
+        .order_by(models.Item.box_id, models.Item.id)
+        .execution_options(yield_per=EXPORT_BATCH_SIZE)
+    )
+    for item in items:
+        yield {
+            "type": "item", "box_ref": item.box_id, "name": item.name, "description": item.description,
+            "category": item.category, "photo_url": item.photo_url,
+        }
+
+
+def encode_rows(rows: Iterable[Dict], fmt: TransferFormat, chunk_bytes: int = EXPORT_CHUNK_BYTES) -> Iterator[bytes]:
+    # Рядки склеюються в чанки ~64 KiB, щоб не віддавати по одному рядку на write
+    buffer = io.StringIO()
+    if fmt == "csv":
+        writer = csv.DictWriter(buffer, FIELDS, extrasaction="ignore")
+        writer.writeheader()
+        write = writer.writerow
+    else:
+        def write(row):
+            buffer.write(json.dumps(row, ensure_ascii=False, separators=(",", ":")))
+            buffer.write("\n")
+
+    for row in rows:
+        write(row)
+        if buffer.tell() >= chunk_bytes:
+            yield buffer.getvalue().encode("utf-8")
+            buffer.seek(0)
+            buffer.truncate()
+    if buffer.tell():
+        yield buffer.getvalue().encode("utf-8")
+
+
+def stream_export(owner_id: int, fmt: TransferFormat, session_factory: Callable[[], Session] = None) -> Iterator[bytes]:
+    # Власна сесія: генератор живе довше за запит, StreamingResponse читає його в threadpool
+    db = (session_factory or database.SessionLocal)()
+    try:
+        yield from encode_rows(export_rows(db, owner_id), fmt)
+    finally:
+        db.close()
+
+
+# ============ IMPORT ============
+
+def read_rows(stream: BinaryIO, fmt: TransferFormat) -> Iterator[Tuple[int, Dict]]:
+    text = io.TextIOWrapper(stream, encoding="utf-8-sig", newline="")
+    try:
+        if fmt == "csv":
+            reader = csv.DictReader(text)
+            for row in reader:
+                yield reader.line_num, row
+        else:
+            for line_number, line in enumerate(text, start=1):
+                if not line.strip():
+                    continue
+                try:
+                    row = json.loads(line)
+                except ValueError:
+                    raise HTTPException(status_code=422, detail=f"Line {line_number}: invalid JSON")
+                if not isinstance(row, dict):
+                    raise HTTPException(status_code=422, detail=f"Line {line_number}: expected an object")
+                yield line_number, row
+    except UnicodeDecodeError:
+        raise HTTPException(status_code=422, detail="File must be UTF-8")
+    finally:
+        text.detach()
+
+
+def _clean(row: Dict) -> Dict:
+    # Порожній рядок у CSV і NDJSON означає NULL — однаково для COPY і INSERT
+    return {key: (None if value == "" else value) for key, value in row.items()}
+
+
+def _insert_items(db: Session, rows: List[Dict]):
+    db.execute(insert(models.Item.__table__), rows)
+
+
+def _copy_items(db: Session, rows: List[Dict]):
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    for row in rows:
+        writer.writerow([row[column] for column in ITEM_COLUMNS])
+    buffer.seek(0)
+    # Без лапок порожнє поле в COPY csv — NULL
+    cursor = db.connection().connection.cursor()
+    try:
+        cursor.copy_expert(f"COPY items ({', '.join(ITEM_COLUMNS)}) FROM STDIN WITH (FORMAT csv)", buffer)
+    finally:
+        cursor.close()
+
+
+def item_writer(db: Session) -> Callable[[Session, List[Dict]], None]:
+    dialect = db.get_bind().dialect
+    if dialect.name == "postgresql" and dialect.driver == "psycopg2":
+        return _copy_items
+    return _insert_items
+
+
+def import_inventory(db: Session, principal, stream: BinaryIO, fmt: TransferFormat) -> Dict[str, int]:
+    # Усе в одній транзакції: помилка в будь-якому рядку — нічого не імпортовано
+    write_items = item_writer(db)
+    now = datetime.utcnow()
+    box_refs = {}
+    pending_boxes = []
+    pending_items = []
+    used_qr_codes = set()
+    counts = {"boxes": 0, "items": 0}
+
+    def flush_boxes():
+        requested = [values["qr_code"] for _, values in pending_boxes if values["qr_code"]]
+        taken = used_qr_codes | set(db.scalars(select(models.Box.qr_code).where(models.Box.qr_code.in_(requested))))
+        rows = []
+        for _, values in pending_boxes:
+            # QR-коди зберігаються для перенесення надрукованих наліпок, якщо не зайняті
+            qr_code = values["qr_code"]
+            if not qr_code or qr_code in taken:
+                qr_code = str(uuid.uuid4())[:8]
+            taken.add(qr_code)
+            used_qr_codes.add(qr_code)
+            rows.append({**values, "qr_code": qr_code, "owner_id": principal.id, "created_at": now, "updated_at": now})
+        box_ids = db.scalars(insert(models.Box).returning(models.Box.id, sort_by_parameter_order=True), rows).all()
+        box_refs.update(zip((ref for ref, _ in pending_boxes), box_ids))
+        counts["boxes"] += len(rows)
+        pending_boxes.clear()
+
+    def flush_items():
+        write_items(db, pending_items)
+        counts["items"] += len(pending_items)
+        pending_items.clear()
+
+    seen_refs = set()
+    try:
+        for line_number, raw in read_rows(stream, fmt):
+            row = _clean(raw)
+            kind = row.get("type")
+            try:
+                if kind == "box":
+                    ref = str(row.get("ref"))
+                    if row.get("ref") is None or ref in seen_refs:
+                        raise HTTPException(status_code=422, detail=f"Line {line_number}: missing or duplicate ref")
+                    seen_refs.add(ref)
+                    box = schemas.BoxCreate.model_validate(row)
+                    qr_code = row.get("qr_code")
+                    pending_boxes.append((ref, {**box.model_dump(), "qr_code": str(qr_code) if qr_code else None}))
+                    if len(pending_boxes) >= IMPORT_BATCH_SIZE:
+                        flush_boxes()
+                elif kind == "item":
+                    ref = str(row.get("box_ref"))
+                    if ref not in box_refs and pending_boxes:
+                        flush_boxes()
+                    if ref not in box_refs:
+                        raise HTTPException(status_code=422, detail=f"Line {line_number}: unknown box_ref")
+                    item = schemas.ItemCreate.model_validate({**row, "box_id": box_refs[ref]})
+                    pending_items.append({**item.model_dump(), "created_at": now, "updated_at": now})
+                    if len(pending_items) >= IMPORT_BATCH_SIZE:
+                        flush_items()
+                else:
+                    raise HTTPException(status_code=422, detail=f"Line {line_number}: unknown row type")
+            except ValidationError as exc:
+                error = exc.errors()[0]
+                field = ".".join(str(part) for part in error["loc"])
+                raise HTTPException(status_code=422, detail=f"Line {line_number}: {field}: {error['msg']}")
+
+        if pending_boxes:
+            flush_boxes()
+        if pending_items:
+            flush_items()
+        if counts["boxes"]:
+            # Версія береться наприкінці, щоб не тримати лічильник увесь імпорт: до того
+            # транзакція лише вставляє нові рядки, на які ніхто не чекає. Усі речі — в нових коробках
+            version = sync.next_version(db)
+            box_ids = list(box_refs.values())
+            for start in range(0, len(box_ids), IMPORT_FINALIZE_CHUNK):
+                chunk = box_ids[start:start + IMPORT_FINALIZE_CHUNK]
+                db.execute(
+                    update(models.Box)
+                    .where(models.Box.id.in_(chunk))
+                    .values(sync_version=version, updated_at=models.Box.updated_at)
+                    .execution_options(synchronize_session=False)
+                )
+                sync.stamp_box_items(db, version, chunk)
+                stats.rebuild(db, chunk)
+            invalidate_on_commit(db, principal.id)
+            for box_id in box_refs.values():
+                events.publish_on_commit(db, "box", "created", box_id, [box_id], version, users=[principal.id])
+        db.commit()
+    except BaseException:
+        db.rollback()
+        raise
+    return counts
@@ -0,0 +1,215 @@
+import base64
+import contextlib
+import hashlib
+import hmac
+import json
+import os
+import tempfile
+import time
+import uuid
+from pathlib import Path
+from typing import BinaryIO, Callable, Dict, List, Optional
+
+import orjson
+from fastapi import HTTPException
+
+import auth
+from storage import PRESIGN_EXPIRES_SECONDS, S3_MULTIPART_THRESHOLD, LocalStorage, Storage, part_plan
+
+UPLOAD_CHUNK_SIZE = 1024 * 1024
+MAX_UPLOAD_BYTES = int(os.getenv("MAX_UPLOAD_BYTES", str(10 * 1024 * 1024)))
+# Запас на multipart-заголовки й boundary поверх самого файлу
+MULTIPART_OVERHEAD_BYTES = 64 * 1024
+# Прямі завантаження в сховище не проходять через воркери — межа може бути більшою
+MAX_DIRECT_UPLOAD_BYTES = int(os.getenv("MAX_DIRECT_UPLOAD_BYTES", str(200 * 1024 * 1024)))
+IMAGE_TYPES = {"jpg": "image/jpeg", "png": "image/png", "gif": "image/gif", "webp": "image/webp", "heic": "image/heic"}
+
+
+def sniff_image_type(header: bytes) -> Optional[str]:
+    if header.startswith(b"\xff\xd8\xff"):
+        return "jpg"
+    if header.startswith(b"\x89PNG\r\n\x1a\n"):
+        return "png"
+    if header[:6] in (b"GIF87a", b"GIF89a"):
+        return "gif"
+    if header[:4] == b"RIFF" and header[8:12] == b"WEBP":
+        return "webp"
+    if header[4:8] == b"ftyp" and header[8:12] in (b"heic", b"heix", b"mif1", b"msf1"):
+        return "heic"
+    return None
+
+
+def store_upload(
+    source: BinaryIO,
+    upload_dir: Path,
+    max_bytes: int = MAX_UPLOAD_BYTES,
+    register: Optional[Callable[[str, int], None]] = None,
+    storage: Optional[Storage] = None,
+) -> str:
+    # Блокуючий код: викликати через run_in_threadpool, не з event loop.
+    # Ім'я — sha256 вмісту, рахується під час запису: повторне фото не займає місця
+    chunk = source.read(UPLOAD_CHUNK_SIZE)
+    extension = sniff_image_type(chunk[:16])
+    if extension is None:
+        raise HTTPException(status_code=400, detail="Only images allowed")
+
+    fd, temp_name = tempfile.mkstemp(dir=upload_dir, prefix=".upload-", suffix=".part")
+    try:
+        digest = hashlib.sha256()
+        with os.fdopen(fd, "wb") as temp_file:
+            size = 0
+            while chunk:
+                size += len(chunk)
+                if size > max_bytes:
+                    raise HTTPException(status_code=413, detail="File too large")
+                digest.update(chunk)
+                temp_file.write(chunk)
+                chunk = source.read(UPLOAD_CHUNK_SIZE)
+        filename = f"{digest.hexdigest()}.{extension}"
+        # Спершу запис у blobs, потім файл — див. blobs.register
+        if register is not None:
+            register(filename, size)
+        (storage or LocalStorage(upload_dir)).put_file(Path(temp_name), filename, IMAGE_TYPES[extension])
+    except BaseException:
+        with contextlib.suppress(FileNotFoundError):
+            os.unlink(temp_name)
+        raise
+    return filename
+
+
+# ============ DIRECT UPLOADS ============
+# Клієнт отримує presigned PUT (або по URL на кожну частину multipart) і вантажить
+# файл прямо в сховище, потім підтверджує завантаження. Стан між двома запитами —
+# у підписаному токені, без таблиці. Вміст бекенд не бачить, тож ім'я — uuid, а не
+# хеш (без дедуплікації); тип перевіряється за першими байтами вже в сховищі.
+
+def _sign_token(payload: dict) -> str:
+    body = base64.urlsafe_b64encode(orjson.dumps(payload)).rstrip(b"=")
+    mac = hmac.new(auth.SECRET_KEY.encode("utf-8"), b"upload:" + body, hashlib.sha256).digest()[:16]
+    return (body + b"." + base64.urlsafe_b64encode(mac).rstrip(b"=")).decode("ascii")
+
+
+def _read_token(token: str, user_id: int) -> dict:
+    body, _, mac = token.encode("ascii", "replace").partition(b".")
+    expected = hmac.new(auth.SECRET_KEY.encode("utf-8"), b"upload:" + body, hashlib.sha256).digest()[:16]
+    try:
+        valid = hmac.compare_digest(base64.urlsafe_b64decode(mac + b"=" * (-len(mac) % 4)), expected)
+        payload = orjson.loads(base64.urlsafe_b64decode(body + b"=" * (-len(body) % 4))) if valid else None
+    except (ValueError, orjson.JSONDecodeError):
+        payload = None
+    if payload is None or payload["user"] != user_id or payload["exp"] < time.time():
+        raise HTTPException(status_code=400, detail="Invalid or expired upload token")
+    return payload
+
+
+def begin_direct_upload(storage: Storage, user_id: int, content_type: str, size: int,
+                        register: Optional[Callable[[str, int], None]] = None) -> dict:
+    if not storage.supports_direct_upload:
+        raise HTTPException(status_code=400, detail="Direct uploads need object storage (STORAGE_BACKEND=s3)")
+    extension = next((key for key, value in IMAGE_TYPES.items() if value == content_type), None)
+    if extension is None:
+        raise HTTPException(status_code=400, detail="Only images allowed")
+    if size > MAX_DIRECT_UPLOAD_BYTES:
+        raise HTTPException(status_code=413, detail="File too large")
+
+    name = f"{uuid.uuid4()}.{extension}"
+    # Як і store_upload: blob реєструється до появи файлу, недовантажене прибере sweep
+    if register is not None:
+        register(name, size)
+    expires = int(time.time()) + PRESIGN_EXPIRES_SECONDS
+    payload = {"name": name, "size": size, "user": user_id, "exp": expires, "upload_id": None}
+    result = {"photo_url": f"/uploads/{name}", "headers": storage.upload_headers(content_type), "expires_at": expires}
+    if size < S3_MULTIPART_THRESHOLD:
+        result["url"] = storage.presign_put(name, content_type)
+    else:
+        part_size, parts = part_plan(size)
+        payload["upload_id"] = storage.create_multipart(name, content_type)
+        result.update(part_size=part_size, parts=storage.presign_parts(name, payload["upload_id"], parts))
+    result["token"] = _sign_token(payload)
+    return result
+
+
+def finish_direct_upload(storage: Storage, user_id: int, token: str, parts: Optional[List[Dict]] = None,
+                         register: Optional[Callable[[str, int], None]] = None) -> str:
+    payload = _read_token(token, user_id)
+    name = payload["name"]
+    if payload["upload_id"]:
+        if not parts:
+            raise HTTPException(status_code=400, detail="Multipart upload needs its parts")
+        storage.complete_multipart(name, payload["upload_id"], parts)
+    size = storage.size(name)
+    if size is None:
+        raise HTTPException(status_code=400, detail="File was not uploaded")
+    # Presigned PUT не обмежує розмір і вміст: перевіряємо вже завантажене
+    if size > min(payload["size"], MAX_DIRECT_UPLOAD_BYTES) or sniff_image_type(storage.read_head(name, 16)) != name.rsplit(".", 1)[1]:
+        storage.delete_many([name])
+        raise HTTPException(status_code=400, detail="Uploaded file does not match the request")
+    if register is not None:
+        register(name, size)
+    return name
+
+
+def _too_large() -> HTTPException:
+    return HTTPException(status_code=413, detail="File too large", headers={"Connection": "close"})
+
+
+class UploadSizeLimitMiddleware:
+    """Rejects oversized request bodies on upload routes before they are spooled."""
+
+    def __init__(self, app, limits: Optional[Dict[str, int]] = None):
+        self.app = app
+        # Шлях -> межа тіла; один екземпляр на всі маршрути з великими тілами
+        limits = limits if limits is not None else {"/api/upload": MAX_UPLOAD_BYTES}
+        self.limits = {path: max_bytes + MULTIPART_OVERHEAD_BYTES for path, max_bytes in limits.items()}
+
+    async def __call__(self, scope, receive, send):
+        max_body_bytes = self.limits.get(scope["path"]) if scope["type"] == "http" else None
+        if max_body_bytes is None:
+            await self.app(scope, receive, send)
+            return
+        content_length = dict(scope["headers"]).get(b"content-length")
+        if content_length and content_length.isdigit() and int(content_length) > max_body_bytes:
+            await self._reject(send)
+            return
+
+        # Без Content-Length (chunked) або з заниженим — рахуємо байти тіла, поки парсер
+        # форми їх читає, і зупиняємо його на межі, а не після запису всього файлу на диск
+        received = 0
+        started = False
+
+        async def counting_receive():
+            nonlocal received
+            message = await receive()
+            if message["type"] == "http.request":
+                received += len(message.get("body", b""))
+                if received > max_body_bytes:
+                    raise _too_large()
+            return message
+
+        async def tracking_send(message):
+            nonlocal started
+            if message["type"] == "http.response.start":
+                started = True
+            await send(message)
+
+        try:
+            await self.app(scope, counting_receive, tracking_send)
+        except HTTPException as error:
+            # Зазвичай 413 з counting_receive відповідає вже FastAPI; тут — якщо тіло читали поза маршрутом
+            if error.status_code != 413 or started:
+                raise
+            await self._reject(send)
+
+    @staticmethod
+    async def _reject(send):
+        body = json.dumps({"detail": "File too large"}).encode("utf-8")
+        await send({
+            "type": "http.response.start",
+            "status": 413,
+            "headers": [
+                (b"content-type", b"application/json"),
+                (b"content-length", str(len(body)).encode("ascii")),
+                (b"connection", b"close"),
+            ],
+        })
+        await send({"type": "http.response.body", "body": body})
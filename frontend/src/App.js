@@ -150,6 +150,42 @@ const App = () => {
     return () => clearInterval(interval);
   }, [token, fetchBoxes, fetchItems]); // ← selectedBox тут більше немає!
 
+  // Зміни інших користувачів приходять через /api/events; опитування вище лишається запасним
+  useEffect(() => {
+    if (!token || typeof EventSource === 'undefined') return;
+    let source = null;
+    let timer = null;
+    let retry = null;
+    let closed = false;
+    const refresh = () => {
+      // Кілька подій поспіль — одне оновлення; ETag робить повторні запити дешевими
+      clearTimeout(timer);
+      timer = setTimeout(() => {
+        fetchBoxes();
+        if (selectedBoxRef.current) fetchItems(selectedBoxRef.current.id);
+      }, 300);
+    };
+    const connect = async () => {
+      try {
+        source = await api.openEvents();
+      } catch (error) {
+        if (!closed) retry = setTimeout(connect, 30000);
+        return;
+      }
+      if (closed) { source.close(); return; }
+      source.addEventListener('change', refresh);
+      source.addEventListener('resync', refresh);
+      // Квиток живе хвилину: власне перепідключення EventSource з тим самим URL
+      // отримало б 401, тож після обриву відкриваємо потік із новим квитком
+      source.onerror = () => {
+        source.close();
+        if (!closed) retry = setTimeout(connect, 3000);
+      };
+    };
+    connect();
+    return () => { closed = true; clearTimeout(timer); clearTimeout(retry); if (source) source.close(); };
+  }, [token, fetchBoxes, fetchItems]);
+
   useEffect(() => { if (token) { fetchCurrentUser(); fetchBoxes(); } }, [token, fetchCurrentUser, fetchBoxes]);
   useEffect(() => { if (selectedBox) fetchItems(selectedBox.id); }, [selectedBox, fetchItems]);
 
@@ -257,7 +293,7 @@ const App = () => {
                   </div>
                   <p className="text-gray-600 text-sm mb-2">{box.description}</p>
                   <p className="text-sm text-gray-500">📍 {box.location}</p>
-                  <p className="text-sm text-indigo-600 font-medium mt-2">{box.items ? box.items.length : 0} речей</p>
+                  <p className="text-sm text-indigo-600 font-medium mt-2">{box.item_count ?? (box.items ? box.items.length : 0)} речей</p>
                 </div>
               ))}
             </div>
@@ -310,7 +346,7 @@ const App = () => {
                 {filteredItems.map(item => (
                   <div key={item.id} className="bg-white rounded-xl shadow-md overflow-hidden">
                     {item.photo_url ? (
-                      <img src={item.photo_url} alt={item.name} className="w-full h-48 object-cover" />
+                      <img src={item.photo_thumbnails?.md_webp || item.photo_src} alt={item.name} loading="lazy" className="w-full h-48 object-cover" />
                     ) : (
                       <div className="w-full h-48 bg-gradient-to-br from-indigo-100 to-purple-100 flex items-center justify-center">
                         <Camera className="w-12 h-12 text-indigo-300" />
@@ -33,7 +33,7 @@ function BoxItem({ box, onDeleted }) {
   return (
     <div style={styles.card}>
       {box.photo_url && (
-        <img src={box.photo_url} alt={box.name} style={styles.image} />
+        <img src={box.photo_thumbnails?.md_webp || box.photo_src} alt={box.name} loading="lazy" style={styles.image} />
       )}
       
       <div style={styles.content}>
@@ -44,7 +44,7 @@ function BoxItem({ box, onDeleted }) {
         {box.is_shared && <span style={styles.badge}>Shared with you</span>}
         
         <div style={styles.stats}>
-          <span>{box.items?.length || 0} items</span>
+          <span>{box.item_count ?? box.items?.length ?? 0} items</span>
         </div>
         
         <div style={styles.actions}>
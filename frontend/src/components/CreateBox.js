@@ -9,6 +9,8 @@ function CreateBox({ onClose, onCreated }) {
     location: '',
     photo_url: '',
   });
+  // Завантажене фото видно лише за підписаною адресою (/api/media)
+  const [previewSrc, setPreviewSrc] = useState(null);
   const [loading, setLoading] = useState(false);
 
   const handleSubmit = async (e) => {
@@ -32,11 +34,12 @@ function CreateBox({ onClose, onCreated }) {
     });
   };
 
-  const handleImageUploaded = (url) => {
+  const handleImageUploaded = (url, src) => {
     setFormData({
       ...formData,
       photo_url: url,
     });
+    setPreviewSrc(src);
   };
 
   return (
@@ -75,7 +78,7 @@ function CreateBox({ onClose, onCreated }) {
           <ImageUpload onUploaded={handleImageUploaded} />
           
           {formData.photo_url && (
-            <img src={formData.photo_url} alt="Preview" style={styles.preview} />
+            <img src={previewSrc || formData.photo_url} alt="Preview" style={styles.preview} />
           )}
           
           <div style={styles.actions}>
@@ -22,7 +22,7 @@ function ImageUpload({ onUploaded }) {
     setUploading(true);
     try {
       const result = await api.uploadImage(file);
-      onUploaded(result.url);
+      onUploaded(result.url, result.src);
     } catch (error) {
       alert('Failed to upload image');
     } finally {
@@ -1,4 +1,5 @@
 const API_URL = process.env.REACT_APP_API_URL || '/api';
+const DIRECT_UPLOAD_MIN_BYTES = 5 * 1024 * 1024;
 
 class API {
   constructor() {
@@ -28,8 +29,9 @@ class API {
       headers['Authorization'] = `Bearer ${this.token}`;
     }
 
+    const { withHeaders, ...fetchOptions } = options;
     const config = {
-      ...options,
+      ...fetchOptions,
       headers,
     };
 
@@ -51,7 +53,8 @@ class API {
         throw new Error(error.detail || 'Request failed');
       }
 
-      return await response.json();
+      const data = await response.json();
+      return options.withHeaders ? { data, headers: response.headers } : data;
     } catch (error) {
       console.error('API Error:', error);
       throw error;
@@ -82,8 +85,21 @@ class API {
   }
 
   // Boxes
+  async getStats(filters = {}) {
+    const params = new URLSearchParams(Object.entries(filters).filter(([, value]) => value != null));
+    const query = params.toString();
+    return this.request(`/stats${query ? `?${query}` : ''}`);
+  }
+
+  // Push змін (SSE). EventSource не передає заголовки, а URL потрапляє в логи,
+  // тому в query — не токен, а короткий квиток лише для /api/events
+  async openEvents() {
+    const { ticket } = await this.request('/events/ticket', { method: 'POST' });
+    return new EventSource(`${API_URL}/events?ticket=${encodeURIComponent(ticket)}`);
+  }
+
   async getBoxes() {
-    return this.request('/boxes');
+    return this.request('/boxes?view=summary');
   }
 
   async getBox(boxId) {
@@ -125,8 +141,18 @@ class API {
 
   // Items
   async getItems(boxId = null) {
-    const query = boxId ? `?box_id=${boxId}` : '';
-    return this.request(`/items${query}`);
+    // Сервер віддає сторінки; наступна сторінка в заголовку X-Next-Cursor
+    const items = [];
+    let cursor = null;
+    do {
+      const params = new URLSearchParams({ limit: '500' });
+      if (boxId) params.set('box_id', boxId);
+      if (cursor) params.set('cursor', cursor);
+      const { data, headers } = await this.request(`/items?${params}`, { withHeaders: true });
+      items.push(...data);
+      cursor = headers.get('X-Next-Cursor');
+    } while (cursor);
+    return items;
   }
 
   async createItem(itemData) {
@@ -149,8 +175,50 @@ class API {
     });
   }
 
+  // Search
+  async search(query, cursor = null) {
+    const params = new URLSearchParams({ q: query });
+    if (cursor) params.set('cursor', cursor);
+    const { data, headers } = await this.request(`/search?${params}`, { withHeaders: true });
+    return { results: data, nextCursor: headers.get('X-Next-Cursor') };
+  }
+
   // Upload
+  // Великі фото — напряму в сховище (presigned PUT або multipart), повз воркери API.
+  // Бекенд без S3 відповідає 400 — тоді звичайне завантаження через /upload
+  async uploadImageDirect(file) {
+    const plan = await this.request('/uploads/direct', {
+      method: 'POST',
+      body: JSON.stringify({ content_type: file.type, size: file.size }),
+    });
+    let parts = null;
+    if (plan.url) {
+      const response = await fetch(plan.url, { method: 'PUT', headers: plan.headers, body: file });
+      if (!response.ok) throw new Error('Upload failed');
+    } else {
+      parts = [];
+      for (const part of plan.parts) {
+        const start = (part.part_number - 1) * plan.part_size;
+        const response = await fetch(part.url, { method: 'PUT', body: file.slice(start, start + plan.part_size) });
+        if (!response.ok) throw new Error('Upload failed');
+        parts.push({ part_number: part.part_number, etag: response.headers.get('ETag') });
+      }
+    }
+    return this.request('/uploads/direct/complete', {
+      method: 'POST',
+      body: JSON.stringify({ token: plan.token, parts }),
+    });
+  }
+
   async uploadImage(file) {
+    if (file.size > DIRECT_UPLOAD_MIN_BYTES) {
+      try {
+        return await this.uploadImageDirect(file);
+      } catch (error) {
+        console.log('Direct upload unavailable, falling back:', error.message);
+      }
+    }
+
     const formData = new FormData();
     formData.append('file', file);
 